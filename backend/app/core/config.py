@@ -14,4 +14,69 @@ DATABASE_NAME = os.getenv("DATABASE_NAME")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-LOGGER_PATH = os.getenv("LOGGER_PATH")
\ No newline at end of file
+LOGGER_PATH = os.getenv("LOGGER_PATH")
+
+# Tuning knobs for the recommendation engine, these have sensible defaults and only need to be set when the defaults do not fit the deployment
+
+# How often (in seconds) the in-memory article vector index checks the database for vectors written by other processes
+ARTICLE_INDEX_REFRESH_SECONDS = float(os.getenv("ARTICLE_INDEX_REFRESH_SECONDS", "30"))
+
+# Number of best scoring articles that are kept in a user's ranked recommendation list
+RECOMMENDATION_TOP_N = int(os.getenv("RECOMMENDATION_TOP_N", "1000"))
+
+# Size and lifetime of the in-process cache of ranked recommendation lists
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "10000"))
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "900"))
+
+# Approximate nearest neighbour candidate stage of the recommendations. Corpora smaller than RECOMMENDATION_ANN_MIN_CORPUS are scored exhaustively, larger ones only score the RECOMMENDATION_ANN_CANDIDATES articles found through the postings of the RECOMMENDATION_ANN_PROBE_TERMS heaviest terms of the user vector. Raising either knob trades latency for recall
+RECOMMENDATION_ANN_MIN_CORPUS = int(os.getenv("RECOMMENDATION_ANN_MIN_CORPUS", "20000"))
+RECOMMENDATION_ANN_PROBE_TERMS = int(os.getenv("RECOMMENDATION_ANN_PROBE_TERMS", "32"))
+RECOMMENDATION_ANN_CANDIDATES = int(os.getenv("RECOMMENDATION_ANN_CANDIDATES", "3000"))
+
+# "sparse" scores recommendations on the TF-IDF vectors, "dense" on the SVD embeddings fit by app.jobs.fit_embedding_model (falls back to sparse while no projection has been fit)
+RECOMMENDATION_EMBEDDING_MODE = os.getenv("RECOMMENDATION_EMBEDDING_MODE", "sparse").lower()
+
+# Delay in seconds between writing an article and re-vectorizing it, edits made to the same article within the delay are vectorized once
+ARTICLE_VECTOR_DEBOUNCE_SECONDS = float(os.getenv("ARTICLE_VECTOR_DEBOUNCE_SECONDS", "2"))
+
+# Vector job queue (app.jobs.vector_worker): attempts before a job is marked failed, the retry delay that doubles with every failed attempt and its cap, and after how long a job claimed by a worker that died is handed out again
+VECTOR_JOB_MAX_ATTEMPTS = int(os.getenv("VECTOR_JOB_MAX_ATTEMPTS", "5"))
+VECTOR_JOB_RETRY_BASE_SECONDS = float(os.getenv("VECTOR_JOB_RETRY_BASE_SECONDS", "10"))
+VECTOR_JOB_RETRY_MAX_SECONDS = float(os.getenv("VECTOR_JOB_RETRY_MAX_SECONDS", "3600"))
+VECTOR_JOB_LOCK_TIMEOUT_SECONDS = float(os.getenv("VECTOR_JOB_LOCK_TIMEOUT_SECONDS", "600"))
+
+# How often (in seconds) a process checks model_store/manifest.json for a newly activated or staged model version
+MODEL_STORE_REFRESH_SECONDS = float(os.getenv("MODEL_STORE_REFRESH_SECONDS", "10"))
+
+# Number of related articles precomputed per article for /articles/{id}/related
+RELATED_ARTICLES_TOP_K = int(os.getenv("RELATED_ARTICLES_TOP_K", "20"))
+
+# How often (seconds) a process checks whether articles were written by another process and its in-memory search index has to be rebuilt
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "30"))
+
+# Interval in seconds after which the like/save counts kept in the search index are reloaded, likes and saves made by this process are applied immediately
+SEARCH_INDEX_STATS_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_STATS_REFRESH_SECONDS", "300"))
+
+# "memory" serves search from the in-process inverted index, "database" pushes the text matching into the database (PostgreSQL full-text search, FTS5 on SQLite)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()
+
+# Size and lifetime of the in-process search result cache. Results are also dropped every SEARCH_CACHE_STATS_INTERVAL_SECONDS so likes/saves and articles written by other processes show up within that interval
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+SEARCH_CACHE_STATS_INTERVAL_SECONDS = float(os.getenv("SEARCH_CACHE_STATS_INTERVAL_SECONDS", "60"))
+
+# Lifetime of results cut short by the search time budget, only long enough for their cursors to fetch the next pages. A new search never reuses them
+SEARCH_CACHE_PARTIAL_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_PARTIAL_TTL_SECONDS", "10"))
+
+# Semantic search (mode=semantic|hybrid): the number of most similar articles taken from the TF-IDF text vectors, and the share of the semantic score in the hybrid score
+SEARCH_SEMANTIC_CANDIDATES = int(os.getenv("SEARCH_SEMANTIC_CANDIDATES", "200"))
+SEARCH_HYBRID_SEMANTIC_WEIGHT = float(os.getenv("SEARCH_HYBRID_SEMANTIC_WEIGHT", "0.4"))
+
+# Number of articles a search query is ranked to, the pages of its results (see the cursor of /search) are sliced out of that ranked list
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+
+# Time budget of ranking a search query in milliseconds, when it runs out the best results found so far are returned flagged as partial. 0 disables it
+SEARCH_TIME_BUDGET_MS = float(os.getenv("SEARCH_TIME_BUDGET_MS", "300"))
+
+# Interval in seconds after which the autocomplete index is rebuilt to pick up like/save counts and writes made by other processes
+SEARCH_SUGGEST_REFRESH_SECONDS = float(os.getenv("SEARCH_SUGGEST_REFRESH_SECONDS", "300"))
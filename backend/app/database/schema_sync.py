@@ -0,0 +1,61 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from app.database.db import Base
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+# Tables of models that have been replaced, dropped from existing databases so no stale copy is left behind. user_recommendation_cache held one row per recommended article before the rankings became one user_recommendation_lists row per session
+DROPPED_TABLES = ("user_recommendation_cache",)
+
+
+# create_all only creates the tables that are missing, it never alters a table that already exists. This brings existing tables in line with the models by dropping the tables of replaced models, adding the nullable columns that were introduced after the table was created and, on PostgreSQL, dropping NOT NULL from columns that the models have since relaxed
+def sync_schema(engine: Engine):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table_name in DROPPED_TABLES:
+            if table_name in existing_tables:
+                conn.execute(text(f"DROP TABLE {table_name}"))
+                logger.info(f"schema_sync_table_dropped table={table_name}")
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {
+                column["name"]: column
+                for column in inspector.get_columns(table.name)
+            }
+
+            for column in table.columns:
+                current = existing_columns.get(column.name)
+
+                if current is None:
+                    if not column.nullable and column.server_default is None:
+                        logger.warning(
+                            f"schema_sync_skipped_column table={table.name} "
+                            f"column={column.name} reason=not_nullable"
+                        )
+                        continue
+
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    ))
+                    logger.info(
+                        f"schema_sync_column_added table={table.name} column={column.name}"
+                    )
+
+                elif (
+                    column.nullable
+                    and not current["nullable"]
+                    and not column.primary_key
+                    and engine.dialect.name == "postgresql"
+                ):
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"
+                    ))
+                    logger.info(
+                        f"schema_sync_not_null_dropped table={table.name} column={column.name}"
+                    )
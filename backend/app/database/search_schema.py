@@ -0,0 +1,98 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Database objects of the SEARCH_BACKEND=database search that the models cannot express.
+
+PostgreSQL: a generated tsvector column over the title (weight A) and the content (weight B) of every article plus a GIN index on it, the database keeps the column up to date on every insert and update.
+
+SQLite: an external content FTS5 table over articles.title/content kept in sync by triggers. When the triggers are missing (new database, or the articles table was recreated) they are created and the FTS table is rebuilt from the articles table.
+
+The user name search uses a pg_trgm GIN index on PostgreSQL whatever the SEARCH_BACKEND, other databases use the in-memory trigram index of app.services.user_search_service.
+"""
+
+POSTGRES_STATEMENTS = (
+    """
+    ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_articles_search_vector ON articles USING GIN (search_vector)",
+)
+
+POSTGRES_USER_STATEMENTS = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_user_name_trgm ON users USING GIN (lower(user_name) gin_trgm_ops)",
+)
+
+SQLITE_STATEMENTS = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS article_search USING fts5(
+        title, content, content='articles', content_rowid='article_id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS article_search_ai AFTER INSERT ON articles BEGIN
+        INSERT INTO article_search(rowid, title, content) VALUES (new.article_id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS article_search_ad AFTER DELETE ON articles BEGIN
+        INSERT INTO article_search(article_search, rowid, title, content) VALUES ('delete', old.article_id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS article_search_au AFTER UPDATE ON articles BEGIN
+        INSERT INTO article_search(article_search, rowid, title, content) VALUES ('delete', old.article_id, old.title, old.content);
+        INSERT INTO article_search(rowid, title, content) VALUES (new.article_id, new.title, new.content);
+    END
+    """,
+)
+
+
+def ensure_search_schema(engine: Engine):
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for statement in POSTGRES_STATEMENTS:
+                conn.execute(text(statement))
+
+        elif engine.dialect.name == "sqlite":
+            has_triggers = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'article_search_ai'"
+            )).first() is not None
+
+            if has_triggers:
+                return
+
+            for statement in SQLITE_STATEMENTS:
+                conn.execute(text(statement))
+
+            conn.execute(text("INSERT INTO article_search(article_search) VALUES ('rebuild')"))
+
+        else:
+            logger.warning(f"search_schema_unsupported dialect={engine.dialect.name}")
+            return
+
+    logger.info(f"search_schema_ready dialect={engine.dialect.name}")
+
+
+def ensure_user_search_schema(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        return
+
+    try:
+        with engine.begin() as conn:
+            for statement in POSTGRES_USER_STATEMENTS:
+                conn.execute(text(statement))
+
+    except SQLAlchemyError:
+        # Creating an extension needs privileges the application user may not have, user search then stays on the in-memory index
+        logger.exception("user_search_schema_failed")
+        return
+
+    logger.info("user_search_schema_ready dialect=postgresql")
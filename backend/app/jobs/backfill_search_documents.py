@@ -0,0 +1,96 @@
+import argparse
+import time
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal, engine
+from app.database.schema_sync import sync_schema
+from app.models.article_model import Article, ArticleSearchDocument
+from app.models.user_model import User
+from app.services.search_document_service import build_search_document
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Fills in the pre-tokenized search data (ArticleSearchDocument) of the articles that were written before it existed, or of every article with --rebuild, e.g. after the tokenizer changed. Articles are processed in primary key order in batches, each batch is committed on its own so the command can be stopped and started again at any time. The API keeps the rows of new and edited articles up to date by itself.
+
+    python -m app.jobs.backfill_search_documents --batch-size 500
+"""
+
+
+# Writes the search data of every article that has none (or of every article when rebuild is set), returns the number of rows written
+def backfill_search_documents(db: Session, batch_size: int = 500, rebuild: bool = False) -> int:
+    written = 0
+    last_id = 0
+    started = time.perf_counter()
+
+    while True:
+        query = (
+            db.query(Article.article_id, Article.title, Article.content, User.user_name)
+            .join(User, Article.author_id == User.user_id)
+            .filter(Article.article_id > last_id)
+            .order_by(Article.article_id)
+        )
+
+        if not rebuild:
+            query = (
+                query.outerjoin(ArticleSearchDocument, ArticleSearchDocument.article_id == Article.article_id)
+                .filter(ArticleSearchDocument.article_id.is_(None))
+            )
+
+        rows = query.limit(batch_size).all()
+
+        if not rows:
+            break
+
+        mappings = [
+            build_search_document(article_id, title, content, user_name)
+            for article_id, title, content, user_name in rows
+        ]
+
+        if rebuild:
+            db.query(ArticleSearchDocument).filter(
+                ArticleSearchDocument.article_id.in_([m["article_id"] for m in mappings])
+            ).delete(synchronize_session=False)
+
+        db.bulk_insert_mappings(ArticleSearchDocument, mappings)
+        db.commit()
+
+        written += len(rows)
+        last_id = rows[-1].article_id
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"search_documents_batch_written rows={written} "
+            f"rate={round(written / elapsed, 1) if elapsed else written}/s"
+        )
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-tokenize the search data of the articles")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rebuild", action="store_true", help="rewrite the search data of every article")
+    args = parser.parse_args()
+
+    configure_logging()
+    ArticleSearchDocument.__table__.create(bind=engine, checkfirst=True)
+    sync_schema(engine)
+
+    db = SessionLocal()
+
+    try:
+        written = backfill_search_documents(db, batch_size=args.batch_size, rebuild=args.rebuild)
+        logger.info(f"search_documents_backfill_complete rows={written}")
+
+    except Exception:
+        db.rollback()
+        logger.exception("search_documents_backfill_failed")
+        raise
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
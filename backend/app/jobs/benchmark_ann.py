@@ -0,0 +1,105 @@
+import argparse
+import time
+import numpy as np
+from app.database.db import SessionLocal
+from app.models.vector_model import UserVector
+from app.services.article_index_service import get_article_index
+from app.utils.vector_utils import read_sparse_dict
+from app.core.config import RECOMMENDATION_TOP_N
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Measures the recall and latency of the approximate candidate stage against the exhaustive ranking on the real corpus and a sample of real user vectors, used to pick RECOMMENDATION_ANN_PROBE_TERMS and RECOMMENDATION_ANN_CANDIDATES before raising or lowering them in production.
+
+    python -m app.jobs.benchmark_ann --users 200 --probe-terms 16 32 64 --candidates 1000 3000 10000
+"""
+
+
+# Loads up to limit non empty user vectors
+def load_user_vectors(db, limit: int) -> list:
+    users = []
+
+    rows = (
+        db.query(UserVector)
+        .filter(UserVector.last_updated.isnot(None))
+        .order_by(UserVector.user_id)
+        .yield_per(500)
+    )
+
+    for row in rows:
+        text_vec = read_sparse_dict(row.text_vector_packed, row.text_vector)
+        tag_vec = read_sparse_dict(row.tag_vector_packed, row.tag_vector)
+
+        if text_vec or tag_vec:
+            users.append((text_vec, tag_vec))
+
+        if len(users) >= limit:
+            break
+
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the approximate recommendation candidate stage")
+    parser.add_argument("--users", type=int, default=200, help="user vectors sampled")
+    parser.add_argument("--top-n", type=int, default=RECOMMENDATION_TOP_N)
+    parser.add_argument("--recall-at", type=int, default=50, help="recall is measured on the first k articles of the ranking")
+    parser.add_argument("--probe-terms", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 3000, 10000])
+    args = parser.parse_args()
+
+    configure_logging()
+
+    db = SessionLocal()
+    try:
+        index = get_article_index(db)
+        users = load_user_vectors(db, args.users)
+    finally:
+        db.close()
+
+    if not users or len(index) == 0:
+        logger.warning(f"ann_benchmark_skipped users={len(users)} corpus={len(index)}")
+        return
+
+    k = min(args.recall_at, args.top_n)
+
+    started = time.perf_counter()
+    exact = [
+        set(index.rank(text_vec, tag_vec, args.top_n, use_ann=False)[:k].tolist())
+        for text_vec, tag_vec in users
+    ]
+    exact_ms = (time.perf_counter() - started) * 1000 / len(users)
+
+    print(f"corpus={len(index)} users={len(users)} top_n={args.top_n} recall_at={k}")
+    print(f"{'probe_terms':>12} {'candidates':>11} {'recall':>8} {'ms/user':>9} {'speedup':>8}")
+    print(f"{'exhaustive':>12} {'-':>11} {1.0:>8.4f} {exact_ms:>9.2f} {1.0:>8.2f}")
+
+    for probe_terms in args.probe_terms:
+        for max_candidates in args.candidates:
+            hits = 0
+            total = 0
+            elapsed = 0.0
+
+            for (text_vec, tag_vec), expected in zip(users, exact):
+                started = time.perf_counter()
+                rows = index.candidate_rows(text_vec, tag_vec, probe_terms, max_candidates)
+                scores = index.score_rows(rows, text_vec, tag_vec)
+                top = rows[np.argsort(-scores, kind="stable")[:k]]
+                elapsed += time.perf_counter() - started
+
+                hits += len(expected & set(index.article_ids[top].tolist()))
+                total += len(expected)
+
+            ann_ms = elapsed * 1000 / len(users)
+            recall = hits / total if total else 1.0
+
+            print(
+                f"{probe_terms:>12} {max_candidates:>11} {recall:>8.4f} "
+                f"{ann_ms:>9.2f} {exact_ms / ann_ms if ann_ms else 0.0:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
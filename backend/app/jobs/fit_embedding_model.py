@@ -0,0 +1,142 @@
+import argparse
+import time
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal, engine
+from app.database.schema_sync import sync_schema
+from app.models.vector_model import ArticleVector
+from app.ml.tfidf_model_loader import get_vectorizers
+from app.ml.embedding_model_loader import save_embedding_model
+from app.services.article_index_service import (
+    get_article_index,
+    weighted_feature_matrix,
+    embed_rows,
+    SparseMatrixBuilder
+)
+from app.utils.vector_utils import pack_embedding
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Offline job that fits the TruncatedSVD projection of the dense embedding mode on the current article vectors, stores it next to the TF-IDF pickles of the active model version in model_store/ and writes the embedding of every article. Run it again whenever the corpus has drifted (a version rolled out with app.jobs.rollout_model_version brings its own projection), the running processes pick the projection up through the manifest. The API uses it with RECOMMENDATION_EMBEDDING_MODE=dense.
+
+    python -m app.jobs.fit_embedding_model --dimensions 128
+"""
+
+
+# Fits the projection on (a random sample of) the weighted text + tag matrix of the corpus
+def fit_embedding_model(db: Session, dimensions: int, sample_size: int, seed: int = 42) -> TruncatedSVD:
+    index = get_article_index(db)
+    features = weighted_feature_matrix(index.text_matrix, index.tag_matrix)
+
+    if features.shape[0] > sample_size:
+        rows = np.random.default_rng(seed).choice(features.shape[0], size=sample_size, replace=False)
+        features = features[np.sort(rows)]
+
+    components = min(dimensions, features.shape[0] - 1, features.shape[1] - 1)
+
+    if components < 1:
+        raise ValueError(f"not enough article vectors to fit an embedding, articles={features.shape[0]}")
+
+    started = time.perf_counter()
+    model = TruncatedSVD(n_components=components, random_state=seed)
+    model.fit(features)
+
+    logger.info(
+        f"embedding_model_fit articles={features.shape[0]} dimensions={components} "
+        f"explained_variance={round(float(model.explained_variance_ratio_.sum()), 4)} "
+        f"time={round(time.perf_counter() - started, 2)}s"
+    )
+
+    return model
+
+
+# Writes the embedding of every article vector in primary key order, one commit per batch. The vector version is bumped so every running index picks the new embeddings up
+def backfill_article_embeddings(db: Session, model, batch_size: int = 1000) -> int:
+    text_vectorizer, tag_vectorizer = get_vectorizers()
+    written = 0
+    last_id = None
+
+    while True:
+        query = (
+            db.query(
+                ArticleVector.article_id,
+                ArticleVector.text_vector_packed,
+                ArticleVector.text_vector,
+                ArticleVector.tag_vector_packed,
+                ArticleVector.tag_vector,
+                ArticleVector.vector_version
+            )
+            .order_by(ArticleVector.article_id)
+        )
+
+        if last_id is not None:
+            query = query.filter(ArticleVector.article_id > last_id)
+
+        rows = query.limit(batch_size).all()
+
+        if not rows:
+            break
+
+        text_builder = SparseMatrixBuilder(len(text_vectorizer.vocabulary_))
+        tag_builder = SparseMatrixBuilder(len(tag_vectorizer.vocabulary_))
+
+        for _, text_packed, text_json, tag_packed, tag_json, _ in rows:
+            text_builder.append(text_packed, text_json)
+            tag_builder.append(tag_packed, tag_json)
+
+        embeddings = embed_rows(text_builder.build(), tag_builder.build(), model)
+
+        db.bulk_update_mappings(ArticleVector, [
+            {
+                "article_id": row.article_id,
+                "embedding": pack_embedding(embedding),
+                "vector_version": (row.vector_version or 0) + 1
+            }
+            for row, embedding in zip(rows, embeddings)
+        ])
+        db.commit()
+
+        written += len(rows)
+        last_id = rows[-1].article_id
+
+        logger.info(f"article_embeddings_batch_written articles={written}")
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the dense SVD embedding of the article vectors")
+    parser.add_argument("--dimensions", type=int, default=128, help="width of the embeddings")
+    parser.add_argument("--sample-size", type=int, default=200000, help="maximum number of articles the projection is fit on")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--skip-backfill", action="store_true", help="only fit and store the projection")
+    args = parser.parse_args()
+
+    configure_logging()
+    sync_schema(engine)
+
+    db = SessionLocal()
+
+    try:
+        model = fit_embedding_model(db, args.dimensions, args.sample_size)
+        path = save_embedding_model(model)
+        logger.info(f"embedding_model_saved path={path}")
+
+        if not args.skip_backfill:
+            written = backfill_article_embeddings(db, model, batch_size=args.batch_size)
+            logger.info(f"article_embeddings_backfill_complete articles={written}")
+
+    except Exception:
+        db.rollback()
+        logger.exception("embedding_model_fit_failed")
+        raise
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import time
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal, engine
+from app.database.schema_sync import sync_schema
+from app.models.vector_model import ArticleVector, UserVector
+from app.utils.vector_utils import parse_sparse_json, pack_sparse_vector
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+One-off migration that converts the sparse vectors stored as JSON text into the packed binary columns. The readers accept both formats, so this can run while the API is serving traffic. Rows are converted in primary key order in batches, each batch is committed on its own so the command can be stopped and started again at any time.
+
+    python -m app.jobs.migrate_vector_storage --batch-size 500
+"""
+
+
+def _pack_json(vec_json: str | None) -> bytes | None:
+    if not vec_json:
+        return None
+
+    indices, values, _ = parse_sparse_json(vec_json)
+    return pack_sparse_vector(indices, values)
+
+
+# Converts every row of the given vector model that still only has the JSON columns, returns the number of rows converted
+def backfill_packed_vectors(db: Session, model, key_column, batch_size: int = 500, keep_json: bool = False) -> int:
+    converted = 0
+    last_key = None
+    started = time.perf_counter()
+
+    while True:
+        query = (
+            db.query(key_column, model.text_vector, model.tag_vector)
+            .filter(model.text_vector_packed.is_(None))
+            .filter(model.text_vector.isnot(None))
+            .order_by(key_column)
+        )
+
+        if last_key is not None:
+            query = query.filter(key_column > last_key)
+
+        rows = query.limit(batch_size).all()
+
+        if not rows:
+            break
+
+        mappings = []
+        for key, text_json, tag_json in rows:
+            mapping = {
+                key_column.key: key,
+                "text_vector_packed": _pack_json(text_json),
+                "tag_vector_packed": _pack_json(tag_json),
+            }
+
+            if not keep_json:
+                mapping["text_vector"] = None
+                mapping["tag_vector"] = None
+
+            mappings.append(mapping)
+
+        db.bulk_update_mappings(model, mappings)
+        db.commit()
+
+        converted += len(rows)
+        last_key = rows[-1][0]
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"vector_storage_batch_migrated table={model.__tablename__} "
+            f"rows={converted} rate={round(converted / elapsed, 1) if elapsed else converted}/s"
+        )
+
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON sparse vectors to the packed binary format")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--keep-json",
+        action="store_true",
+        help="keep the legacy JSON columns populated for processes that still read them"
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    sync_schema(engine)
+
+    db = SessionLocal()
+
+    try:
+        articles = backfill_packed_vectors(
+            db, ArticleVector, ArticleVector.article_id,
+            batch_size=args.batch_size, keep_json=args.keep_json
+        )
+        users = backfill_packed_vectors(
+            db, UserVector, UserVector.user_id,
+            batch_size=args.batch_size, keep_json=args.keep_json
+        )
+
+        logger.info(
+            f"vector_storage_migration_complete article_vectors={articles} user_vectors={users}"
+        )
+
+    except Exception:
+        db.rollback()
+        logger.exception("vector_storage_migration_failed")
+        raise
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
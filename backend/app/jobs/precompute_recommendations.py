@@ -0,0 +1,35 @@
+import argparse
+import os
+from app.services.recommendation_precompute_service import precompute_all_recommendations
+from app.core.config import RECOMMENDATION_TOP_N
+from app.core.logging_config import configure_logging
+
+"""
+Worker entry point that precomputes the recommendation lists of all users, meant to be run from cron or a scheduler before peak hours.
+
+    python -m app.jobs.precompute_recommendations --workers 0 --block-size 256
+
+--workers 0 uses one process per CPU core.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the recommendation lists of all users")
+    parser.add_argument("--block-size", type=int, default=256, help="users scored per sparse matrix product")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--top-n", type=int, default=RECOMMENDATION_TOP_N)
+    args = parser.parse_args()
+
+    configure_logging()
+
+    workers = args.workers or os.cpu_count() or 1
+
+    precompute_all_recommendations(
+        block_size=args.block_size,
+        workers=workers,
+        top_n=args.top_n
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import os
+from app.database.db import engine
+from app.database.schema_sync import sync_schema
+from app.services.related_article_service import precompute_all_neighbours
+from app.core.config import RELATED_ARTICLES_TOP_K
+from app.core.logging_config import configure_logging
+
+"""
+Worker entry point that recomputes the related articles list of every article, meant to be run after bulk imports or on a nightly schedule. Single vector changes are applied incrementally by the API.
+
+    python -m app.jobs.precompute_related_articles --workers 0 --block-size 128
+
+--workers 0 uses one process per CPU core.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the related articles of every article")
+    parser.add_argument("--block-size", type=int, default=128, help="articles scored per matrix product")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--top-k", type=int, default=RELATED_ARTICLES_TOP_K)
+    args = parser.parse_args()
+
+    configure_logging()
+    sync_schema(engine)
+
+    workers = args.workers or os.cpu_count() or 1
+
+    precompute_all_neighbours(
+        block_size=args.block_size,
+        workers=workers,
+        top_k=args.top_k
+    )
+
+
+if __name__ == "__main__":
+    main()
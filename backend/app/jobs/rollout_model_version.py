@@ -0,0 +1,83 @@
+import argparse
+import os
+import pickle
+from pathlib import Path
+from app.database.db import SessionLocal, engine
+from app.database.schema_sync import sync_schema
+from app.models.vector_model import VectorJob
+from app.ml.model_store import TEXT_MODEL_FILE, TAG_MODEL_FILE, EMBEDDING_MODEL_FILE, publish_model_version
+from app.services.model_rollout_service import stage_model_version, promote_model_version
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Rolls a retrained set of models out while the API keeps serving (app.services.model_rollout_service). --from publishes the pickles of a directory (tfidf_vectorizer.pkl, tag_vectorizer.pkl and optionally svd_embedding.pkl) as the new version and stages it, the staged vectors of every article are then computed next to the served ones and the version is promoted in one step. The staging is checkpointed like app.jobs.vectorize_articles, running the command again without --from after a stop continues where it left off.
+
+    python -m app.jobs.rollout_model_version --version 2026-10-17 --from /tmp/retrained --workers 0
+
+--stage-only stops before the promotion, --promote-only promotes a version staged earlier.
+"""
+
+
+def _read_pickle(path: Path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll a new model version out without downtime")
+    parser.add_argument("--version", required=True, help="name of the model version")
+    parser.add_argument("--from", dest="source", type=Path, help="directory with the fitted models to publish as the version")
+    parser.add_argument("--block-size", type=int, default=500, help="articles transformed per vectorizer call")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--checkpoint", type=Path, default=Path("rollout_model_version.checkpoint"))
+    parser.add_argument("--restart", action="store_true", help="start from the first article even if a checkpoint exists")
+    parser.add_argument("--stage-only", action="store_true", help="compute the staged vectors without promoting them")
+    parser.add_argument("--promote-only", action="store_true", help="promote a version whose vectors are already staged")
+    args = parser.parse_args()
+
+    configure_logging()
+    VectorJob.__table__.create(bind=engine, checkfirst=True)
+    sync_schema(engine)
+
+    if args.source is not None:
+        embedding_path = args.source / EMBEDDING_MODEL_FILE
+
+        publish_model_version(
+            args.version,
+            _read_pickle(args.source / TEXT_MODEL_FILE),
+            _read_pickle(args.source / TAG_MODEL_FILE),
+            _read_pickle(embedding_path) if embedding_path.exists() else None
+        )
+
+    if args.restart and args.checkpoint.exists():
+        args.checkpoint.unlink()
+
+    if not args.promote_only:
+        stage_model_version(
+            args.version,
+            block_size=args.block_size,
+            workers=args.workers or os.cpu_count() or 1,
+            checkpoint_path=args.checkpoint
+        )
+
+    if args.stage_only:
+        return
+
+    db = SessionLocal()
+
+    try:
+        promote_model_version(db, args.version)
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"model_rollout_failed version={args.version}")
+        raise
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import multiprocessing
+import os
+import time
+from app.database.db import SessionLocal, engine
+from app.database.schema_sync import sync_schema
+from app.models.vector_model import VectorJob
+from app.services.vector_job_service import run_vector_jobs_once, get_vector_job_stats, get_worker_stats
+from app.core.logging_config import configure_logging
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Worker entry point of the vector job queue (app.services.vector_job_service). Runs N processes that each claim a batch of due jobs, vectorize it and poll again after --poll-seconds once the queue is empty, so the vectorization of new and edited articles never runs inside the API workers. Every --stats-seconds each process logs the queue depth, the age of the oldest waiting job and its own completion counters and latencies.
+
+    python -m app.jobs.vector_worker --workers 2 --batch-size 50
+
+--workers 0 uses one process per CPU core, --once drains the queue and exits (e.g. from cron).
+"""
+
+
+def run_worker(batch_size: int, poll_seconds: float, stats_seconds: float, once: bool = False):
+    logger.info(f"vector_worker_started pid={os.getpid()}")
+    stats_logged_at = time.monotonic()
+
+    while True:
+        db = SessionLocal()
+
+        try:
+            processed = run_vector_jobs_once(db, batch_size)
+
+            if time.monotonic() - stats_logged_at >= stats_seconds:
+                stats = {**get_vector_job_stats(db), **get_worker_stats()}
+                logger.info("vector_worker_stats " + " ".join(f"{key}={value}" for key, value in stats.items()))
+                stats_logged_at = time.monotonic()
+
+        except Exception:
+            db.rollback()
+            logger.exception("vector_worker_batch_failed")
+            processed = 0
+
+        finally:
+            db.close()
+
+        if not processed:
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+def _start_worker(batch_size: int, poll_seconds: float, stats_seconds: float, once: bool):
+    # Connections inherited from the parent process must not be reused after the fork
+    engine.dispose(close=False)
+    run_worker(batch_size, poll_seconds, stats_seconds, once)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the vectorization job workers")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--batch-size", type=int, default=50, help="jobs claimed and vectorized together")
+    parser.add_argument("--poll-seconds", type=float, default=1.0, help="wait after finding the queue empty")
+    parser.add_argument("--stats-seconds", type=float, default=60.0, help="interval of the queue metrics log line")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+
+    configure_logging()
+    VectorJob.__table__.create(bind=engine, checkfirst=True)
+    sync_schema(engine)
+
+    workers = args.workers or os.cpu_count() or 1
+    worker_args = (args.batch_size, args.poll_seconds, args.stats_seconds, args.once)
+
+    if workers == 1:
+        run_worker(*worker_args)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_start_worker, args=worker_args, daemon=True)
+        for _ in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
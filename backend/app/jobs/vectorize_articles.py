@@ -0,0 +1,44 @@
+import argparse
+import os
+from pathlib import Path
+from app.database.db import engine
+from app.database.schema_sync import sync_schema
+from app.services.article_vector_batch_service import vectorize_all_articles
+from app.core.logging_config import configure_logging
+
+"""
+Worker entry point that (re-)computes the article vectors in bulk, e.g. after the vectorizers or the embedding projection were refit (every article) or to fill in the articles that have no vector yet (--missing-only). Progress is checkpointed after every block, running the same command again after a stop continues where it left off, --restart ignores the checkpoint. The related article lists are not touched, run app.jobs.precompute_related_articles afterwards when many vectors changed.
+
+    python -m app.jobs.vectorize_articles --workers 0 --block-size 500
+
+--workers 0 uses one process per CPU core.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the vectors of the articles in bulk")
+    parser.add_argument("--block-size", type=int, default=500, help="articles transformed per vectorizer call")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--missing-only", action="store_true", help="only the articles that have no vector")
+    parser.add_argument("--checkpoint", type=Path, default=Path("vectorize_articles.checkpoint"))
+    parser.add_argument("--restart", action="store_true", help="start from the first article even if a checkpoint exists")
+    args = parser.parse_args()
+
+    configure_logging()
+    sync_schema(engine)
+
+    if args.restart and args.checkpoint.exists():
+        args.checkpoint.unlink()
+
+    workers = args.workers or os.cpu_count() or 1
+
+    vectorize_all_articles(
+        block_size=args.block_size,
+        workers=workers,
+        checkpoint_path=args.checkpoint,
+        missing_only=args.missing_only
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
-from app.database.db import engine
+from app.database.db import engine, SessionLocal
 from app.database.db import Base
+from app.database.schema_sync import sync_schema
+from app.database.search_schema import ensure_search_schema, ensure_user_search_schema
+from app.core.config import SEARCH_BACKEND
 from app.routers import auth_router, recommendation_router, article_router, interaction_router, search_router, trending_router, user_router, analytics_router, admin_router
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.logging_config import configure_logging
 from app.core.middleware import RequestLoggingMiddleware
+from app.services.vector_job_service import log_vector_job_backlog
 
 configure_logging()
 app = FastAPI()
@@ -23,6 +27,22 @@ app.add_middleware(
 # Middleware for logging all the incoming requests
 app.add_middleware(RequestLoggingMiddleware)
 Base.metadata.create_all(bind=engine)
+sync_schema(engine)
+ensure_user_search_schema(engine)
+
+if SEARCH_BACKEND == "database":
+    ensure_search_schema(engine)
+
+
+# Articles are vectorized by the separate app.jobs.vector_worker processes, the queue backlog is logged on startup so a missing worker shows up in the logs (and at /admin/vector-jobs)
+@app.on_event("startup")
+def report_vector_job_backlog():
+    db = SessionLocal()
+
+    try:
+        log_vector_job_backlog(db)
+    finally:
+        db.close()
 
 
 # all the routers of that are to be included in the main server
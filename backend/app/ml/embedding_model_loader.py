@@ -0,0 +1,13 @@
+from pathlib import Path
+from app.ml.model_store import get_model_bundle, save_active_embedding_model
+
+# TruncatedSVD projection of the weighted text + tag TF-IDF space, fit offline by app.jobs.fit_embedding_model and stored with the vectorizers of the active model version
+
+# Fetching the dense embedding projection of the active model version, None when it has not been fit yet
+def get_embedding_model():
+    return get_model_bundle().embedding_model
+
+
+# Writes the projection next to the vectorizers of the active version, through a temporary file so a running process never reads a half written pickle. Returns the path written
+def save_embedding_model(model) -> Path:
+    return save_active_embedding_model(model)
@@ -0,0 +1,261 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from app.core.config import MODEL_STORE_REFRESH_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+MODEL_DIR = Path("model_store")
+
+TEXT_MODEL_FILE = "tfidf_vectorizer.pkl"
+TAG_MODEL_FILE = "tag_vectorizer.pkl"
+EMBEDDING_MODEL_FILE = "svd_embedding.pkl"
+
+# Version of the models stored directly in MODEL_DIR, used as long as no manifest has been written and for the vectors stored before versions existed (model_version NULL)
+LEGACY_VERSION = "legacy"
+
+# Loaded versions kept in memory, enough for the active version, the one being rolled out and the one an article index still serves
+MAX_LOADED_VERSIONS = 3
+
+
+def manifest_path() -> Path:
+    return MODEL_DIR / "manifest.json"
+
+
+def version_dir(version: str) -> Path:
+    if version == LEGACY_VERSION:
+        return MODEL_DIR
+
+    return MODEL_DIR / "versions" / version
+
+
+# The fitted models of one version. A bundle is never modified once loaded, a refit replaces it with a new bundle so a caller holding one always sees a consistent set of models
+class ModelBundle:
+    def __init__(self, version: str, text_vectorizer, tag_vectorizer, embedding_model=None):
+        self.version = version
+        self.text_vectorizer = text_vectorizer
+        self.tag_vectorizer = tag_vectorizer
+        self.embedding_model = embedding_model
+
+
+# {"active": version served and written, "staged": version being rolled out or null, "versions": every published version}. Without a manifest the legacy files are the active version
+def read_manifest() -> dict:
+    path = manifest_path()
+
+    if not path.exists():
+        return {"active": LEGACY_VERSION, "staged": None, "versions": [LEGACY_VERSION]}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+# Through a temporary file so a running process never reads a half written manifest
+def write_manifest(manifest: dict):
+    path = manifest_path()
+    tmp_path = path.with_suffix(".tmp")
+
+    manifest = {**manifest, "updated_at": datetime.utcnow().isoformat()}
+
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_path, path)
+
+
+def _read_pickle(path: Path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _load_from_disk(version: str) -> ModelBundle:
+    directory = version_dir(version)
+    embedding_path = directory / EMBEDDING_MODEL_FILE
+
+    bundle = ModelBundle(
+        version=version,
+        text_vectorizer=_read_pickle(directory / TEXT_MODEL_FILE),
+        tag_vectorizer=_read_pickle(directory / TAG_MODEL_FILE),
+        embedding_model=_read_pickle(embedding_path) if embedding_path.exists() else None
+    )
+
+    logger.info(f"model_bundle_loaded version={version} embedding={bundle.embedding_model is not None}")
+    return bundle
+
+
+_bundles: dict[str, ModelBundle] = {}
+_manifest: dict | None = None
+_manifest_mtime = None
+_manifest_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _remember(bundle: ModelBundle):
+    _bundles.pop(bundle.version, None)
+    _bundles[bundle.version] = bundle
+
+    # Oldest loaded first, the active and staged versions are never dropped
+    keep = {_manifest.get("active"), _manifest.get("staged")} if _manifest else set()
+    for version in list(_bundles):
+        if len(_bundles) <= MAX_LOADED_VERSIONS:
+            break
+        if version not in keep:
+            del _bundles[version]
+
+
+# Re-reads the manifest when the file changed since the last check, at most every MODEL_STORE_REFRESH_SECONDS unless forced. The bundles of the new active and staged versions are loaded before the manifest is swapped in, so the requests running meanwhile keep the previous models and never see a half loaded version
+def _refresh(force: bool = False):
+    global _manifest, _manifest_mtime, _manifest_checked_at
+
+    if not force and _manifest is not None and time.monotonic() - _manifest_checked_at < MODEL_STORE_REFRESH_SECONDS:
+        return
+
+    with _lock:
+        if not force and _manifest is not None and time.monotonic() - _manifest_checked_at < MODEL_STORE_REFRESH_SECONDS:
+            return
+
+        path = manifest_path()
+        mtime = path.stat().st_mtime_ns if path.exists() else None
+
+        if _manifest is None or mtime != _manifest_mtime:
+            manifest = read_manifest()
+
+            # A changed manifest can mean a refit in place (e.g. a new embedding projection), so its versions are read from disk again
+            loaded = {
+                version: _load_from_disk(version)
+                for version in {manifest["active"], manifest.get("staged")} - {None}
+            }
+
+            previous = _manifest["active"] if _manifest else None
+            _manifest, _manifest_mtime = manifest, mtime
+
+            for bundle in loaded.values():
+                _remember(bundle)
+
+            if previous is not None and previous != manifest["active"]:
+                logger.info(f"model_bundle_swapped old={previous} new={manifest['active']}")
+
+        _manifest_checked_at = time.monotonic()
+
+
+# The models new vectors are written with
+def get_model_bundle(force_check: bool = False) -> ModelBundle:
+    _refresh(force_check)
+    return _bundles.get(_manifest["active"]) or load_model_bundle(_manifest["active"])
+
+
+# The models of the version being rolled out, None when no rollout is in progress
+def get_staged_bundle(force_check: bool = False) -> ModelBundle | None:
+    _refresh(force_check)
+    staged = _manifest.get("staged")
+
+    if staged is None or staged == _manifest["active"]:
+        return None
+
+    return _bundles.get(staged) or load_model_bundle(staged)
+
+
+def get_active_version() -> str:
+    _refresh()
+    return _manifest["active"]
+
+
+# The models of any published version, e.g. the one the vectors an index was built from were written with
+def load_model_bundle(version: str) -> ModelBundle:
+    bundle = _bundles.get(version)
+    if bundle is not None:
+        return bundle
+
+    with _lock:
+        bundle = _bundles.get(version)
+        if bundle is None:
+            bundle = _load_from_disk(version)
+            _remember(bundle)
+
+        return bundle
+
+
+# Stores a newly fit set of models as a new version and stages it for rollout, the active version keeps serving until activate_model_version. The files are written to a temporary directory that is renamed into place, so a version directory is always complete
+def publish_model_version(version: str, text_vectorizer, tag_vectorizer, embedding_model=None) -> Path:
+    if version == LEGACY_VERSION or "/" in version or not version:
+        raise ValueError(f"invalid model version {version!r}")
+
+    directory = version_dir(version)
+    if directory.exists():
+        raise ValueError(f"model version {version} already exists")
+
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    for file_name, model in (
+        (TEXT_MODEL_FILE, text_vectorizer),
+        (TAG_MODEL_FILE, tag_vectorizer),
+        (EMBEDDING_MODEL_FILE, embedding_model),
+    ):
+        if model is not None:
+            with open(tmp_dir / file_name, "wb") as f:
+                pickle.dump(model, f)
+
+    os.replace(tmp_dir, directory)
+
+    manifest = read_manifest()
+    manifest["versions"] = [*manifest.get("versions", []), version]
+    manifest["staged"] = version
+    write_manifest(manifest)
+
+    _refresh(force=True)
+    logger.info(f"model_version_published version={version} path={directory}")
+
+    return directory
+
+
+# Makes a published version the one new vectors are written with, in this process right away and in the others within MODEL_STORE_REFRESH_SECONDS
+def activate_model_version(version: str):
+    if not (version_dir(version) / TEXT_MODEL_FILE).exists():
+        raise ValueError(f"model version {version} is not published")
+
+    manifest = read_manifest()
+    manifest["active"] = version
+
+    if manifest.get("staged") == version:
+        manifest["staged"] = None
+
+    write_manifest(manifest)
+    _refresh(force=True)
+
+
+# Writes a refit embedding projection into the directory of the active version and swaps in a bundle that holds it
+def save_active_embedding_model(model) -> Path:
+    bundle = get_model_bundle(force_check=True)
+    path = version_dir(bundle.version) / EMBEDDING_MODEL_FILE
+    tmp_path = path.with_suffix(".tmp")
+
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f)
+
+    os.replace(tmp_path, path)
+
+    with _lock:
+        _remember(ModelBundle(bundle.version, bundle.text_vectorizer, bundle.tag_vectorizer, model))
+
+    # Touching the manifest makes the other processes reload the version
+    if manifest_path().exists():
+        write_manifest(read_manifest())
+
+    return path
+
+
+# Forgets every loaded version and the manifest, the next call reads them from disk again
+def reset_model_store():
+    global _manifest, _manifest_mtime, _manifest_checked_at
+
+    with _lock:
+        _bundles.clear()
+        _manifest = None
+        _manifest_mtime = None
+        _manifest_checked_at = 0.0
@@ -1,23 +1,6 @@
-import pickle
-from pathlib import Path
+from app.ml.model_store import get_model_bundle
 
-MODEL_DIR = Path("model_store")
-TEXT_MODEL_PATH = MODEL_DIR / "tfidf_vectorizer.pkl"
-TAG_MODEL_PATH = MODEL_DIR / "tag_vectorizer.pkl"
-
-_text_vectorizer = None
-_tag_vectorizer = None
-
-# Fetching the vector weights from the ML file
+# Fetching the fitted vectorizers of the active model version (app.ml.model_store), a newly activated version is picked up without a restart
 def get_vectorizers():
-    global _text_vectorizer, _tag_vectorizer
-
-    if _text_vectorizer is None:
-        with open(TEXT_MODEL_PATH, "rb") as f:
-            _text_vectorizer = pickle.load(f)
-
-    if _tag_vectorizer is None:
-        with open(TAG_MODEL_PATH, "rb") as f:
-            _tag_vectorizer = pickle.load(f)
-
-    return _text_vectorizer, _tag_vectorizer
+    bundle = get_model_bundle()
+    return bundle.text_vectorizer, bundle.tag_vectorizer
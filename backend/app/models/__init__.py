@@ -1,4 +1,4 @@
 from .user_model import User # noqa: F401
-from .article_model import Article, Tag, ArticleTag, ArticleStat # noqa: F401
+from .article_model import Article, Tag, ArticleTag, ArticleStat, ArticleSearchDocument # noqa: F401
 from .interaction_model import UserInteraction # noqa: F401
-from .vector_model import ArticleVector, UserVector  # noqa: F401
+from .vector_model import ArticleVector, UserVector, ArticleNeighbours, VectorJob  # noqa: F401
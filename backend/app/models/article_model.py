@@ -77,3 +77,21 @@ class ArticleStat(Base):
     save_count = Column(Integer, default=0)
 
     article = relationship("Article", back_populates="stats")
+
+
+# Search data of an article, written in the same transaction as the article: the normalized title and author name and the token counts of the title and the content as JSON objects ({"token": count}). The search index is built from these rows without tokenizing any article text
+class ArticleSearchDocument(Base):
+    __tablename__ = "article_search_documents"
+
+    article_id = Column(
+        Integer,
+        ForeignKey("articles.article_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    title_normalized = Column(Text, nullable=False)
+    author_normalized = Column(Text, nullable=False)
+    title_terms = Column(Text, nullable=False)
+    content_terms = Column(Text, nullable=False)
+
+    updated_at = Column(TIMESTAMP, server_default=func.now())
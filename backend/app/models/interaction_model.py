@@ -24,6 +24,9 @@ class UserInteraction(Base):
 
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    # vector_version of the article vector this like/save added to the running sums of the user vector, so removing it subtracts exactly that vector. NULL when nothing was added (no article vector yet, or the user vector was waiting for a full recompute)
+    vector_version = Column(Integer, nullable=True)
+
     __table_args__ = (
         CheckConstraint(
             "interaction_type IN ('view', 'like', 'save')",
@@ -3,6 +3,7 @@ from sqlalchemy import (
     Integer,
     String,
     Text,
+    LargeBinary,
     Date,
     TIMESTAMP,
     CheckConstraint,
@@ -16,15 +17,22 @@ from app.database.db import Base
 
 # Models for the user
 
-class UserRecommendationCache(Base):
-    __tablename__ = "user_recommendation_cache"
+# Format version of the packed article_ids list, bumped whenever the encoding changes so old rows can be told apart and rebuilt
+RANKED_LIST_VERSION = 1
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
-    article_id = Column(Integer, ForeignKey("articles.article_id", ondelete="CASCADE"), nullable=False)
-    rank_position = Column(Integer, nullable=False)
-    session_id = Column(String, nullable=False)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+# Session id under which the offline precompute job stores its rankings
+PRECOMPUTED_SESSION_ID = "__precomputed__"
+
+
+# The ranked recommendation list of a user for one browsing session, stored as a single row holding the packed article ids (int32, best first) instead of one row per recommended article
+class UserRecommendationList(Base):
+    __tablename__ = "user_recommendation_lists"
+
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    session_id = Column(String, primary_key=True)
+    article_ids = Column(LargeBinary, nullable=False)
+    list_version = Column(Integer, nullable=False, default=RANKED_LIST_VERSION)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
 
 class User(Base):
@@ -33,6 +41,9 @@ class User(Base):
     user_id = Column(Integer, primary_key=True, index=True)
     user_email = Column(String(255), unique=True, nullable=False)
     user_name = Column(String(255), unique=True, nullable=False)
+
+    # Bumped on every rename, part of the signature of the in-memory user name index (app.services.user_search_service) so a rename made by another process is noticed. NULL for users that were never renamed
+    name_version = Column(Integer, nullable=True)
     password_hash = Column(String(255), nullable=False)
 
     birth_date = Column(Date, nullable=True)
@@ -1,7 +1,10 @@
 from sqlalchemy import (
     Column,
     Integer,
+    Float,
     String,
+    Text,
+    LargeBinary,
     TIMESTAMP,
     ForeignKey
 )
@@ -10,7 +13,7 @@ from sqlalchemy.sql import func
 
 from app.database.db import Base
 
-# database models for storing the vectors
+# database models for storing the vectors. The *_packed columns hold the binary format from app.utils.vector_utils, the older text columns hold the legacy JSON format and are only read for rows that have not been migrated yet
 
 class ArticleVector(Base):
     __tablename__ = "article_vectors"
@@ -21,12 +24,27 @@ class ArticleVector(Base):
         primary_key=True
     )
 
-    text_vector = Column(String, nullable=False)
-    tag_vector = Column(String, nullable=False)
+    text_vector = Column(String, nullable=True)
+    tag_vector = Column(String, nullable=True)
+
+    text_vector_packed = Column(LargeBinary, nullable=True)
+    tag_vector_packed = Column(LargeBinary, nullable=True)
+
+    # Dense float32 SVD embedding of the two vectors above, only populated once an embedding projection has been fit
+    embedding = Column(LargeBinary, nullable=True)
 
     vector_version = Column(Integer, default=1)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    # Model version (app.ml.model_store) the vectors above were computed with, NULL for the vectors written before versions existed (the legacy models)
+    model_version = Column(String, nullable=True)
+
+    # Vectors of the model version being rolled out, written next to the served ones and copied over them in one statement when the rollout is promoted (app.services.model_rollout_service)
+    staged_text_vector_packed = Column(LargeBinary, nullable=True)
+    staged_tag_vector_packed = Column(LargeBinary, nullable=True)
+    staged_embedding = Column(LargeBinary, nullable=True)
+    staged_model_version = Column(String, nullable=True)
+
     article = relationship("Article", back_populates="vector")
 
 
@@ -42,6 +60,49 @@ class UserVector(Base):
     text_vector = Column(String, nullable=True)
     tag_vector = Column(String, nullable=True)
 
+    text_vector_packed = Column(LargeBinary, nullable=True)
+    tag_vector_packed = Column(LargeBinary, nullable=True)
+
+    # Running weighted sums of the liked/saved article vectors and the total of their weights, the vectors above are these sums divided by total_weight. NULL for vectors that were not built from interactions (e.g. the default vector of a new user)
+    text_sum_packed = Column(LargeBinary, nullable=True)
+    tag_sum_packed = Column(LargeBinary, nullable=True)
+    total_weight = Column(Float, nullable=True)
+
     last_updated = Column(TIMESTAMP)
 
     user = relationship("User", back_populates="vector")
+
+
+# Precomputed "more like this" list of an article: the ids of its most similar articles as a packed int32 array and their scores as a float32 array of the same length, best first
+class ArticleNeighbours(Base):
+    __tablename__ = "article_neighbours"
+
+    article_id = Column(
+        Integer,
+        ForeignKey("articles.article_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    neighbour_ids = Column(LargeBinary, nullable=False)
+    scores = Column(LargeBinary, nullable=False)
+
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+
+# Durable queue of vectorization jobs (app.services.vector_job_service). job_key is "<kind>:<target_id>", so enqueuing the same article again updates its one row instead of adding a job. status is "pending", "running" or "failed" (gave up after VECTOR_JOB_MAX_ATTEMPTS), finished jobs are deleted
+class VectorJob(Base):
+    __tablename__ = "vector_jobs"
+
+    job_key = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    target_id = Column(Integer, nullable=False)
+
+    status = Column(String, nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    # enqueued_at is when the job was first requested (queue latency), requested_at when it was requested last, run_after when it may run next (debounce and retry backoff)
+    enqueued_at = Column(TIMESTAMP, nullable=False)
+    requested_at = Column(TIMESTAMP, nullable=False)
+    run_after = Column(TIMESTAMP, nullable=False, index=True)
+    locked_at = Column(TIMESTAMP, nullable=True)
@@ -17,6 +17,9 @@ from app.services.admin_service import (
     admin_delete_tag,
     admin_delete_user
 )
+from app.services.recommendation_cache_service import get_recommendation_cache_stats
+from app.services.search_cache_service import get_search_cache_stats
+from app.services.vector_job_service import get_vector_job_stats
 
 router = APIRouter(
     prefix="/admin",
@@ -78,3 +81,17 @@ def get_current_user_info(
         "user_id": user.user_id,
         "role": user.user_role
     }
+
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    return {
+        "recommendations": get_recommendation_cache_stats(),
+        "search": get_search_cache_stats()
+    }
+
+
+# Depth and age of the vectorization job queue, the workers log their own throughput and latency
+@router.get("/vector-jobs")
+def get_vector_jobs(db: Session = Depends(get_db)):
+    return get_vector_job_stats(db)
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.core.dependencies import get_db, get_current_user_id
 from app.schemas.article_schema import ArticleReadResponse
 from app.services.article_service import get_article_by_id, create_article, get_saved_articles_for_user, get_articles_by_user, get_user_article_stats, delete_article, get_articles_by_tag, get_articles_by_author, update_article
 from app.schemas.article_schema import ArticleResponse, ArticleCreateRequest, PaginatedSavedArticlesResponse, PaginatedUserArticlesResponse, UserArticleStatsResponse, PaginatedArticlesByTagSchema, ArticleByTagSchema, PaginatedArticlesByAuthorSchema,ArticleByAuthorSchema, ArticleUpdateRequest, ArticleUpdateResponse
-from app.services.vector_background_service import create_article_vector_background
-import os
+from app.schemas.article_schema import RelatedArticlesResponse
+from app.services.vector_job_service import enqueue_article_vector
+from app.services.related_article_service import get_related_articles
+from app.core.config import RELATED_ARTICLES_TOP_K
 
 
 # Article router for endpoints related to article management (CRUD operations, fetching by tag/author)
@@ -22,23 +24,25 @@ def read_article(article_id: int, db: Session = Depends(get_db)):
 
     return article
 
-# Endpoint to create a new article. This allows only authenticated users to create articles. The article details are passed in the request body in json format. The vector generation is done in the background to avoid blocking the user from browsing the rest of the webpage. This endpoint would return the article details if the article is created successfully or it would return 401 error if the user is not authenticated.
+# Endpoint to get the articles most similar to an article ("more like this"). The lists are precomputed by the related articles job and kept up to date when article vectors change, so this is a single read. Returns an empty list for articles that have no list yet and 404 if the article does not exist
+@router.get("/{article_id}/related", response_model=RelatedArticlesResponse, summary="Get articles similar to an article")
+def read_related_articles(
+    article_id: int,
+    limit: int = Query(10, ge=1, le=RELATED_ARTICLES_TOP_K),
+    db: Session = Depends(get_db)
+):
+    return get_related_articles(db, article_id, limit)
+
+# Endpoint to create a new article. This allows only authenticated users to create articles. The article details are passed in the request body in json format. The vector generation is queued for the vector workers (app.jobs.vector_worker) to avoid blocking the user from browsing the rest of the webpage. This endpoint would return the article details if the article is created successfully or it would return 401 error if the user is not authenticated.
 
 @router.post("/", response_model=ArticleResponse, status_code=201, summary="Create a new article")
 def create_article_endpoint(
     payload: ArticleCreateRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
     article = create_article(db, user_id, payload)
-
-    # Skip heavy background jobs during tests
-    if os.getenv("TESTING") != "1":
-        background_tasks.add_task(
-            create_article_vector_background,
-            article.article_id
-        )
+    enqueue_article_vector(db, article.article_id)
 
     return article
 
@@ -161,13 +165,12 @@ def fetch_saved_articles(
     return get_saved_articles_for_user(db, user_id,page, page_size)
 
 
-# Endpoint to update an article. User can only update the articles that he or she has created. return 401 if the user is not authenticated or not authorized to update the article. Also returns 404 if the article does not exist. The vector generation is done in the background to avoid blocking the user from browsing the rest of the webpage.
+# Endpoint to update an article. User can only update the articles that he or she has created. return 401 if the user is not authenticated or not authorized to update the article. Also returns 404 if the article does not exist. The vector generation is queued for the vector workers to avoid blocking the user from browsing the rest of the webpage, until it is done the vector of the previous text keeps serving and several quick edits are vectorized only once.
 
 @router.put("/{article_id}", response_model=ArticleUpdateResponse, summary="Update an article you authored")
 def edit_article(
     article_id: int,
     data: ArticleUpdateRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
@@ -189,10 +192,7 @@ def edit_article(
 
     article, tag_names = result
 
-    background_tasks.add_task(
-        create_article_vector_background,
-        article.article_id
-    )
+    enqueue_article_vector(db, article.article_id)
 
     return ArticleUpdateResponse(
         article_id=article.article_id,
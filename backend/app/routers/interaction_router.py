@@ -22,7 +22,7 @@ def add_interaction(
 def interaction_status(user_id: int,article_id: int,db: Session = Depends(get_db)):
     return get_interaction_status(db, user_id, article_id)
 
-# Endpoint to toggle an interaction (like, save) for a specific article. If the interaction already exists, it will be removed. If it does not exist, it will be created. This allows users to easily like or save an article with a single endpoint. This also marks the user as dirty therefore there is no need to update the user every time the user has clicked an article, they would be updated once they exit from the page
+# Endpoint to toggle an interaction (like, save) for a specific article. If the interaction already exists, it will be removed. If it does not exist, it will be created. This allows users to easily like or save an article with a single endpoint. The user vector is updated incrementally with just the toggled article so the recommendations stay current without recomputing the whole vector on every click
 @router.post("/toggle", response_model=InteractionToggleResponse, summary="Toggle an interaction (like, save) for a specific article")
 def toggle_interaction_route(
     data: InteractionToggleRequest,
@@ -1,23 +1,52 @@
+from typing import Literal, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from app.core.dependencies import get_db, get_current_user_id
-from app.schemas.search_schema import SearchResponse
+from app.core.config import SEARCH_TIME_BUDGET_MS
+from app.schemas.search_schema import SearchResponse, SearchSuggestResponse, SearchSuggestion
 from app.services.search_service import hybrid_search
+from app.services.search_suggest_service import suggest
 
 # This router handles the endpoint related to searching for articles based on keywords in the title, content, or tags. It uses a hybrid search approach that combines full-text search and tag-based search to provide relevant results to users.
 router = APIRouter(prefix="/search", tags=["Search"])
 
-# Endpoint to search for articles using keywords in the title, content, or tags. The search results are ranked based on relevance to the query and the user's interactions with articles
+# Endpoint to search for articles using keywords in the title, content, or tags. The search results are ranked based on relevance to the query and the user's interactions with articles. mode=lexical matches the words of the query, mode=semantic compares the TF-IDF vector of the query to the article vectors and mode=hybrid blends both. Returns page_size articles, the next_cursor of the response is passed back as cursor (with the same q and mode) to get the next page of the same ranking. Ranking is limited by a time budget (budget_ms can lower it), partial=true marks results that were cut short by it
 @router.get("", response_model=SearchResponse)
 def search_articles(
     q: str = Query(..., min_length=2),
+    mode: Literal["lexical", "semantic", "hybrid"] = Query("lexical"),
+    page_size: int = Query(5, ge=1, le=50),
+    cursor: Optional[str] = Query(None, max_length=200),
+    budget_ms: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
-    data = hybrid_search(db=db, query=q, user_id=user_id)
+    # A client can only lower the configured time budget
+    if budget_ms is not None and SEARCH_TIME_BUDGET_MS > 0:
+        budget_ms = min(budget_ms, SEARCH_TIME_BUDGET_MS)
+
+    data = hybrid_search(db=db, query=q, user_id=user_id, limit=page_size, mode=mode, cursor=cursor, budget_ms=budget_ms)
 
     return SearchResponse(
         articles=data["articles"],
-        users=data["users"]
+        users=data["users"],
+        next_cursor=data["next_cursor"],
+        partial=data["partial"]
     )
 
+
+
+# Endpoint for the autocomplete of the search box. Returns the most popular article titles, tags and user names that have a word starting with the typed text, served from memory so it can be called on every keystroke
+@router.get("/suggest", response_model=SearchSuggestResponse)
+def suggest_search_terms(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(5, ge=1, le=10),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    return SearchSuggestResponse(
+        suggestions=[
+            SearchSuggestion(kind=kind, id=item_id, text=text)
+            for kind, item_id, text in suggest(db, q, limit)
+        ]
+    )
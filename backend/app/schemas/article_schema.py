@@ -70,6 +70,19 @@ class PaginatedArticleRecommendationResponse(BaseModel):
         from_attributes = True
 
 
+class RelatedArticleResponse(BaseModel):
+    article_id: int
+    title: str
+    author_username: str
+    created_at: datetime
+    score: float
+
+
+class RelatedArticlesResponse(BaseModel):
+    article_id: int
+    articles: List[RelatedArticleResponse]
+
+
 class SavedArticleResponse(BaseModel):
     article_id: int
     likes : int
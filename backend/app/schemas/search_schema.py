@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -19,6 +19,20 @@ class SearchUserResponse(BaseModel):
     bio: str | None
 
 
+# next_cursor fetches the following page of articles, None on the last page. users are only listed on the first page. partial is true when the time budget ran out before every candidate was scored
 class SearchResponse(BaseModel):
     articles: List[SearchArticleResponse]
     users: List[SearchUserResponse]
+    next_cursor: Optional[str] = None
+    partial: bool = False
+
+
+# kind is "article", "tag" or "user", id is the article_id, tag_id or user_id
+class SearchSuggestion(BaseModel):
+    kind: str
+    id: int
+    text: str
+
+
+class SearchSuggestResponse(BaseModel):
+    suggestions: List[SearchSuggestion]
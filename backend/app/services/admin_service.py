@@ -3,11 +3,17 @@ from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.models.user_model import User
-from app.models.article_model import Article, ArticleTag, ArticleStat, Tag
+from app.models.article_model import Article, ArticleTag, ArticleStat, Tag, ArticleSearchDocument
 from app.models.interaction_model import UserInteraction
-from app.models.vector_model import ArticleVector, UserVector
-from app.models.user_model import UserRecommendationCache
+from app.models.vector_model import ArticleVector, UserVector, ArticleNeighbours
+from app.models.user_model import UserRecommendationList
 from app.models.admin_model import AdminActionLog
+from app.services.article_index_service import invalidate_article_index
+from app.services.recommendation_cache_service import forget_user_ranked_lists
+from app.services.user_vector_service import mark_interacting_users_dirty
+from app.services.search_index_service import remove_search_documents
+from app.services.user_search_service import remove_user_name
+from app.services.search_suggest_service import remove_article_suggestions, remove_user_suggestion, remove_tag_suggestion
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -51,6 +57,7 @@ def admin_delete_tag(
 
         db.delete(tag)
         db.commit()
+        remove_tag_suggestion(tag_id)
 
         logger.info(
             f"Tag {tag_id} deleted by admin {admin_user_id} | reason={reason}"
@@ -114,6 +121,9 @@ def admin_delete_article(
             ArticleTag.article_id == article_id
         ).delete()
 
+        # The likes and saves of the article are in the running sums of its users, they are rebuilt without it
+        mark_interacting_users_dirty(db, [article_id])
+
         db.query(UserInteraction).filter(
             UserInteraction.article_id == article_id
         ).delete()
@@ -122,16 +132,23 @@ def admin_delete_article(
             ArticleVector.article_id == article_id
         ).delete()
 
-        db.query(ArticleStat).filter(
-            ArticleStat.article_id == article_id
+        db.query(ArticleNeighbours).filter(
+            ArticleNeighbours.article_id == article_id
         ).delete()
 
-        db.query(UserRecommendationCache).filter(
-            UserRecommendationCache.article_id == article_id
+        db.query(ArticleSearchDocument).filter(
+            ArticleSearchDocument.article_id == article_id
+        ).delete()
+
+        db.query(ArticleStat).filter(
+            ArticleStat.article_id == article_id
         ).delete()
 
         db.delete(article)
         db.commit()
+        invalidate_article_index()
+        remove_search_documents(db, [article_id])
+        remove_article_suggestions([article_id])
 
         logger.info(
             f"Article {article_id} deleted by admin {admin_user_id}"
@@ -204,6 +221,8 @@ def admin_delete_user(
                 ArticleTag.article_id.in_(user_article_ids)
             ).delete(synchronize_session=False)
 
+            mark_interacting_users_dirty(db, user_article_ids)
+
             db.query(UserInteraction).filter(
                 UserInteraction.article_id.in_(user_article_ids)
             ).delete(synchronize_session=False)
@@ -212,12 +231,16 @@ def admin_delete_user(
                 ArticleVector.article_id.in_(user_article_ids)
             ).delete(synchronize_session=False)
 
-            db.query(ArticleStat).filter(
-                ArticleStat.article_id.in_(user_article_ids)
+            db.query(ArticleNeighbours).filter(
+                ArticleNeighbours.article_id.in_(user_article_ids)
             ).delete(synchronize_session=False)
 
-            db.query(UserRecommendationCache).filter(
-                UserRecommendationCache.article_id.in_(user_article_ids)
+            db.query(ArticleSearchDocument).filter(
+                ArticleSearchDocument.article_id.in_(user_article_ids)
+            ).delete(synchronize_session=False)
+
+            db.query(ArticleStat).filter(
+                ArticleStat.article_id.in_(user_article_ids)
             ).delete(synchronize_session=False)
 
             db.query(Article).filter(
@@ -233,12 +256,18 @@ def admin_delete_user(
             UserVector.user_id == target_user_id
         ).delete(synchronize_session=False)
 
-        db.query(UserRecommendationCache).filter(
-            UserRecommendationCache.user_id == target_user_id
+        db.query(UserRecommendationList).filter(
+            UserRecommendationList.user_id == target_user_id
         ).delete(synchronize_session=False)
 
         db.delete(user)
         db.commit()
+        invalidate_article_index()
+        forget_user_ranked_lists(target_user_id)
+        remove_search_documents(db, user_article_ids)
+        remove_user_name(db, target_user_id)
+        remove_article_suggestions(user_article_ids)
+        remove_user_suggestion(target_user_id)
 
         logger.info(
             f"User {target_user_id} deleted by admin {admin_user_id}"
@@ -0,0 +1,583 @@
+import math
+import threading
+import time
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.vector_model import ArticleVector
+from app.ml.model_store import LEGACY_VERSION, ModelBundle, get_active_version, load_model_bundle
+from app.utils.vector_utils import read_sparse_vector, unpack_embedding
+from app.core.config import (
+    ARTICLE_INDEX_REFRESH_SECONDS,
+    RECOMMENDATION_EMBEDDING_MODE,
+    RECOMMENDATION_ANN_MIN_CORPUS,
+    RECOMMENDATION_ANN_PROBE_TERMS,
+    RECOMMENDATION_ANN_CANDIDATES
+)
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+# Weights of the text and tag similarity in the final recommendation score
+TEXT_WEIGHT = 0.7
+TAG_WEIGHT = 0.3
+
+# Number of rows streamed from the database at once while building the index
+BUILD_BATCH_SIZE = 1000
+
+
+"""
+This service keeps a process-wide, in-memory index of all the article vectors. The text and tag vectors of every article are stored as two CSR matrices whose rows are L2 normalized, so the cosine similarity between a user and every article in the corpus is a single sparse matrix-vector product per vector type instead of a python loop over JSON decoded dictionaries. The index is built lazily on first use and is rebuilt whenever the vectors in the database change.
+
+In the dense embedding mode the index also holds an (articles x dimensions) float32 matrix of SVD embeddings and every score is a BLAS matrix product against it, the sparse matrices are kept for the candidate stage and the exact lookups.
+"""
+class ArticleVectorIndex:
+    def __init__(
+        self,
+        article_ids: np.ndarray,
+        text_matrix: sparse.csr_matrix,
+        tag_matrix: sparse.csr_matrix,
+        signature: tuple,
+        embeddings: np.ndarray | None = None,
+        embedding_model=None,
+        model_version: str = LEGACY_VERSION,
+        vector_versions: np.ndarray | None = None
+    ):
+        self.article_ids = article_ids
+        self.row_of = {
+            article_id: row
+            for row, article_id in enumerate(article_ids.tolist())
+        }
+        self.text_matrix = text_matrix
+        self.tag_matrix = tag_matrix
+        self.signature = signature
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+
+        # Model version the vectors were computed with, query vectors compared to the index must come from the same version
+        self.model_version = model_version
+
+        # vector_version of every row, lets a write in this process patch its rows in and still account for the corpus signature
+        self.vector_versions = vector_versions if vector_versions is not None else np.zeros(len(article_ids), dtype=np.int64)
+
+        # Column-major copies of the text and tag matrices, i.e. the term -> articles postings lists, only built when the candidate stage is used. The index is shared by every request thread, the pair is built once under the lock and published in one assignment
+        self._postings = None
+        self._postings_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.article_ids)
+
+    # Rows of the given articles that are in the index
+    def rows_of_articles(self, article_ids) -> np.ndarray:
+        return np.fromiter(
+            (self.row_of[article_id] for article_id in article_ids if article_id in self.row_of),
+            dtype=np.int64
+        )
+
+    # Projects one user onto the embedding space, zeros when the user has no vectors
+    def embed_user(self, text_vec: dict, tag_vec: dict) -> np.ndarray:
+        components = self.embedding_model.components_
+        text_dim = self.text_matrix.shape[1]
+        embedding = np.zeros(components.shape[0], dtype=np.float32)
+
+        user_text = dense_unit_vector(text_vec, text_dim)
+        user_tag = dense_unit_vector(tag_vec, self.tag_matrix.shape[1])
+
+        if user_text is not None:
+            embedding += math.sqrt(TEXT_WEIGHT) * (components[:, :text_dim] @ user_text)
+
+        if user_tag is not None:
+            embedding += math.sqrt(TAG_WEIGHT) * (components[:, text_dim:] @ user_tag)
+
+        return embedding
+
+    # Scores every article in the index against the given user vectors, returns an array aligned with article_ids
+    def score(self, text_vec: dict, tag_vec: dict) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+
+        if len(self) == 0:
+            return scores
+
+        if self.embeddings is not None:
+            return self.embeddings @ self.embed_user(text_vec, tag_vec)
+
+        user_text = dense_unit_vector(text_vec, self.text_matrix.shape[1])
+        user_tag = dense_unit_vector(tag_vec, self.tag_matrix.shape[1])
+
+        if user_text is not None:
+            scores += TEXT_WEIGHT * (self.text_matrix @ user_text)
+
+        if user_tag is not None:
+            scores += TAG_WEIGHT * (self.tag_matrix @ user_tag)
+
+        return scores
+
+    # Exact scores of a subset of rows, aligned with the given rows
+    def score_rows(self, rows: np.ndarray, text_vec: dict, tag_vec: dict) -> np.ndarray:
+        scores = np.zeros(len(rows), dtype=np.float32)
+
+        if len(rows) == 0:
+            return scores
+
+        if self.embeddings is not None:
+            return self.embeddings[rows] @ self.embed_user(text_vec, tag_vec)
+
+        user_text = dense_unit_vector(text_vec, self.text_matrix.shape[1])
+        user_tag = dense_unit_vector(tag_vec, self.tag_matrix.shape[1])
+
+        if user_text is not None:
+            scores += TEXT_WEIGHT * (self.text_matrix[rows] @ user_text)
+
+        if user_tag is not None:
+            scores += TAG_WEIGHT * (self.tag_matrix[rows] @ user_tag)
+
+        return scores
+
+    # Cosine similarity of a TF-IDF query vector to the text vector of every article in one sparse matrix product, returns the ids and similarities of the top_n most similar articles that share at least one term with the query
+    def search_text(self, text_vec: dict, top_n: int) -> tuple[np.ndarray, np.ndarray]:
+        query = dense_unit_vector(text_vec, self.text_matrix.shape[1])
+
+        if query is None or len(self) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        scores = self.text_matrix @ query
+        scores[scores <= 0] = -np.inf
+
+        rows = top_k_rows(scores, top_n)
+        return self.article_ids[rows], scores[rows]
+
+    def _postings_lists(self) -> tuple[sparse.csc_matrix, sparse.csc_matrix]:
+        postings = self._postings
+        if postings is not None:
+            return postings
+
+        with self._postings_lock:
+            if self._postings is None:
+                self._postings = (self.text_matrix.tocsc(), self.tag_matrix.tocsc())
+
+            return self._postings
+
+    # Approximate nearest neighbour candidate stage. Only the probe_terms heaviest dimensions of each user vector are looked up in the term -> articles postings, the partial dot products over those dimensions are accumulated per article and the max_candidates best articles are returned for exact scoring. More probe terms and candidates raise the recall at the cost of latency
+    def candidate_rows(
+        self,
+        text_vec: dict,
+        tag_vec: dict,
+        probe_terms: int = RECOMMENDATION_ANN_PROBE_TERMS,
+        max_candidates: int = RECOMMENDATION_ANN_CANDIDATES
+    ) -> np.ndarray:
+        text_postings, tag_postings = self._postings_lists()
+
+        rows = []
+        partials = []
+
+        for weight, postings, vec in (
+            (TEXT_WEIGHT, text_postings, text_vec),
+            (TAG_WEIGHT, tag_postings, tag_vec),
+        ):
+            user = dense_unit_vector(vec, postings.shape[1])
+            if user is None:
+                continue
+
+            terms = np.flatnonzero(user)
+            if len(terms) > probe_terms:
+                terms = terms[np.argpartition(-user[terms], probe_terms - 1)[:probe_terms]]
+
+            for term in terms:
+                start, end = postings.indptr[term], postings.indptr[term + 1]
+                rows.append(postings.indices[start:end])
+                partials.append(weight * user[term] * postings.data[start:end])
+
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+
+        candidate_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        partial_scores = np.bincount(inverse, weights=np.concatenate(partials))
+
+        if len(candidate_rows) > max_candidates:
+            best = np.argpartition(-partial_scores, max_candidates - 1)[:max_candidates]
+            candidate_rows = candidate_rows[best]
+
+        return candidate_rows
+
+    # Ranks the corpus for one user and returns the article ids of the top_n articles. Large corpora go through the candidate stage and only the candidates are scored exactly, small ones are scored exhaustively
+    def rank(
+        self,
+        text_vec: dict,
+        tag_vec: dict,
+        top_n: int,
+        exclude_article_ids=(),
+        use_ann: bool | None = None
+    ) -> np.ndarray:
+        if use_ann is None:
+            use_ann = self.embeddings is None and len(self) >= RECOMMENDATION_ANN_MIN_CORPUS
+
+        if use_ann:
+            rows = self.candidate_rows(text_vec, tag_vec)
+            scores = self.score_rows(rows, text_vec, tag_vec)
+        else:
+            rows = np.arange(len(self))
+            scores = self.score(text_vec, tag_vec)
+
+        excluded = [
+            self.row_of[article_id]
+            for article_id in exclude_article_ids
+            if article_id in self.row_of
+        ]
+
+        if excluded:
+            scores[np.isin(rows, excluded)] = -np.inf
+
+        return self.article_ids[rows[top_k_rows(scores, top_n)]]
+
+    # Scores a block of users at once with one sparse matrix-matrix product per vector type. The user matrices must be row-normalized with the same dimensions as the index, returns a dense (users x articles) array
+    def score_block(self, user_text: sparse.csr_matrix, user_tag: sparse.csr_matrix) -> np.ndarray:
+        scores = np.zeros((user_text.shape[0], len(self)), dtype=np.float32)
+
+        if len(self) == 0:
+            return scores
+
+        if self.embeddings is not None:
+            return embed_rows(user_text, user_tag, self.embedding_model) @ self.embeddings.T
+
+        scores += TEXT_WEIGHT * (user_text @ self.text_matrix.T).toarray()
+        scores += TAG_WEIGHT * (user_tag @ self.tag_matrix.T).toarray()
+
+        return scores
+
+
+# Converts a sparse {index: value} vector into a dense L2 normalized numpy array, returns None for empty vectors
+def dense_unit_vector(vec: dict, dim: int) -> np.ndarray | None:
+    if not vec:
+        return None
+
+    indices = np.fromiter(vec.keys(), dtype=np.int64, count=len(vec))
+    values = np.fromiter(vec.values(), dtype=np.float32, count=len(vec))
+
+    in_range = indices < dim
+    dense = np.zeros(dim, dtype=np.float32)
+    dense[indices[in_range]] = values[in_range]
+
+    norm = np.linalg.norm(dense)
+    if norm == 0:
+        return None
+
+    return dense / norm
+
+
+# Returns the rows of the k highest scores in descending score order. argpartition selects the top k in linear time so only those k rows are sorted instead of the whole corpus, rows scored -inf are never returned
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    valid = np.flatnonzero(np.isfinite(scores))
+
+    if k <= 0 or len(valid) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if len(valid) > k:
+        partition = np.argpartition(-scores[valid], k - 1)[:k]
+        valid = valid[partition]
+
+    # Ties are broken by row so the ranking is deterministic
+    order = np.lexsort((valid, -scores[valid]))
+    return valid[order]
+
+
+# Stacks the text and tag rows side by side scaled by the square roots of their weights. The dot product of two such rows is exactly the blended recommendation score, so a projection fit on this space approximates that score
+def weighted_feature_matrix(text_rows: sparse.csr_matrix, tag_rows: sparse.csr_matrix) -> sparse.csr_matrix:
+    return sparse.hstack(
+        [math.sqrt(TEXT_WEIGHT) * text_rows, math.sqrt(TAG_WEIGHT) * tag_rows],
+        format="csr"
+    )
+
+
+# Projects row normalized text and tag rows onto the dense embedding space, this is TruncatedSVD.transform without the input validation
+def embed_rows(text_rows: sparse.csr_matrix, tag_rows: sparse.csr_matrix, model) -> np.ndarray:
+    features = weighted_feature_matrix(text_rows, tag_rows)
+    return np.asarray(features @ model.components_.T, dtype=np.float32)
+
+
+# Returns the embedding projection of the bundle when the dense mode is configured and a projection has been fit, None otherwise
+def get_active_embedding_model(bundle: ModelBundle):
+    if RECOMMENDATION_EMBEDDING_MODE != "dense":
+        return None
+
+    return bundle.embedding_model
+
+
+# Normalizes every row of a CSR matrix to unit length in place, empty rows are left as zeros
+def normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    row_norms = np.sqrt(
+        np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+    )
+    row_norms[row_norms == 0] = 1.0
+    matrix.data /= np.repeat(row_norms, np.diff(matrix.indptr)).astype(matrix.dtype)
+    return matrix
+
+
+# Model version of the most vectors, the index serves that version. During a rollout the served vectors all stay on the previous version until the promotion replaces them in one statement, so other versions only show up for the few articles written around the switch, and those are re-queued by the promotion
+def _served_model_version(db: Session) -> str:
+    version_counts = (
+        db.query(_model_version_column(), func.count(ArticleVector.article_id))
+        .group_by(_model_version_column())
+        .all()
+    )
+
+    if not version_counts:
+        return get_active_version()
+
+    version, _ = max(version_counts, key=lambda item: item[1])
+    return version
+
+
+def _model_version_column():
+    return func.coalesce(ArticleVector.model_version, LEGACY_VERSION)
+
+
+# Cheap aggregate that changes whenever a vector is created, updated or deleted, used to detect when the index is out of date
+def _corpus_signature(db: Session) -> tuple:
+    count, version_sum, max_id = db.query(
+        func.count(ArticleVector.article_id),
+        func.coalesce(func.sum(ArticleVector.vector_version), 0),
+        func.coalesce(func.max(ArticleVector.article_id), 0)
+    ).one()
+
+    return int(count), int(version_sum), int(max_id)
+
+
+# Accumulates packed/JSON sparse vectors row by row and builds a row-normalized CSR matrix out of them
+class SparseMatrixBuilder:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.indptr = [0]
+        self.indices = []
+        self.values = []
+
+    def append(self, packed: bytes | None, vec_json: str | None):
+        indices, values, _ = read_sparse_vector(packed, vec_json)
+        self.indices.append(indices)
+        self.values.append(values)
+        self.indptr.append(self.indptr[-1] + len(indices))
+
+    def build(self) -> sparse.csr_matrix:
+        indices = np.concatenate(self.indices) if self.indices else np.zeros(0, dtype=np.int32)
+        values = np.concatenate(self.values) if self.values else np.zeros(0, dtype=np.float32)
+
+        matrix = sparse.csr_matrix(
+            (values, indices, np.asarray(self.indptr, dtype=np.int64)),
+            shape=(len(self.indptr) - 1, self.dim)
+        )
+        # read_sparse_vector already dropped repeated indices, last value wins, so there is nothing to sum, only the column order to fix
+        matrix.sort_indices()
+        return normalize_rows(matrix)
+
+
+# Stacks the stored article embeddings into one matrix, articles without an embedding (or with one from a projection of another width) are projected from their sparse rows
+def _embedding_matrix(stored_embeddings: list, text_matrix, tag_matrix, model) -> np.ndarray:
+    dim = model.components_.shape[0]
+    embeddings = np.zeros((len(stored_embeddings), dim), dtype=np.float32)
+    missing = []
+
+    for row, embedding in enumerate(stored_embeddings):
+        if embedding is not None and len(embedding) == dim:
+            embeddings[row] = embedding
+        else:
+            missing.append(row)
+
+    if missing:
+        embeddings[missing] = embed_rows(text_matrix[missing], tag_matrix[missing], model)
+        logger.info(f"article_index_embeddings_projected articles={len(missing)}")
+
+    return embeddings
+
+
+# Reads the given vector rows into (article ids, vector versions, text matrix, tag matrix, embeddings or None), rows in article id order
+def _read_vector_rows(query, bundle, embedding_model):
+    text_builder = SparseMatrixBuilder(len(bundle.text_vectorizer.vocabulary_))
+    tag_builder = SparseMatrixBuilder(len(bundle.tag_vectorizer.vocabulary_))
+    article_ids = []
+    vector_versions = []
+    stored_embeddings = []
+
+    rows = (
+        query.with_entities(
+            ArticleVector.article_id,
+            ArticleVector.vector_version,
+            ArticleVector.text_vector_packed,
+            ArticleVector.text_vector,
+            ArticleVector.tag_vector_packed,
+            ArticleVector.tag_vector,
+            ArticleVector.embedding
+        )
+        .order_by(ArticleVector.article_id)
+        .yield_per(BUILD_BATCH_SIZE)
+    )
+
+    for article_id, vector_version, text_packed, text_json, tag_packed, tag_json, embedding in rows:
+        article_ids.append(article_id)
+        vector_versions.append(vector_version or 0)
+        text_builder.append(text_packed, text_json)
+        tag_builder.append(tag_packed, tag_json)
+        stored_embeddings.append(unpack_embedding(embedding))
+
+    text_matrix = text_builder.build()
+    tag_matrix = tag_builder.build()
+    embeddings = None
+
+    if embedding_model is not None:
+        embeddings = _embedding_matrix(stored_embeddings, text_matrix, tag_matrix, embedding_model)
+
+    return (
+        np.asarray(article_ids, dtype=np.int64),
+        np.asarray(vector_versions, dtype=np.int64),
+        text_matrix,
+        tag_matrix,
+        embeddings
+    )
+
+
+def _build_index(db: Session, signature: tuple) -> ArticleVectorIndex:
+    started = time.perf_counter()
+    model_version = _served_model_version(db)
+    bundle = load_model_bundle(model_version)
+
+    embedding_model = get_active_embedding_model(bundle)
+    if embedding_model is None and RECOMMENDATION_EMBEDDING_MODE == "dense":
+        logger.warning("article_index_embedding_model_missing falling_back=sparse")
+
+    article_ids, vector_versions, text_matrix, tag_matrix, embeddings = _read_vector_rows(
+        db.query(ArticleVector).filter(_model_version_column() == model_version),
+        bundle,
+        embedding_model
+    )
+
+    index = ArticleVectorIndex(
+        article_ids=article_ids,
+        text_matrix=text_matrix,
+        tag_matrix=tag_matrix,
+        signature=signature,
+        embeddings=embeddings,
+        embedding_model=embedding_model,
+        model_version=model_version,
+        vector_versions=vector_versions
+    )
+
+    logger.info(
+        f"article_index_built articles={len(index)} model_version={model_version} "
+        f"text_nnz={index.text_matrix.nnz} tag_nnz={index.tag_matrix.nnz} "
+        f"embedding_dim={0 if embeddings is None else embeddings.shape[1]} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+    if len(index) < signature[0]:
+        logger.warning(f"article_index_other_versions_skipped articles={signature[0] - len(index)}")
+
+    return index
+
+
+# A copy of the index with the rows of the given articles replaced by the given rows (articles without a new row are removed), rows stay in article id order
+def _patched_index(index: ArticleVectorIndex, article_ids: list[int], rows: tuple, signature: tuple) -> ArticleVectorIndex:
+    new_ids, new_versions, new_text, new_tag, new_embeddings = rows
+
+    keep = np.flatnonzero(~np.isin(index.article_ids, article_ids))
+    combined_ids = np.concatenate([index.article_ids[keep], new_ids])
+    order = np.argsort(combined_ids, kind="stable")
+
+    embeddings = None
+    if index.embeddings is not None:
+        embeddings = np.concatenate([index.embeddings[keep], new_embeddings])[order]
+
+    return ArticleVectorIndex(
+        article_ids=combined_ids[order],
+        text_matrix=sparse.vstack([index.text_matrix[keep], new_text], format="csr")[order],
+        tag_matrix=sparse.vstack([index.tag_matrix[keep], new_tag], format="csr")[order],
+        signature=signature,
+        embeddings=embeddings,
+        embedding_model=index.embedding_model,
+        model_version=index.model_version,
+        vector_versions=np.concatenate([index.vector_versions[keep], new_versions])[order]
+    )
+
+
+_index: ArticleVectorIndex | None = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+# Returns the process-wide article index, building it on first use and rebuilding it when the vectors in the database have changed since the last check
+def get_article_index(db: Session) -> ArticleVectorIndex:
+    global _index, _index_checked_at
+
+    if _index is not None and time.monotonic() - _index_checked_at < ARTICLE_INDEX_REFRESH_SECONDS:
+        return _index
+
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked_at < ARTICLE_INDEX_REFRESH_SECONDS:
+            return _index
+
+        signature = _corpus_signature(db)
+
+        if _index is None or _index.signature != signature:
+            _index = _build_index(db, signature)
+
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+# Called after this process wrote the vectors of the given articles. Instead of rebuilding the index from every vector in the database only those rows are read and patched into a copy of the index, which then replaces it. That is only done when the change of the corpus signature is exactly the change of these rows, otherwise another process wrote vectors as well and the next request rebuilds the index as usual
+def refresh_article_index_rows(db: Session, article_ids: list[int]):
+    global _index, _index_checked_at
+
+    with _index_lock:
+        index = _index
+
+        if index is None:
+            return
+
+        started = time.perf_counter()
+        bundle = load_model_bundle(index.model_version)
+
+        rows = _read_vector_rows(
+            db.query(ArticleVector).filter(
+                ArticleVector.article_id.in_(article_ids),
+                _model_version_column() == index.model_version
+            ),
+            bundle,
+            index.embedding_model
+        )
+        signature = _corpus_signature(db)
+
+        new_ids, new_versions = rows[0], rows[1]
+        old_rows = index.rows_of_articles(article_ids)
+        old_count, old_version_sum, old_max_id = index.signature
+
+        expected = (
+            old_count - len(old_rows) + len(new_ids),
+            old_version_sum - int(index.vector_versions[old_rows].sum()) + int(new_versions.sum()),
+            max([old_max_id, *new_ids.tolist()])
+        )
+
+        if signature != expected:
+            _index_checked_at = 0.0
+            logger.info(f"article_index_patch_skipped articles={len(article_ids)} reason=other_changes")
+            return
+
+        _index = _patched_index(index, article_ids, rows, signature)
+        _index_checked_at = time.monotonic()
+
+        logger.info(
+            f"article_index_patched articles={len(article_ids)} "
+            f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+        )
+
+
+# Called after an article vector is written or deleted in this process so the next request re-checks the database instead of waiting for the refresh interval
+def invalidate_article_index():
+    global _index_checked_at
+    _index_checked_at = 0.0
+
+
+# Drops the index entirely, the next request rebuilds it from scratch
+def reset_article_index():
+    global _index, _index_checked_at
+
+    with _index_lock:
+        _index = None
+        _index_checked_at = 0.0
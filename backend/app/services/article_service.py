@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
-from app.models.article_model import Article, ArticleTag, Tag, ArticleStat
-from app.models.vector_model import ArticleVector
+from app.models.article_model import Article, ArticleTag, Tag, ArticleStat, ArticleSearchDocument
+from app.models.vector_model import ArticleVector, ArticleNeighbours
 from app.models.user_model import User
 from app.models.interaction_model import UserInteraction
 import math
@@ -8,6 +8,11 @@ from app.schemas.article_schema import ArticleReadResponse, ArticleCreateRequest
 from sqlalchemy import func, desc, asc
 from fastapi import HTTPException, status
 from datetime import datetime
+from app.services.article_index_service import invalidate_article_index
+from app.services.user_vector_service import mark_interacting_users_dirty
+from app.services.search_index_service import refresh_search_document, remove_search_documents
+from app.services.search_document_service import write_search_document
+from app.services.search_suggest_service import refresh_article_suggestions, remove_article_suggestions
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -126,8 +131,14 @@ def create_article(
 
         db.add(ArticleStat(article_id=article.article_id))
 
+        # The search data is tokenized once here instead of on every search index build
+        author_name = db.query(User.user_name).filter(User.user_id == author_id).scalar()
+        write_search_document(db, article, author_name)
+
         db.commit()
         db.refresh(article)
+        refresh_search_document(db, article.article_id)
+        refresh_article_suggestions(db, article.article_id)
 
         logger.info(f"article_created article_id={article.article_id}")
         return article
@@ -388,11 +399,18 @@ def delete_article(db: Session, article_id: int, user_id: int):
     # delete dependent rows first
     db.query(ArticleStat).filter(ArticleStat.article_id == article_id).delete()
     db.query(ArticleVector).filter(ArticleVector.article_id == article_id).delete()
+    db.query(ArticleNeighbours).filter(ArticleNeighbours.article_id == article_id).delete()
+    db.query(ArticleSearchDocument).filter(ArticleSearchDocument.article_id == article_id).delete()
     db.query(ArticleTag).filter(ArticleTag.article_id == article_id).delete()
+    # The likes and saves of the article are still in the running sums of these users
+    mark_interacting_users_dirty(db, [article_id])
     db.query(UserInteraction).filter(UserInteraction.article_id == article_id).delete()
 
     db.delete(article)
     db.commit()
+    invalidate_article_index()
+    remove_search_documents(db, [article_id])
+    remove_article_suggestions([article_id])
     logger.info(f"article_deleted article_id={article_id}")
 
     return {"message": "Article deleted successfully"}
@@ -524,8 +542,6 @@ def update_article(
             ArticleTag.article_id == article_id
         ).delete()
 
-        logger.info(f"article_vector_invalidated article_id={article_id}")
-
         tag_objects = []
 
         for tag_name in cleaned_tags:
@@ -546,11 +562,13 @@ def update_article(
                 )
             )
 
-        db.query(ArticleVector).filter(
-            ArticleVector.article_id == article.article_id
-        ).delete()
+        # The vector of the old text keeps serving recommendations and related articles until the router's re-vectorization job replaces it
+        author_name = db.query(User.user_name).filter(User.user_id == user_id).scalar()
+        write_search_document(db, article, author_name)
 
         db.commit()
+        refresh_search_document(db, article_id)
+        refresh_article_suggestions(db, article_id)
         logger.info(f"article_updated article_id={article_id}")
         db.refresh(article)
 
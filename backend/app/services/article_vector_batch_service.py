@@ -0,0 +1,282 @@
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal, engine
+from app.models.article_model import Article, ArticleTag, Tag
+from app.models.vector_model import ArticleVector
+from app.services.article_vector_service import article_vector_columns, MAX_TEXT_CHARS
+from app.services.article_index_service import invalidate_article_index
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Batch (re-)vectorization of the articles, e.g. after the vectorizers were refit or to fill in the vectors of articles that have none. The articles are read in primary key order one block at a time (keyset pagination, so the blocks written meanwhile never hold a read cursor open), every block is transformed with one call per vectorizer and written with one bulk upsert of the ArticleVector rows, committed per block. The upsert only replaces a vector whose version is still the one read with the content, so a vector the vector worker wrote from a newer edit meanwhile is kept and never fails the block. Blocks can be spread over a pool of worker processes. After every block that completed together with all blocks before it, the highest article id done so far is written to a checkpoint file, so a stopped run continues after it instead of starting over.
+"""
+
+
+# insert ... on conflict (article_id) do update of every column written by the block. Every row carries the vector_version its vector gets, one past the version read together with the content it was computed from (1 for an article that had no vector), and the update only applies while the stored version is still the one read. A vector the vector worker or create_article_vector stored in the meantime comes from content at least as new, it is kept instead of being overwritten with the older one, and a row inserted meanwhile no longer fails the block with an IntegrityError. None on dialects without an upsert
+def _upsert_statement(db: Session, keys):
+    dialect = db.bind.dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(ArticleVector)
+
+    return statement.on_conflict_do_update(
+        index_elements=[ArticleVector.article_id],
+        set_={key: statement.excluded[key] for key in keys if key != "article_id"},
+        where=func.coalesce(ArticleVector.vector_version, 0) + 1 == statement.excluded.vector_version
+    )
+
+
+# Without an upsert the existing rows are updated under the same version guard and the new ones inserted, a row another writer inserted meanwhile is kept
+def _write_article_vectors(db: Session, mappings: list[dict]):
+    existing = {
+        article_id for (article_id,) in
+        db.query(ArticleVector.article_id)
+        .filter(ArticleVector.article_id.in_([mapping["article_id"] for mapping in mappings]))
+        .all()
+    }
+
+    for mapping in mappings:
+        if mapping["article_id"] in existing:
+            db.query(ArticleVector).filter(
+                ArticleVector.article_id == mapping["article_id"],
+                func.coalesce(ArticleVector.vector_version, 0) + 1 == mapping["vector_version"]
+            ).update(
+                {key: value for key, value in mapping.items() if key != "article_id"},
+                synchronize_session=False
+            )
+            continue
+
+        try:
+            with db.begin_nested():
+                db.execute(insert(ArticleVector), [mapping])
+
+        except IntegrityError:
+            logger.info(f"article_vector_write_skipped article_id={mapping['article_id']} reason=written_concurrently")
+
+
+# vector_version of the stored vector of every article that has one, 0 for the rows written before versions existed
+def read_vector_versions(db: Session, article_ids: list[int]) -> dict[int, int]:
+    return {
+        article_id: version or 0 for article_id, version in
+        db.query(ArticleVector.article_id, ArticleVector.vector_version)
+        .filter(ArticleVector.article_id.in_(article_ids))
+        .all()
+    }
+
+
+# Writes the vectors of one block of (article_id, content) rows, returns the number of vectors written. versions holds the vector_version of every article as read together with its content (read_vector_versions), a vector that changed since then is left alone. When it is not given the versions are read here, after the content. staged_only only writes the staged columns of the model version being rolled out into the existing rows, the served vectors and their version stay untouched so the running indexes keep serving them
+def vectorize_article_block(
+    db: Session,
+    rows: list[tuple[int, str]],
+    staged_only: bool = False,
+    versions: dict[int, int] | None = None
+) -> int:
+    if not rows:
+        return 0
+
+    article_ids = [article_id for article_id, _ in rows]
+
+    if versions is None and not staged_only:
+        versions = read_vector_versions(db, article_ids)
+
+    tags_of = defaultdict(list)
+    for article_id, tag_name in (
+        db.query(ArticleTag.article_id, Tag.tag_name)
+        .join(Tag, ArticleTag.tag_id == Tag.tag_id)
+        .filter(ArticleTag.article_id.in_(article_ids))
+        .all()
+    ):
+        tags_of[article_id].append(tag_name)
+
+    columns = article_vector_columns(
+        [content for _, content in rows],
+        [" ".join(tags_of[article_id]) for article_id in article_ids],
+        staged_only=staged_only
+    )
+
+    if staged_only:
+        db.bulk_update_mappings(ArticleVector, [
+            {"article_id": article_id, **values}
+            for article_id, values in zip(article_ids, columns)
+        ])
+        db.commit()
+        return len(rows)
+
+    mappings = [
+        {"article_id": article_id, **values, "vector_version": versions.get(article_id, 0) + 1}
+        for article_id, values in zip(article_ids, columns)
+    ]
+
+    statement = _upsert_statement(db, mappings[0].keys())
+
+    if statement is not None:
+        db.execute(statement, mappings)
+    else:
+        _write_article_vectors(db, mappings)
+
+    db.commit()
+    return len(rows)
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after the fork
+    engine.dispose(close=False)
+
+
+def _run_block(rows: list[tuple[int, str]], staged_only: bool = False, versions: dict[int, int] | None = None) -> int:
+    db = SessionLocal()
+
+    try:
+        return vectorize_article_block(db, rows, staged_only, versions)
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"article_vectors_block_failed first_article_id={rows[0][0]}")
+        raise
+
+    finally:
+        db.close()
+
+
+# Walks the (article_id, content) rows after the given article id in primary key order one block at a time, only the vectorized start of the content is read. Every block comes with the vector versions read in the same statement as the content. missing_only skips the articles that already have a vector, staged_only the ones that have none
+def _iter_article_blocks(db: Session, block_size: int, after_article_id: int, missing_only: bool, staged_only: bool = False):
+    last_article_id = after_article_id
+
+    while True:
+        query = (
+            db.query(Article.article_id, func.substr(Article.content, 1, MAX_TEXT_CHARS), ArticleVector.article_id, ArticleVector.vector_version)
+            .outerjoin(ArticleVector, ArticleVector.article_id == Article.article_id)
+            .filter(Article.article_id > last_article_id)
+            .order_by(Article.article_id)
+        )
+
+        if missing_only:
+            query = query.filter(ArticleVector.article_id.is_(None))
+        elif staged_only:
+            query = query.filter(ArticleVector.article_id.isnot(None))
+
+        result = query.limit(block_size).all()
+        db.commit()
+
+        if not result:
+            return
+
+        block = [(article_id, content or "") for article_id, content, _, _ in result]
+        versions = {
+            article_id: version or 0
+            for article_id, _, vector_article_id, version in result
+            if vector_article_id is not None
+        }
+
+        last_article_id = block[-1][0]
+        yield block, versions
+
+
+def read_checkpoint(path: Path | None) -> int:
+    if path is None or not path.exists():
+        return 0
+
+    with open(path) as f:
+        return int(json.load(f)["last_article_id"])
+
+
+# Through a temporary file so a stopped run never leaves a half written checkpoint behind
+def write_checkpoint(path: Path | None, last_article_id: int):
+    if path is None:
+        return
+
+    tmp_path = path.with_suffix(".tmp")
+
+    with open(tmp_path, "w") as f:
+        json.dump({"last_article_id": last_article_id}, f)
+
+    os.replace(tmp_path, path)
+
+
+# Vectorizes every article (or every article without a vector, or only the staged vectors of a rollout), optionally across a pool of worker processes, continuing after the checkpoint when one is given. The checkpoint is removed once the run is complete. Returns the number of vectors written
+def vectorize_all_articles(
+    block_size: int = 500,
+    workers: int = 1,
+    checkpoint_path: Path | None = None,
+    missing_only: bool = False,
+    staged_only: bool = False
+) -> int:
+    started = time.perf_counter()
+    written = 0
+
+    start_after = read_checkpoint(checkpoint_path)
+    if start_after:
+        logger.info(f"article_vectors_resume after_article_id={start_after}")
+
+    def report(block_written: int, checkpoint: int):
+        nonlocal written
+        written += block_written
+        write_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"article_vectors_progress articles={written} checkpoint={checkpoint} "
+            f"rate={round(written / elapsed, 1) if elapsed else written}/s"
+        )
+
+    db = SessionLocal()
+
+    try:
+        blocks = _iter_article_blocks(db, block_size, start_after, missing_only, staged_only)
+
+        if workers <= 1:
+            for block, versions in blocks:
+                report(_run_block(block, staged_only, versions), block[-1][0])
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                # At most two blocks per worker are held in memory. Blocks can finish out of order, the checkpoint only moves past a block once every block before it is done
+                pending = {}
+                finished = {}
+                order = []
+
+                def collect(done):
+                    for future in done:
+                        finished[pending.pop(future)] = future.result()
+
+                    while order and order[0] in finished:
+                        last_article_id = order.pop(0)
+                        report(finished.pop(last_article_id), last_article_id)
+
+                for block, versions in blocks:
+                    if len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+                    pending[pool.submit(_run_block, block, staged_only, versions)] = block[-1][0]
+                    order.append(block[-1][0])
+
+                collect(wait(pending).done)
+
+    finally:
+        db.close()
+
+    invalidate_article_index()
+
+    if checkpoint_path is not None and checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+    logger.info(
+        f"article_vectors_complete articles={written} "
+        f"time={round(time.perf_counter() - started, 2)}s"
+    )
+
+    return written
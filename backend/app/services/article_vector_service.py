@@ -1,26 +1,98 @@
-import json
 import re
 from sqlalchemy.orm import Session
 
 from app.models.article_model import Article, ArticleTag, Tag
 from app.models.vector_model import ArticleVector
 from app.core.logger import get_logger
-from app.ml.tfidf_model_loader import get_vectorizers
+from app.ml.model_store import ModelBundle, get_model_bundle, get_staged_bundle, load_model_bundle
+from app.utils.vector_utils import pack_sparse_vector, pack_embedding
+from app.services.article_index_service import invalidate_article_index, refresh_article_index_rows, get_article_index, embed_rows
+from app.services.related_article_service import update_article_neighbours
 
 logger = get_logger(__name__)
 
 TOKEN_PATTERN = re.compile(r"\b[a-zA-Z]{2,}\b")
 
+# Only the start of long articles is vectorized
+MAX_TEXT_CHARS = 5000
+
+
+# Packed text vector, packed tag vector and packed dense embedding (None while no SVD projection has been fit) of a batch of articles, each vectorizer transforms the whole batch in one call. Uses the models of the active version unless a bundle is given
+def build_article_vectors(texts: list[str], tag_texts: list[str], bundle: ModelBundle | None = None) -> list[tuple[bytes, bytes, bytes | None]]:
+    bundle = bundle or get_model_bundle()
+
+    text_matrix = bundle.text_vectorizer.transform([(text or "")[:MAX_TEXT_CHARS] for text in texts]).tocsr()
+    tag_matrix = bundle.tag_vectorizer.transform(tag_texts).tocsr()
+
+    embedding_model = bundle.embedding_model
+    embeddings = embed_rows(text_matrix, tag_matrix, embedding_model) if embedding_model is not None else None
+
+    vectors = []
+    for row in range(len(texts)):
+        text_slice = slice(text_matrix.indptr[row], text_matrix.indptr[row + 1])
+        tag_slice = slice(tag_matrix.indptr[row], tag_matrix.indptr[row + 1])
+
+        vectors.append((
+            pack_sparse_vector(text_matrix.indices[text_slice], text_matrix.data[text_slice]),
+            pack_sparse_vector(tag_matrix.indices[tag_slice], tag_matrix.data[tag_slice]),
+            pack_embedding(embeddings[row]) if embeddings is not None else None
+        ))
+
+    return vectors
+
+
+# ArticleVector column values of a batch of articles: the vectors of the active model version and, while a new version is being rolled out, its vectors in the staged columns, so an edit made during a rollout is not lost when it is promoted. staged_only only computes the staged columns (the rollout itself)
+def article_vector_columns(texts: list[str], tag_texts: list[str], staged_only: bool = False) -> list[dict]:
+    # The manifest is checked on every batch so a rollout that just started is never missed
+    bundle = get_model_bundle(force_check=True)
+    staged_bundle = get_staged_bundle()
+
+    if staged_only and staged_bundle is None:
+        raise ValueError("no model version is staged")
+
+    columns = [{} for _ in texts]
+
+    if not staged_only:
+        for values, (text_packed, tag_packed, embedding) in zip(columns, build_article_vectors(texts, tag_texts, bundle)):
+            values.update({
+                "text_vector_packed": text_packed,
+                "tag_vector_packed": tag_packed,
+                "embedding": embedding,
+                "text_vector": None,
+                "tag_vector": None,
+                "model_version": bundle.version,
+            })
+
+    if staged_bundle is None:
+        # Leftovers of an abandoned rollout
+        for values in columns:
+            values.update({
+                "staged_text_vector_packed": None,
+                "staged_tag_vector_packed": None,
+                "staged_embedding": None,
+                "staged_model_version": None,
+            })
+    else:
+        for values, (text_packed, tag_packed, embedding) in zip(columns, build_article_vectors(texts, tag_texts, staged_bundle)):
+            values.update({
+                "staged_text_vector_packed": text_packed,
+                "staged_tag_vector_packed": tag_packed,
+                "staged_embedding": embedding,
+                "staged_model_version": staged_bundle.version,
+            })
+
+    return columns
+
+
 def create_article_vector(db: Session, article_id: int):
     logger.info(f"vector_recompute_start article_id={article_id}")
     """
         Generates or updates TF-IDF vectors for an article.
         Uses frozen TF-IDF vectorizers loaded from disk that is generated using the ML logic while the server is offline.
-        Stores vectors in sparse JSON format (indices + values).
+        Stores vectors in the packed binary sparse format (indices + values + norm).
+        Once an SVD projection has been fit the dense embedding is stored as well.
     """
     try:
-        text_vectorizer, tag_vectorizer = get_vectorizers()
-
         article = (
             db.query(Article)
             .filter(Article.article_id == article_id)
@@ -31,16 +103,6 @@ def create_article_vector(db: Session, article_id: int):
             logger.warning(f"article_not_found article_id={article_id}")
             return
 
-        # TEXT VECTOR
-        text = (article.content or "")[:5000]
-        text_vector = text_vectorizer.transform([text])[0]
-
-        text_vector_json = {
-            "indices": text_vector.indices.tolist(),
-            "values": text_vector.data.tolist(),
-        }
-
-        # TAG VECTOR
         rows = (
             db.query(Tag.tag_name)
             .join(ArticleTag, ArticleTag.tag_id == Tag.tag_id)
@@ -49,12 +111,9 @@ def create_article_vector(db: Session, article_id: int):
         )
 
         tag_text = " ".join([r[0] for r in rows])
-        tag_vector = tag_vectorizer.transform([tag_text])[0]
 
-        tag_vector_json = {
-            "indices": tag_vector.indices.tolist(),
-            "values": tag_vector.data.tolist(),
-        }
+        # TEXT VECTOR, TAG VECTOR AND DENSE EMBEDDING
+        columns = article_vector_columns([article.content], [tag_text])[0]
 
         existing_vector = (
             db.query(ArticleVector)
@@ -63,40 +122,44 @@ def create_article_vector(db: Session, article_id: int):
         )
 
         if existing_vector:
-            existing_vector.text_vector = json.dumps(text_vector_json)
-            existing_vector.tag_vector = json.dumps(tag_vector_json)
+            for column, value in columns.items():
+                setattr(existing_vector, column, value)
             existing_vector.vector_version += 1
             logger.info(f"article_vector_updated article_id={article_id}")
         else:
-            db.add(
-                ArticleVector(
-                    article_id=article_id,
-                    text_vector=json.dumps(text_vector_json),
-                    tag_vector=json.dumps(tag_vector_json),
-                    vector_version=1
-                )
-            )
+            db.add(ArticleVector(article_id=article_id, vector_version=1, **columns))
             logger.info(f"article_vector_created article_id={article_id}")
 
         db.commit()
+        invalidate_article_index()
 
     except Exception:
         db.rollback()
         logger.exception(f"vector_recompute_failed article_id={article_id}")
         raise
 
+    # The vector is already stored at this point, a failure here only leaves the related lists stale until the next full run
+    try:
+        refresh_article_index_rows(db, [article_id])
+        update_article_neighbours(db, article_id)
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"related_articles_update_failed article_id={article_id}")
+
 # for extracting alphabetical tokens of length >= 2.
 def tokenize(text: str) -> list[str]:
     return TOKEN_PATTERN.findall(text.lower())
 
-# Builds a TF-IDF vector for a search/recommendation query.
-def build_query_vector(db: Session, query: str) -> dict:
+# Builds a TF-IDF vector for a search/recommendation query. The vector has to be in the space of the vectors it is compared to, so it uses the given model version, by default the one the current article index was built from
+def build_query_vector(db: Session, query: str, model_version: str | None = None) -> dict:
     logger.info("query_vector_build_start")
 
     try:
-        text_vectorizer, _ = get_vectorizers()
+        if model_version is None:
+            model_version = get_article_index(db).model_version
 
-        vec = text_vectorizer.transform([query])[0]
+        vec = load_model_bundle(model_version).text_vectorizer.transform([query])[0]
 
         return {
             "indices": vec.indices.tolist(),
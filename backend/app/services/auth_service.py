@@ -14,6 +14,8 @@ from app.core.security import (
     create_access_token
 )
 from app.services.user_vector_service import create_default_user_vector
+from app.services.user_search_service import index_user_name
+from app.services.search_suggest_service import set_user_suggestion
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
@@ -76,6 +78,8 @@ def register_user(db: Session, user: RegistrationRequest):
         )
 
     db.refresh(new_user)
+    index_user_name(db, new_user.user_id, new_user.user_name)
+    set_user_suggestion(new_user.user_id, new_user.user_name)
 
     create_default_user_vector(db, new_user.user_id)
     logger.info(f"user_vector_initialized user_id={new_user.user_id}")
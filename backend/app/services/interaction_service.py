@@ -8,11 +8,12 @@ from app.schemas.interaction_schema import (
     InteractionToggleRequest,
     InteractionToggleResponse
 )
-from app.services.user_vector_service import mark_user_vector_dirty
+from app.services.user_vector_service import apply_interaction_to_user_vector
+from app.services.search_index_service import update_search_popularity
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
-# Creating the interaction and updating the article stats accordingly. If its like or save then the user would be marked as dirty
+# Creating the interaction and updating the article stats accordingly. If its like or save then the change is applied to the running sums of the user vector
 def create_interaction(
     db: Session,
     user_id: int,
@@ -61,12 +62,16 @@ def create_interaction(
         )
 
         if data.interaction_type in ("like", "save"):
-            mark_user_vector_dirty(db, user_id)
-            logger.info(f"user_vector_marked_dirty user_id={user_id}")
+            apply_interaction_to_user_vector(
+                db, user_id, data.article_id, data.interaction_type, sign=1, interaction=interaction
+            )
 
         db.commit()
         db.refresh(interaction)
 
+        if data.interaction_type in ("like", "save"):
+            update_search_popularity(data.article_id, stats.like_count, stats.save_count)
+
         logger.info(
             f"interaction_created interaction_id={interaction.interaction_id}"
         )
@@ -119,7 +124,7 @@ def get_interaction_status(db: Session, user_id: int, article_id: int):
     )
 
 
-# This function is used to toggle like/save interactions. If the interaction already exists, it is removed. If it does not exist, it is created. The function also updates the ArticleStat counts accordingly and marks the user vector as dirty if a like or save interaction is toggled. The user is marked as dirty in this case to reduce the load of the database and the system, and prevent system overload due to the user spamming either like or save buttons while interacting.
+# This function is used to toggle like/save interactions. If the interaction already exists, it is removed. If it does not exist, it is created. The function also updates the ArticleStat counts accordingly and applies the toggled like or save to the user vector as a delta of a single article vector, so users spamming either like or save buttons do not trigger a full recompute of their vector on every click.
 def toggle_interaction(
     db: Session,
     user_id: int,
@@ -170,10 +175,12 @@ def toggle_interaction(
                 stats.save_count -= 1
 
             if data.interaction_type in ("like", "save"):
-                mark_user_vector_dirty(db, user_id)
-                logger.info(f"user_vector_marked_dirty user_id={user_id}")
+                apply_interaction_to_user_vector(
+                    db, user_id, data.article_id, data.interaction_type, sign=-1, interaction=existing
+                )
 
             db.commit()
+            update_search_popularity(data.article_id, stats.like_count, stats.save_count)
 
             logger.info(
                 f"interaction_removed user_id={user_id} "
@@ -202,10 +209,12 @@ def toggle_interaction(
             stats.save_count += 1
 
         if data.interaction_type in ("like", "save"):
-            mark_user_vector_dirty(db, user_id)
-            logger.info(f"user_vector_marked_dirty user_id={user_id}")
+            apply_interaction_to_user_vector(
+                db, user_id, data.article_id, data.interaction_type, sign=1, interaction=new_interaction
+            )
 
         db.commit()
+        update_search_popularity(data.article_id, stats.like_count, stats.save_count)
 
         logger.info(
             f"interaction_created user_id={user_id} "
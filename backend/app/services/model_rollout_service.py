@@ -0,0 +1,102 @@
+from pathlib import Path
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app.models.vector_model import ArticleVector, UserVector
+from app.ml.model_store import LEGACY_VERSION, activate_model_version, read_manifest
+from app.services.article_vector_batch_service import vectorize_all_articles
+from app.services.article_index_service import invalidate_article_index
+from app.services.vector_job_service import enqueue_article_vector
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Rollout of a new model version (app.ml.model_store) without downtime. Once the version is published it is staged: the vector workers write the vectors of both versions from then on, and stage_model_version computes the staged vectors of the whole corpus into the staged_* columns while the served vectors, and so every running article index, stay on the active version. promote_model_version then copies the staged vectors over the served ones in a single UPDATE and activates the version in the manifest, so the indexes switch from one complete version to the other on their next refresh and load the models of the version they were rebuilt from. The user vectors are sums of article vectors of the old version, they are marked dirty and rebuilt from the new vectors on their next use.
+"""
+
+
+# Computes the staged vectors of every article that has a vector, resuming after the checkpoint when one is given. Returns the number of vectors written
+def stage_model_version(
+    version: str,
+    block_size: int = 500,
+    workers: int = 1,
+    checkpoint_path: Path | None = None
+) -> int:
+    if read_manifest().get("staged") != version:
+        raise ValueError(f"model version {version} is not staged")
+
+    logger.info(f"model_rollout_stage_start version={version}")
+    return vectorize_all_articles(
+        block_size=block_size,
+        workers=workers,
+        checkpoint_path=checkpoint_path,
+        staged_only=True
+    )
+
+
+# Copies the staged vectors of the version over the served ones, bumping the vector version so the indexes notice
+def _promote_staged_vectors(db: Session, version: str) -> int:
+    promoted = (
+        db.query(ArticleVector)
+        .filter(ArticleVector.staged_model_version == version)
+        .update(
+            {
+                "text_vector_packed": ArticleVector.staged_text_vector_packed,
+                "tag_vector_packed": ArticleVector.staged_tag_vector_packed,
+                "embedding": ArticleVector.staged_embedding,
+                "text_vector": None,
+                "tag_vector": None,
+                "model_version": version,
+                "vector_version": func.coalesce(ArticleVector.vector_version, 0) + 1,
+                "staged_text_vector_packed": None,
+                "staged_tag_vector_packed": None,
+                "staged_embedding": None,
+                "staged_model_version": None,
+            },
+            synchronize_session=False
+        )
+    )
+
+    db.commit()
+    return promoted
+
+
+# Switches the served vectors and the active model to the staged version, returns the number of vectors promoted
+def promote_model_version(db: Session, version: str) -> int:
+    if read_manifest().get("staged") != version:
+        raise ValueError(f"model version {version} is not staged")
+
+    promoted = _promote_staged_vectors(db, version)
+    activate_model_version(version)
+
+    # A worker that vectorized an article between the two steps above wrote it with both versions, promoting again picks it up
+    promoted += _promote_staged_vectors(db, version)
+
+    # Articles the rollout did not reach (e.g. a worker that had not seen the manifest yet) are vectorized again by the queue
+    stale_ids = [
+        article_id for (article_id,) in
+        db.query(ArticleVector.article_id)
+        .filter(or_(
+            func.coalesce(ArticleVector.model_version, LEGACY_VERSION) != version,
+            ArticleVector.staged_model_version.isnot(None)
+        ))
+        .all()
+    ]
+
+    for article_id in stale_ids:
+        enqueue_article_vector(db, article_id, delay=0)
+
+    # total_weight NULL makes the next interaction mark the user dirty instead of adding a new vector to the old sums
+    users = (
+        db.query(UserVector)
+        .update({"last_updated": None, "total_weight": None}, synchronize_session=False)
+    )
+    db.commit()
+
+    invalidate_article_index()
+
+    logger.info(
+        f"model_rollout_promoted version={version} articles={promoted} "
+        f"requeued={len(stale_ids)} users_marked_dirty={users}"
+    )
+
+    return promoted
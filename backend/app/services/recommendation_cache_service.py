@@ -0,0 +1,47 @@
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.user_model import UserRecommendationList, PRECOMPUTED_SESSION_ID
+from app.utils.ttl_cache import TTLCache
+from app.core.config import RECOMMENDATION_CACHE_MAX_ENTRIES, RECOMMENDATION_CACHE_TTL_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+In-process cache of the ranked recommendation lists, keyed by (user_id, session_id). Once the list of a session has been built or loaded, the following pages of that session are sliced straight out of memory without touching the recommendation tables. The entries of a user are tagged with the user id so they can all be dropped when the user vector changes.
+"""
+_ranked_lists = TTLCache(
+    max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS
+)
+
+
+def get_cached_ranked_list(user_id: int, session_id: str) -> np.ndarray | None:
+    return _ranked_lists.get((user_id, session_id))
+
+
+def cache_ranked_list(user_id: int, session_id: str, article_ids: np.ndarray):
+    _ranked_lists.set((user_id, session_id), article_ids, tag=user_id)
+
+
+# Drops the in-memory lists of the user only, used when the stored lists are already gone or replaced
+def forget_user_ranked_lists(user_id: int):
+    _ranked_lists.invalidate_tag(user_id)
+
+
+# Called whenever the user vector changes: the stored session lists were ranked with the old vector, so they are deleted together with their in-memory copies and the next request builds a fresh list. The precomputed list is left alone, it is validated against the vector timestamp when it is claimed. The caller is responsible for committing
+def invalidate_user_recommendations(db: Session, user_id: int):
+    db.query(UserRecommendationList).filter(
+        UserRecommendationList.user_id == user_id,
+        UserRecommendationList.session_id != PRECOMPUTED_SESSION_ID
+    ).delete(synchronize_session=False)
+
+    _ranked_lists.invalidate_tag(user_id)
+    logger.info(f"recommendation_cache_invalidated user_id={user_id}")
+
+
+def get_recommendation_cache_stats() -> dict:
+    return _ranked_lists.stats()
+
+
+def reset_recommendation_cache():
+    _ranked_lists.clear()
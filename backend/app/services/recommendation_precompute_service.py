@@ -0,0 +1,234 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from app.database.db import SessionLocal, engine
+from app.models.interaction_model import UserInteraction
+from app.models.user_model import UserRecommendationList, RANKED_LIST_VERSION, PRECOMPUTED_SESSION_ID
+from app.models.vector_model import UserVector
+from app.services.article_index_service import get_article_index, top_k_rows, SparseMatrixBuilder
+from app.services.user_vector_service import recompute_user_vector_from_interactions
+from app.utils.vector_utils import pack_id_list
+from app.core.config import RECOMMENDATION_TOP_N
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+Offline precomputation of the recommendation lists of every user, so the rankings are ready before the users arrive instead of being built on their first /recommendations call. The lists are stored under PRECOMPUTED_SESSION_ID and the first request of a new session takes the list over instead of scoring the corpus again. The user vectors are streamed in blocks and every block is scored against the whole article index with one sparse matrix-matrix product per vector type, the top N of every user is then written as one compact ranked list row per user with a single bulk insert per block. Blocks can be spread over a pool of worker processes, each of which builds its own copy of the article index.
+"""
+
+
+# Scores one block of users and replaces their precomputed rows, returns the number of users that got a ranking
+def precompute_user_block(db: Session, user_ids: list[int], top_n: int = RECOMMENDATION_TOP_N) -> int:
+    dirty_ids = [
+        user_id for (user_id,) in
+        db.query(UserVector.user_id)
+        .filter(UserVector.user_id.in_(user_ids))
+        .filter(UserVector.last_updated.is_(None))
+        .all()
+    ]
+
+    # Same lazy recompute the request path would do, so the stored ranking matches what the user would get online
+    for user_id in dirty_ids:
+        recompute_user_vector_from_interactions(db, user_id)
+
+    index = get_article_index(db)
+
+    rows = (
+        db.query(
+            UserVector.user_id,
+            UserVector.text_vector_packed,
+            UserVector.text_vector,
+            UserVector.tag_vector_packed,
+            UserVector.tag_vector
+        )
+        .filter(UserVector.user_id.in_(user_ids))
+        .order_by(UserVector.user_id)
+        .all()
+    )
+
+    text_builder = SparseMatrixBuilder(index.text_matrix.shape[1])
+    tag_builder = SparseMatrixBuilder(index.tag_matrix.shape[1])
+    block_user_ids = []
+
+    for user_id, text_packed, text_json, tag_packed, tag_json in rows:
+        block_user_ids.append(user_id)
+        text_builder.append(text_packed, text_json)
+        tag_builder.append(tag_packed, tag_json)
+
+    if not block_user_ids:
+        return 0
+
+    user_text = text_builder.build()
+    user_tag = tag_builder.build()
+    scores = index.score_block(user_text, user_tag)
+
+    seen_articles = defaultdict(list)
+    for user_id, article_id in (
+        db.query(UserInteraction.user_id, UserInteraction.article_id)
+        .filter(UserInteraction.user_id.in_(block_user_ids))
+        .filter(UserInteraction.interaction_type.in_(["like", "save"]))
+        .all()
+    ):
+        row = index.row_of.get(article_id)
+        if row is not None:
+            seen_articles[user_id].append(row)
+
+    has_vector = (np.diff(user_text.indptr) > 0) | (np.diff(user_tag.indptr) > 0)
+    created_at = datetime.utcnow()
+    mappings = []
+
+    for position, user_id in enumerate(block_user_ids):
+        if not has_vector[position]:
+            continue
+
+        user_scores = scores[position]
+        user_scores[seen_articles.get(user_id, [])] = -np.inf
+
+        mappings.append({
+            "user_id": user_id,
+            "session_id": PRECOMPUTED_SESSION_ID,
+            "article_ids": pack_id_list(index.article_ids[top_k_rows(user_scores, top_n)]),
+            "list_version": RANKED_LIST_VERSION,
+            "created_at": created_at
+        })
+
+    db.query(UserRecommendationList).filter(
+        UserRecommendationList.user_id.in_(block_user_ids),
+        UserRecommendationList.session_id == PRECOMPUTED_SESSION_ID
+    ).delete(synchronize_session=False)
+
+    if mappings:
+        db.execute(insert(UserRecommendationList), mappings)
+
+    db.commit()
+    return len(mappings)
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after the fork
+    engine.dispose(close=False)
+
+
+def _run_block(user_ids: list[int], top_n: int) -> tuple[int, int]:
+    db = SessionLocal()
+
+    try:
+        return len(user_ids), precompute_user_block(db, user_ids, top_n)
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"recommendation_precompute_block_failed first_user_id={user_ids[0]}")
+        raise
+
+    finally:
+        db.close()
+
+
+# Walks the user vectors in primary key order one block at a time, every block is its own short read so no transaction is held open while the blocks are being written
+def _iter_user_blocks(db: Session, block_size: int):
+    last_user_id = None
+
+    while True:
+        query = db.query(UserVector.user_id).order_by(UserVector.user_id)
+
+        if last_user_id is not None:
+            query = query.filter(UserVector.user_id > last_user_id)
+
+        block = [user_id for (user_id,) in query.limit(block_size).all()]
+        db.commit()
+
+        if not block:
+            return
+
+        last_user_id = block[-1]
+        yield block
+
+
+# Precomputes the recommendations of every user that has a vector, optionally across a pool of worker processes. Returns (users processed, users ranked)
+def precompute_all_recommendations(
+    block_size: int = 256,
+    workers: int = 1,
+    top_n: int = RECOMMENDATION_TOP_N
+) -> tuple[int, int]:
+    started = time.perf_counter()
+    processed = 0
+    ranked = 0
+
+    def report(block_processed: int, block_ranked: int):
+        nonlocal processed, ranked
+        processed += block_processed
+        ranked += block_ranked
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"recommendation_precompute_progress users={processed} ranked={ranked} "
+            f"rate={round(processed / elapsed, 1) if elapsed else processed}/s"
+        )
+
+    db = SessionLocal()
+
+    try:
+        blocks = _iter_user_blocks(db, block_size)
+
+        if workers <= 1:
+            for block in blocks:
+                report(*_run_block(block, top_n))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                # At most two blocks per worker are queued, the blocks are read and submitted as the workers catch up instead of all up front
+                pending = set()
+
+                for block in blocks:
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            report(*future.result())
+
+                    pending.add(pool.submit(_run_block, block, top_n))
+
+                for future in wait(pending).done:
+                    report(*future.result())
+
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"recommendation_precompute_complete users={processed} ranked={ranked} "
+        f"time={round(elapsed, 2)}s"
+    )
+
+    return processed, ranked
+
+
+# Moves a still valid precomputed ranking of the user over to the given session, returns None when there is no ranking or the user vector changed after it was computed
+def claim_precomputed_recommendations(db: Session, user_id: int, session_id: str, vector_updated_at: datetime | None) -> UserRecommendationList | None:
+    precomputed = db.get(UserRecommendationList, (user_id, PRECOMPUTED_SESSION_ID))
+
+    if precomputed is None:
+        return None
+
+    if precomputed.list_version != RANKED_LIST_VERSION or (
+        vector_updated_at is not None and precomputed.created_at < vector_updated_at
+    ):
+        db.delete(precomputed)
+        db.commit()
+        return None
+
+    precomputed.session_id = session_id
+
+    try:
+        db.commit()
+
+    except (IntegrityError, StaleDataError):
+        # Another request of the session claimed the ranking or stored its own list first
+        db.rollback()
+        return db.get(UserRecommendationList, (user_id, session_id))
+
+    return precomputed
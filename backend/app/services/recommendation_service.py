@@ -1,12 +1,18 @@
-import json
 import math
 from collections import defaultdict
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.models import ArticleVector, Article, UserInteraction, User
-from app.models.user_model import UserRecommendationCache
+from app.models.user_model import UserRecommendationList, RANKED_LIST_VERSION, PRECOMPUTED_SESSION_ID
 from app.models.vector_model import UserVector
 from app.schemas.article_schema import ArticleRecommendationResponse, PaginatedArticleRecommendationResponse
 from app.services.user_vector_service import recompute_user_vector_from_interactions
+from app.services.article_index_service import get_article_index
+from app.services.recommendation_precompute_service import claim_precomputed_recommendations
+from app.services.recommendation_cache_service import get_cached_ranked_list, cache_ranked_list, forget_user_ranked_lists
+from app.utils.vector_utils import read_sparse_dict, pack_id_list, unpack_id_list
+from app.core.config import RECOMMENDATION_TOP_N
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
@@ -17,31 +23,7 @@ INTERACTION_WEIGHTS = {
     "save": 3.0
 }
 
-# For finding the relation between two sparse vectors
-def cosine_sparse(v1, v2):
-    dot = 0.0
-    norm1 = 0.0
-    norm2 = 0.0
-
-    for idx, val in v1.items():
-        norm1 += val * val
-        if idx in v2:
-            dot += val * v2[idx]
-
-    for val in v2.values():
-        norm2 += val * val
-
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-
-    return dot / (math.sqrt(norm1) * math.sqrt(norm2))
-
-# Converts the sparse vector stored in json format back to a dictionary format for easier manipulation.
-def dict_from_sparse(vec_json):
-    vec = json.loads(vec_json)
-    return dict(zip(vec["indices"], vec["values"]))
-
-# Main function to get the top recommended articles for a user. The function first checks if the user has a vector, if not it triggers a lazy recomputation of the user vector based on the user's interactions. Then it checks if there is a cache of recommendations for the user and session, if not it builds the cache by scoring all articles against the user vector and storing the top recommendations in the UserRecommendationCache table.
+# Main function to get the top recommended articles for a user. The function first checks if the user has a vector, if not it triggers a lazy recomputation of the user vector based on the user's interactions. Then it checks if there is a cache of recommendations for the user and session, if not it builds the cache by scoring all articles against the user vector and storing the top recommendations as a ranked list in the UserRecommendationList table.
 def build_user_vector_from_interactions(db: Session, user_id: int):
     logger.info(f"user_vector_build_start user_id={user_id}")
 
@@ -78,8 +60,8 @@ def build_user_vector_from_interactions(db: Session, user_id: int):
 
         weight = INTERACTION_WEIGHTS.get(interaction.interaction_type, 1.0)
 
-        text_vec = dict_from_sparse(av.text_vector)
-        tag_vec = dict_from_sparse(av.tag_vector)
+        text_vec = read_sparse_dict(av.text_vector_packed, av.text_vector)
+        tag_vec = read_sparse_dict(av.tag_vector_packed, av.tag_vector)
 
         for k, v in text_vec.items():
             weighted_text_vec[k] += weight * v
@@ -107,148 +89,154 @@ def build_user_vector_from_interactions(db: Session, user_id: int):
     return dict(weighted_text_vec), dict(weighted_tag_vec)
 
 
-# Retrieves the top recommended articles for a user based on their user vector and the article vectors. The function also implements pagination and caching of recommendations for performance optimization.
-def get_top_articles_for_user(
-    db: Session,
-    user_id: int,
-    session_id: str,
-    page: int = 1,
-    page_size: int = 5
-):
-    session_id = str(session_id) 
-
-    logger.info(
-        f"recommendation_request_start user_id={user_id} session_id={session_id}"
+# Builds the ranked recommendation list of a user for a new session. The user vector is recomputed first if it is dirty, the rankings of the user's older sessions are dropped and the list is either taken over from the offline precompute job or built by scoring the whole corpus against the user vector. Returns None when the user has no usable vector
+def build_ranked_list(db: Session, user_id: int, session_id: str) -> UserRecommendationList | None:
+    user_vec_row = (
+        db.query(UserVector)
+        .filter(UserVector.user_id == user_id)
+        .first()
     )
 
-    try:
+    if not user_vec_row:
+        logger.warning(f"recommendation_no_user_vector user_id={user_id}")
+        return None
+
+    if user_vec_row.last_updated is None:
+        logger.info(f"user_vector_lazy_recompute user_id={user_id}")
+        recompute_user_vector_from_interactions(db, user_id)
+
         user_vec_row = (
             db.query(UserVector)
             .filter(UserVector.user_id == user_id)
             .first()
         )
 
-        if not user_vec_row:
-            logger.warning(f"recommendation_no_user_vector user_id={user_id}")
-            return PaginatedArticleRecommendationResponse(
-                page=page,
-                page_size=page_size,
-                total_results=0,
-                total_pages=0,
-                articles=[]
-            )
+    user_text_vec = read_sparse_dict(user_vec_row.text_vector_packed, user_vec_row.text_vector)
+    user_tag_vec = read_sparse_dict(user_vec_row.tag_vector_packed, user_vec_row.tag_vector)
 
-        if user_vec_row.last_updated is None:
-            logger.info(f"user_vector_lazy_recompute user_id={user_id}")
-            recompute_user_vector_from_interactions(db, user_id)
+    if not user_text_vec and not user_tag_vec:
+        logger.warning(f"recommendation_empty_user_vector user_id={user_id}")
+        return None
 
-            user_vec_row = (
-                db.query(UserVector)
-                .filter(UserVector.user_id == user_id)
-                .first()
-            )
+    db.query(UserRecommendationList).filter(
+        UserRecommendationList.user_id == user_id,
+        UserRecommendationList.session_id.notin_([session_id, PRECOMPUTED_SESSION_ID])
+    ).delete(synchronize_session=False)
 
-        user_text_vec = dict_from_sparse(user_vec_row.text_vector)
-        user_tag_vec = dict_from_sparse(user_vec_row.tag_vector)
+    db.commit()
+    forget_user_ranked_lists(user_id)
+    logger.info(f"recommendation_cache_cleanup user_id={user_id}")
 
-        if not user_text_vec and not user_tag_vec:
-            logger.warning(f"recommendation_empty_user_vector user_id={user_id}")
-            return PaginatedArticleRecommendationResponse(
-                page=page,
-                page_size=page_size,
-                total_results=0,
-                total_pages=0,
-                articles=[]
-            )
+    # ---- USE THE OFFLINE RANKING IF IT IS STILL VALID ----
+    ranked = claim_precomputed_recommendations(
+        db, user_id, session_id, user_vec_row.last_updated
+    )
 
-        
-        db.query(UserRecommendationCache).filter(
-            UserRecommendationCache.user_id == user_id,
-            UserRecommendationCache.session_id != session_id
-        ).delete(synchronize_session=False)
+    if ranked is not None:
+        logger.info(f"recommendation_precomputed_hit user_id={user_id}")
+        return ranked
 
-        db.commit()
-        logger.info(f"recommendation_cache_cleanup user_id={user_id}")
+    # ---- BUILD THE RANKED LIST ----
+    logger.info(f"recommendation_cache_build user_id={user_id}")
 
-        cached_count = db.query(UserRecommendationCache).filter(
-            UserRecommendationCache.user_id == user_id,
-            UserRecommendationCache.session_id == session_id
-        ).count()
+    seen_articles = {
+        row.article_id
+        for row in db.query(UserInteraction.article_id)
+        .filter(UserInteraction.user_id == user_id)
+        .filter(UserInteraction.interaction_type.in_(["like", "save"]))
+        .all()
+    }
+
+    # Articles already liked or saved by the user are excluded from the selection. Large corpora are ranked through the approximate candidate stage of the index
+    index = get_article_index(db)
+    top_ids = index.rank(
+        user_text_vec,
+        user_tag_vec,
+        RECOMMENDATION_TOP_N,
+        exclude_article_ids=seen_articles
+    )
 
-        # ---- BUILD CACHE IF EMPTY ----
-        if cached_count == 0:
-            logger.info(f"recommendation_cache_build user_id={user_id}")
+    logger.info(
+        f"recommendation_scoring_complete user_id={user_id} "
+        f"corpus={len(index)} candidates={len(top_ids)}"
+    )
 
-            seen_articles = {
-                row.article_id
-                for row in db.query(UserInteraction.article_id)
-                .filter(UserInteraction.user_id == user_id)
-                .filter(UserInteraction.interaction_type.in_(["like", "save"]))
-                .all()
-            }
+    ranked = UserRecommendationList(
+        user_id=user_id,
+        session_id=session_id,
+        article_ids=pack_id_list(top_ids),
+        list_version=RANKED_LIST_VERSION,
+        created_at=datetime.utcnow()
+    )
+    db.add(ranked)
 
-            article_vectors = db.query(ArticleVector).limit(1000).all()
-            scored = []
+    try:
+        db.commit()
 
-            for av in article_vectors:
-                if av.article_id in seen_articles:
-                    continue
+    except IntegrityError:
+        # A concurrent first request of the same session stored its list first, that one is served
+        db.rollback()
+        ranked = db.get(UserRecommendationList, (user_id, session_id))
 
-                article_text_vec = dict_from_sparse(av.text_vector)
-                article_tag_vec = dict_from_sparse(av.tag_vector)
+        if ranked is None:
+            raise
 
-                text_score = cosine_sparse(user_text_vec, article_text_vec)
-                tag_score = cosine_sparse(user_tag_vec, article_tag_vec)
+        logger.info(f"recommendation_build_conflict user_id={user_id}")
 
-                score = 0.7 * text_score + 0.3 * tag_score
-                scored.append((av.article_id, score))
+    return ranked
 
-            scored.sort(key=lambda x: x[1], reverse=True)
 
-            logger.info(
-                f"recommendation_scoring_complete user_id={user_id} "
-                f"candidates={len(scored)}"
-            )
+# Retrieves the top recommended articles for a user based on their user vector and the article vectors. The ranked list of a session is stored as a single compact row and kept in an in-process LRU cache, so serving a page is a slice of that list, the list is only built on the first request of a session and later pages do not touch the recommendation tables at all.
+def get_top_articles_for_user(
+    db: Session,
+    user_id: int,
+    session_id: str,
+    page: int = 1,
+    page_size: int = 5
+):
+    session_id = str(session_id) 
 
-            for pos, (article_id, _) in enumerate(scored):
-                db.add(
-                    UserRecommendationCache(
-                        user_id=user_id,
-                        article_id=article_id,
-                        rank_position=pos,
-                        session_id=session_id
-                    )
-                )
+    logger.info(
+        f"recommendation_request_start user_id={user_id} session_id={session_id}"
+    )
 
-            db.commit()
+    try:
+        ranked_ids = get_cached_ranked_list(user_id, session_id)
 
+        if ranked_ids is not None:
+            logger.info(f"recommendation_memory_cache_hit user_id={user_id}")
         else:
-            logger.info(f"recommendation_cache_hit user_id={user_id}")
+            ranked = db.get(UserRecommendationList, (user_id, session_id))
+
+            if ranked is not None:
+                logger.info(f"recommendation_cache_hit user_id={user_id}")
+            else:
+                ranked = build_ranked_list(db, user_id, session_id)
+
+            if ranked is None:
+                return PaginatedArticleRecommendationResponse(
+                    page=page,
+                    page_size=page_size,
+                    total_results=0,
+                    total_pages=0,
+                    articles=[]
+                )
+
+            ranked_ids = unpack_id_list(ranked.article_ids)
+            cache_ranked_list(user_id, session_id, ranked_ids)
 
         # ---- PAGINATION ----
-        total_results = db.query(UserRecommendationCache).filter(
-            UserRecommendationCache.user_id == user_id,
-            UserRecommendationCache.session_id == session_id
-        ).count()
+        total_results = len(ranked_ids)
 
         total_pages = (
             math.ceil(total_results / page_size)
             if total_results > 0 else 0
         )
 
-        rows = (
-            db.query(UserRecommendationCache)
-            .filter(
-                UserRecommendationCache.user_id == user_id,
-                UserRecommendationCache.session_id == session_id
-            )
-            .order_by(UserRecommendationCache.rank_position)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-            .all()
-        )
+        offset = (page - 1) * page_size
+        article_ids = ranked_ids[offset:offset + page_size].tolist()
 
-        if not rows:
+        if not article_ids:
             logger.info(f"recommendation_no_rows user_id={user_id}")
             return PaginatedArticleRecommendationResponse(
                 page=page,
@@ -258,8 +246,6 @@ def get_top_articles_for_user(
                 articles=[]
             )
 
-        article_ids = [row.article_id for row in rows]
-
         articles = (
             db.query(Article, User.user_name)
             .join(User, Article.author_id == User.user_id)
@@ -274,6 +260,9 @@ def get_top_articles_for_user(
 
         result = []
         for aid in article_ids:
+            if aid not in article_map:
+                continue  # article deleted after the list was built
+
             article, username = article_map[aid]
             result.append(
                 ArticleRecommendationResponse(
@@ -303,4 +292,3 @@ def get_top_articles_for_user(
             f"recommendation_failed user_id={user_id} session_id={session_id}"
         )
         raise
-
@@ -0,0 +1,273 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal, engine
+from app.models import Article, User
+from app.models.vector_model import ArticleVector, ArticleNeighbours
+from app.schemas.article_schema import RelatedArticleResponse, RelatedArticlesResponse
+from app.services.article_index_service import ArticleVectorIndex, get_article_index, top_k_rows
+from app.utils.vector_utils import pack_id_list, unpack_id_list, pack_score_list, unpack_score_list
+from app.core.config import RELATED_ARTICLES_TOP_K
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+# Number of the most similar articles whose lists are checked when a single article vector changes
+NEIGHBOUR_UPDATE_CANDIDATES = 200
+
+"""
+Precomputed item-to-item "more like this" lists. The offline job scores blocks of articles against the whole article index with one matrix product per block (spread over a pool of worker processes) and stores the top K of every article as one row of packed ids and scores. When a single article vector is written its own list is recomputed and, since the similarity is symmetric, it is merged into the lists of the most similar articles whose last neighbour it beats. Serving /articles/{id}/related is then a primary key read plus one query for the article cards.
+"""
+
+
+# Top k neighbours of a block of rows of the index, an article is never its own neighbour and articles with no similarity at all are not listed
+def _neighbours_of_rows(index: ArticleVectorIndex, rows: list[int], top_k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    scores = index.score_block(index.text_matrix[rows], index.tag_matrix[rows])
+    results = []
+
+    for position, row in enumerate(rows):
+        row_scores = scores[position]
+        row_scores[row] = -np.inf
+        row_scores[row_scores <= 0] = -np.inf
+
+        best = top_k_rows(row_scores, top_k)
+        results.append((index.article_ids[best], row_scores[best]))
+
+    return results
+
+
+# Recomputes and replaces the neighbour lists of one block of articles, returns the number of lists written
+def precompute_neighbour_block(db: Session, article_ids: list[int], top_k: int = RELATED_ARTICLES_TOP_K) -> int:
+    index = get_article_index(db)
+
+    block_ids = [article_id for article_id in article_ids if article_id in index.row_of]
+
+    if not block_ids:
+        return 0
+
+    neighbours = _neighbours_of_rows(index, [index.row_of[article_id] for article_id in block_ids], top_k)
+    updated_at = datetime.utcnow()
+
+    db.query(ArticleNeighbours).filter(
+        ArticleNeighbours.article_id.in_(block_ids)
+    ).delete(synchronize_session=False)
+
+    db.execute(insert(ArticleNeighbours), [
+        {
+            "article_id": article_id,
+            "neighbour_ids": pack_id_list(ids),
+            "scores": pack_score_list(scores),
+            "updated_at": updated_at
+        }
+        for article_id, (ids, scores) in zip(block_ids, neighbours)
+    ])
+
+    db.commit()
+    return len(block_ids)
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after the fork
+    engine.dispose(close=False)
+
+
+def _run_block(article_ids: list[int], top_k: int) -> int:
+    db = SessionLocal()
+
+    try:
+        return precompute_neighbour_block(db, article_ids, top_k)
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"related_articles_block_failed first_article_id={article_ids[0]}")
+        raise
+
+    finally:
+        db.close()
+
+
+# Walks the article vectors in primary key order one block at a time
+def _iter_article_blocks(db: Session, block_size: int):
+    last_article_id = None
+
+    while True:
+        query = db.query(ArticleVector.article_id).order_by(ArticleVector.article_id)
+
+        if last_article_id is not None:
+            query = query.filter(ArticleVector.article_id > last_article_id)
+
+        block = [article_id for (article_id,) in query.limit(block_size).all()]
+        db.commit()
+
+        if not block:
+            return
+
+        last_article_id = block[-1]
+        yield block
+
+
+# Precomputes the neighbour lists of every article that has a vector, optionally across a pool of worker processes. Returns the number of lists written
+def precompute_all_neighbours(
+    block_size: int = 128,
+    workers: int = 1,
+    top_k: int = RELATED_ARTICLES_TOP_K
+) -> int:
+    started = time.perf_counter()
+    written = 0
+
+    def report(block_written: int):
+        nonlocal written
+        written += block_written
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"related_articles_progress articles={written} "
+            f"rate={round(written / elapsed, 1) if elapsed else written}/s"
+        )
+
+    db = SessionLocal()
+
+    try:
+        blocks = _iter_article_blocks(db, block_size)
+
+        if workers <= 1:
+            for block in blocks:
+                report(_run_block(block, top_k))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                # At most two blocks per worker are queued, the blocks are read and submitted as the workers catch up instead of all up front
+                pending = set()
+
+                for block in blocks:
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            report(future.result())
+
+                    pending.add(pool.submit(_run_block, block, top_k))
+
+                for future in wait(pending).done:
+                    report(future.result())
+
+    finally:
+        db.close()
+
+    logger.info(
+        f"related_articles_complete articles={written} "
+        f"time={round(time.perf_counter() - started, 2)}s"
+    )
+
+    return written
+
+
+# Called after the vector of an article has been written. Rewrites the list of the article itself and merges the article into (or moves it within) the lists of its most similar articles. Lists of articles outside that candidate set that still hold the article with an older score are corrected by the next full run
+def update_article_neighbours(db: Session, article_id: int, top_k: int = RELATED_ARTICLES_TOP_K):
+    index = get_article_index(db)
+    row = index.row_of.get(article_id)
+
+    if row is None:
+        return
+
+    scores = index.score_block(index.text_matrix[[row]], index.tag_matrix[[row]])[0]
+    scores[row] = -np.inf
+    scores[scores <= 0] = -np.inf
+
+    best = top_k_rows(scores, top_k)
+    updated_at = datetime.utcnow()
+
+    own = db.get(ArticleNeighbours, article_id)
+    if own is None:
+        own = ArticleNeighbours(article_id=article_id)
+        db.add(own)
+
+    own.neighbour_ids = pack_id_list(index.article_ids[best])
+    own.scores = pack_score_list(scores[best])
+    own.updated_at = updated_at
+
+    candidate_rows = top_k_rows(scores, NEIGHBOUR_UPDATE_CANDIDATES)
+    candidates = (
+        db.query(ArticleNeighbours)
+        .filter(ArticleNeighbours.article_id.in_(index.article_ids[candidate_rows].tolist()))
+        .all()
+    )
+
+    merged = 0
+    for neighbours in candidates:
+        ids = unpack_id_list(neighbours.neighbour_ids)
+        neighbour_scores = unpack_score_list(neighbours.scores)
+        score = scores[index.row_of[neighbours.article_id]]
+
+        keep = ids != article_id
+        ids, neighbour_scores = ids[keep], neighbour_scores[keep]
+
+        # A full list the article does not make it into stays untouched
+        if len(ids) >= top_k and score <= neighbour_scores[-1]:
+            continue
+
+        position = int(np.searchsorted(-neighbour_scores, -score, side="right"))
+        ids = np.insert(ids, position, article_id)[:top_k]
+        neighbour_scores = np.insert(neighbour_scores, position, score)[:top_k]
+
+        neighbours.neighbour_ids = pack_id_list(ids)
+        neighbours.scores = pack_score_list(neighbour_scores)
+        neighbours.updated_at = updated_at
+        merged += 1
+
+    db.commit()
+
+    logger.info(
+        f"related_articles_updated article_id={article_id} "
+        f"neighbours={len(best)} lists_updated={merged}"
+    )
+
+
+# Returns the precomputed related articles of a published article, best first. Drafts are never listed, and articles deleted or unpublished since the list was computed are skipped
+def get_related_articles(db: Session, article_id: int, limit: int = 10) -> RelatedArticlesResponse:
+    exists = (
+        db.query(Article.article_id)
+        .filter(Article.article_id == article_id)
+        .filter(Article.is_published)
+        .first()
+    )
+
+    if not exists:
+        raise HTTPException(status_code=404, detail="Article Not Found")
+
+    neighbours = db.get(ArticleNeighbours, article_id)
+
+    if neighbours is None:
+        return RelatedArticlesResponse(article_id=article_id, articles=[])
+
+    ids = unpack_id_list(neighbours.neighbour_ids).tolist()
+    scores = unpack_score_list(neighbours.scores).tolist()
+
+    rows = (
+        db.query(Article.article_id, Article.title, Article.created_at, User.user_name)
+        .join(User, Article.author_id == User.user_id)
+        .filter(Article.article_id.in_(ids))
+        .filter(Article.is_published)
+        .all()
+    )
+    article_map = {row.article_id: row for row in rows}
+
+    result = []
+    for neighbour_id, score in zip(ids, scores):
+        row = article_map.get(neighbour_id)
+        if row is None:
+            continue
+
+        result.append(RelatedArticleResponse(
+            article_id=row.article_id,
+            title=row.title,
+            author_username=row.user_name,
+            created_at=row.created_at,
+            score=round(score, 4)
+        ))
+
+        if len(result) >= limit:
+            break
+
+    return RelatedArticlesResponse(article_id=article_id, articles=result)
@@ -0,0 +1,83 @@
+import sys
+import threading
+import time
+from app.utils.ttl_cache import TTLCache
+from app.core.config import SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_STATS_INTERVAL_SECONDS, SEARCH_CACHE_PARTIAL_TTL_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+"""
+In-process cache of finished search results, keyed by the lowercased query, the requesting user (their own articles are excluded from their results) and the corpus generation. The generation is a counter that is bumped whenever this process writes an article or notices that another process did, plus a coarse time bucket that retires every entry after SEARCH_CACHE_STATS_INTERVAL_SECONDS so changing like/save counts are picked up. A bump drops the entries of the old generation right away instead of waiting for them to age out, except for the ranked lists that have more pages: a new query no longer finds them, but the search cursors that name their generation still do.
+"""
+_results = TTLCache(
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ttl_seconds=SEARCH_CACHE_TTL_SECONDS
+)
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def _current_generation() -> tuple[int, int]:
+    bucket = int(time.time() // SEARCH_CACHE_STATS_INTERVAL_SECONDS) if SEARCH_CACHE_STATS_INTERVAL_SECONDS > 0 else 0
+    return _generation, bucket
+
+
+# Called after articles were created, updated or deleted
+def bump_search_generation():
+    global _generation
+
+    with _generation_lock:
+        old_generation = _generation
+        _generation += 1
+
+    _results.invalidate_tag(old_generation)
+
+
+# generation is the one of an earlier key (e.g. carried by a search cursor) to find an entry that was cached under it, the current one by default
+def search_cache_key(query: str, user_id: int, limit: int, *variant, generation: tuple | None = None) -> tuple:
+    return (generation or _current_generation(), query.lower(), user_id, limit, *variant)
+
+
+def get_cached_search(key: tuple):
+    return _results.get(key)
+
+
+# paged results are not dropped by a bump, the cursors of their later pages keep reading them under the old generation until they age out. partial results (cut short by the time budget) only live for SEARCH_CACHE_PARTIAL_TTL_SECONDS
+def cache_search(key: tuple, result, paged: bool = False, partial: bool = False):
+    _results.set(
+        key,
+        result,
+        tag=None if paged else key[0][0],
+        ttl_seconds=SEARCH_CACHE_PARTIAL_TTL_SECONDS if partial else None
+    )
+
+
+# Rough size of a cached value: the objects and strings it is made of, shared objects counted once
+def _estimate_bytes(value, seen: set) -> int:
+    if id(value) in seen:
+        return 0
+
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(_estimate_bytes(k, seen) + _estimate_bytes(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_estimate_bytes(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += _estimate_bytes(vars(value), seen)
+
+    return size
+
+
+def get_search_cache_stats() -> dict:
+    stats = _results.stats()
+    seen = set()
+    stats["memory_bytes"] = sum(_estimate_bytes(value, seen) for value in _results.values())
+    stats["generation"] = _generation
+    return stats
+
+
+def reset_search_cache():
+    _results.clear()
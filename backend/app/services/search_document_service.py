@@ -0,0 +1,50 @@
+import json
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.models.article_model import Article, ArticleSearchDocument
+from app.utils.text_utils import normalize_text, term_counts
+
+
+"""
+Maintains the pre-tokenized search data of the articles (ArticleSearchDocument). The rows are written next to the article itself by create_article and update_article and renamed together with their author, none of these functions commit, the caller's transaction does.
+"""
+
+
+def encode_terms(counts: dict[str, int]) -> str:
+    return json.dumps(counts, separators=(",", ":"))
+
+
+def decode_terms(terms: str | None) -> dict[str, int]:
+    return json.loads(terms) if terms else {}
+
+
+def build_search_document(article_id: int, title: str, content: str, author_name: str) -> dict:
+    return {
+        "article_id": article_id,
+        "title_normalized": normalize_text(title or ""),
+        "author_normalized": normalize_text(author_name or ""),
+        "title_terms": encode_terms(term_counts(title or "")),
+        "content_terms": encode_terms(term_counts(content or "")),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+# Creates or replaces the search data of an article
+def write_search_document(db: Session, article: Article, author_name: str):
+    db.merge(ArticleSearchDocument(**build_search_document(
+        article.article_id, article.title, article.content, author_name
+    )))
+
+
+def rename_author_search_documents(db: Session, author_id: int, author_name: str):
+    article_ids = db.query(Article.article_id).filter(Article.author_id == author_id)
+
+    db.query(ArticleSearchDocument).filter(
+        ArticleSearchDocument.article_id.in_(article_ids.scalar_subquery())
+    ).update(
+        {
+            ArticleSearchDocument.author_normalized: normalize_text(author_name),
+            ArticleSearchDocument.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False
+    )
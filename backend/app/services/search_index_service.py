@@ -0,0 +1,535 @@
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from math import log, log1p
+import numpy as np
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from app.models.article_model import Article, ArticleSearchDocument, ArticleStat
+from app.models.user_model import User
+from app.utils.text_utils import normalize_text, word_runs, term_counts, substring_trigrams
+from app.services.search_document_service import decode_terms
+from app.services.search_cache_service import bump_search_generation
+from app.core.config import SEARCH_INDEX_REFRESH_SECONDS, SEARCH_INDEX_STATS_REFRESH_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+# Number of rows streamed from the database at once while building the index
+BUILD_BATCH_SIZE = 1000
+
+SEARCH_FIELDS = ("title", "content", "author")
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Initial number of rows of the columnar arrays, they double whenever they are full
+INITIAL_CAPACITY = 1024
+
+
+# Popularity signal of the search, log(2 * likes + 3 * saves + 1)
+def popularity_of(like_count: int | None, save_count: int | None) -> float:
+    return log1p((like_count or 0) * 2 + (save_count or 0) * 3)
+
+
+# The part of an article the search keeps in memory, title and author name normalized. The content itself is not kept, only its tokens, phrase checks on the content read it from the database for the few documents that can still match
+@dataclass
+class SearchDocument:
+    article_id: int
+    author_id: int
+    title: str
+    author_name: str
+    created_at: datetime
+    is_published: bool
+
+
+"""
+This service keeps a process-wide inverted index over the title, content and author name of every article: for every field a token -> article ids postings map. The postings keep the term frequency of every article and the index keeps the token length of every field, which is everything BM25 needs. A search only reads the postings of its own tokens, so its cost grows with the number of matching articles instead of the size of the corpus, and unlike the old 5000 row candidate scan every article is searchable. The index is built lazily, kept up to date in place when articles are created, updated or deleted in this process and rebuilt when the articles table was changed by another process.
+"""
+class SearchIndex:
+    def __init__(self, signature: tuple):
+        self.signature = signature
+        self.documents: dict[int, SearchDocument] = {}
+        self.postings = {field: defaultdict(dict) for field in SEARCH_FIELDS}
+        self.articles_of_author = defaultdict(set)
+
+        # BM25 statistics: the length in tokens of every document per field and the sum of those lengths. The document frequency of a token is the size of its postings
+        self.lengths = {field: {} for field in SEARCH_FIELDS}
+        self.total_length = {field: 0 for field in SEARCH_FIELDS}
+
+        # Tokens of every document per field, needed to take a document out of the postings again
+        self._document_tokens: dict[int, dict[str, set[str]]] = {}
+
+        # Trigram -> terms of every field, so the phrase check finds the terms that contain a word without scanning the vocabulary. Terms shorter than three characters have no trigram and are kept apart
+        self.term_grams = {field: defaultdict(set) for field in SEARCH_FIELDS}
+        self.short_terms = {field: set() for field in SEARCH_FIELDS}
+
+        # Columnar copy of what the ranking needs of every article, row_of maps an article id to its row. Rows of removed articles are unpublished and reused
+        self.row_of: dict[int, int] = {}
+        self.row_article_ids = np.full(INITIAL_CAPACITY, -1, dtype=np.int64)
+        self.row_author_ids = np.full(INITIAL_CAPACITY, -1, dtype=np.int64)
+        self.row_published = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.row_created_at = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self.row_popularity = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._free_rows: list[int] = []
+        self._row_count = 0
+        self.stats_loaded_at = time.monotonic()
+
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _add_term(self, field: str, term: str):
+        grams = substring_trigrams(term)
+
+        if not grams:
+            self.short_terms[field].add(term)
+
+        for gram in grams:
+            self.term_grams[field][gram].add(term)
+
+    def _drop_term(self, field: str, term: str):
+        self.short_terms[field].discard(term)
+        term_grams = self.term_grams[field]
+
+        for gram in substring_trigrams(term):
+            terms = term_grams.get(gram)
+            if terms is None:
+                continue
+
+            terms.discard(term)
+            if not terms:
+                del term_grams[gram]
+
+    def _index_field(self, article_id: int, field: str, counts: dict[str, int]):
+        postings = self.postings[field]
+
+        for token, count in counts.items():
+            if token not in postings:
+                self._add_term(field, token)
+            postings[token][article_id] = count
+
+        length = sum(counts.values())
+        self.lengths[field][article_id] = length
+        self.total_length[field] += length
+        self._document_tokens[article_id][field] = set(counts)
+
+    def _grow(self):
+        capacity = len(self.row_article_ids) * 2
+
+        def grown(array: np.ndarray, fill) -> np.ndarray:
+            bigger = np.full(capacity, fill, dtype=array.dtype)
+            bigger[:len(array)] = array
+            return bigger
+
+        self.row_article_ids = grown(self.row_article_ids, -1)
+        self.row_author_ids = grown(self.row_author_ids, -1)
+        self.row_published = grown(self.row_published, False)
+        self.row_created_at = grown(self.row_created_at, 0.0)
+        self.row_popularity = grown(self.row_popularity, 0.0)
+
+    def _set_row(self, document: SearchDocument, popularity: float):
+        row = self.row_of.get(document.article_id)
+
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                if self._row_count == len(self.row_article_ids):
+                    self._grow()
+                row = self._row_count
+                self._row_count += 1
+
+            self.row_of[document.article_id] = row
+
+        self.row_article_ids[row] = document.article_id
+        self.row_author_ids[row] = document.author_id
+        self.row_published[row] = document.is_published
+        self.row_created_at[row] = document.created_at.timestamp() if document.created_at else 0.0
+        self.row_popularity[row] = popularity
+
+    def _unindex_field(self, article_id: int, field: str):
+        postings = self.postings[field]
+
+        for token in self._document_tokens[article_id].pop(field, ()):
+            ids = postings.get(token)
+            if ids is None:
+                continue
+
+            ids.pop(article_id, None)
+            if not ids:
+                del postings[token]
+                self._drop_term(field, token)
+
+        self.total_length[field] -= self.lengths[field].pop(article_id, 0)
+
+    # Adds or replaces a document, terms holds the token counts of every field
+    def add(self, document: SearchDocument, terms: dict[str, dict[str, int]], popularity: float = 0.0):
+        with self._lock:
+            self.remove(document.article_id)
+            self._document_tokens[document.article_id] = {}
+
+            for field in SEARCH_FIELDS:
+                self._index_field(document.article_id, field, terms.get(field, {}))
+
+            self.documents[document.article_id] = document
+            self.articles_of_author[document.author_id].add(document.article_id)
+            self._set_row(document, popularity)
+
+    def remove(self, article_id: int):
+        with self._lock:
+            document = self.documents.pop(article_id, None)
+
+            if document is None:
+                return
+
+            for field in SEARCH_FIELDS:
+                self._unindex_field(article_id, field)
+
+            del self._document_tokens[article_id]
+            self.articles_of_author[document.author_id].discard(article_id)
+
+            row = self.row_of.pop(article_id)
+            self.row_article_ids[row] = -1
+            self.row_author_ids[row] = -1
+            self.row_published[row] = False
+            self.row_popularity[row] = 0.0
+            self._free_rows.append(row)
+
+    def rename_author(self, author_id: int, author_name: str):
+        with self._lock:
+            for article_id in self.articles_of_author.get(author_id, ()):
+                self._unindex_field(article_id, "author")
+                self._index_field(article_id, "author", term_counts(author_name))
+                self.documents[article_id].author_name = normalize_text(author_name)
+
+    def set_popularity(self, article_id: int, popularity: float):
+        with self._lock:
+            row = self.row_of.get(article_id)
+            if row is not None:
+                self.row_popularity[row] = popularity
+
+    # Replaces the popularity of every given (article_id, popularity) pair in one go, e.g. after reading article_stats again
+    def reload_popularity(self, popularities):
+        with self._lock:
+            for article_id, popularity in popularities:
+                self.set_popularity(article_id, popularity)
+            self.stats_loaded_at = time.monotonic()
+
+    # The given articles that are in the index and their popularity, in the order given
+    def popularity_of_articles(self, article_ids: list[int]) -> tuple[list[int], np.ndarray]:
+        with self._lock:
+            present = [article_id for article_id in article_ids if article_id in self.row_of]
+            return present, self.row_popularity[self.rows_of(present)]
+
+    # Consistent copy of the columns the ranking of one query needs: the candidate articles the user can find, together with every visible article whose popularity is at least popularity_floor times the highest visible popularity (None for none of them). Returns (article_ids, popularity, created_at, highest visible popularity)
+    def ranking_columns(self, user_id: int, candidate_ids, popularity_floor: float | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        with self._lock:
+            visible_rows = self.visible_rows(user_id)
+            popularity = self.row_popularity
+            max_popularity = float(popularity[visible_rows].max()) if visible_rows.any() else 0.0
+
+            rows = self.rows_of(candidate_ids)
+
+            if popularity_floor is not None and max_popularity > 0:
+                min_popularity = max_popularity * popularity_floor
+                rows = np.union1d(rows, np.flatnonzero(visible_rows & (popularity >= min_popularity - 1e-9)))
+
+            rows = rows[visible_rows[rows]]
+
+            return self.row_article_ids[rows], popularity[rows], self.row_created_at[rows], max_popularity
+
+    # Rows of the given articles, articles that are not in the index are skipped
+    def rows_of(self, article_ids) -> np.ndarray:
+        row_of = self.row_of
+        return np.fromiter(
+            (row_of[article_id] for article_id in article_ids if article_id in row_of),
+            dtype=np.int64
+        )
+
+    # Mask over all rows of the articles the user can find: published and written by someone else
+    def visible_rows(self, user_id: int) -> np.ndarray:
+        return self.row_published & (self.row_author_ids != user_id)
+
+    # Articles that have the token in the given field
+    def matching(self, field: str, token: str) -> set[int]:
+        with self._lock:
+            return set(self.postings[field].get(token, ()))
+
+    # Okapi BM25 score of every article of the field that contains at least one of the tokens. The scores are divided by the score of a document of average length that contains every token exactly once and capped at 1, so a full match scores like the old token overlap did and a partial match is weighted by how rare the matched tokens are
+    def bm25(self, field: str, tokens: set[str]) -> dict[int, float]:
+        with self._lock:
+            document_count = len(self.documents)
+
+            if document_count == 0 or not tokens:
+                return {}
+
+            average_length = max(self.total_length[field] / document_count, 1.0)
+            lengths = self.lengths[field]
+            postings = self.postings[field]
+
+            scores = defaultdict(float)
+            full_match = 0.0
+
+            for token in tokens:
+                ids = postings.get(token, {})
+                frequency = len(ids)
+                idf = log(1 + (document_count - frequency + 0.5) / (frequency + 0.5))
+                full_match += idf
+
+                for article_id, count in ids.items():
+                    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[article_id] / average_length)
+                    scores[article_id] += idf * count * (BM25_K1 + 1) / (count + length_norm)
+
+        return {
+            article_id: min(score / full_match, 1.0)
+            for article_id, score in scores.items()
+        }
+
+    # Terms of the field that contain the word. All of the trigrams of the word are in such a term, so only the terms of its rarest trigrams are checked. Words shorter than three characters go through the trigrams that contain them, which are far fewer than the terms
+    def _terms_containing(self, field: str, word: str) -> set[str]:
+        term_grams = self.term_grams[field]
+        grams = substring_trigrams(word)
+
+        if grams:
+            term_sets = sorted((term_grams.get(gram, set()) for gram in grams), key=len)
+            terms = set(term_sets[0]).intersection(*term_sets[1:])
+        else:
+            terms = set().union(*(grouped for gram, grouped in term_grams.items() if word in gram))
+            terms |= {term for term in self.short_terms[field] if word in term}
+
+        return {term for term in terms if word in term}
+
+    # Articles whose tokens make it possible for the normalized query to occur in one of their fields. Inside a match the first word of the query can be the end of a longer word, the last one the start of a longer word and every word in between has to be a whole word, so only those postings are read. Returns None when the query has no words at all and every article is a candidate. deadline (a search_service.SearchDeadline) stops before the next field once the time budget is used up
+    def phrase_candidates(self, query: str, deadline=None) -> set[int] | None:
+        runs = word_runs(query)
+
+        if not runs:
+            return None
+
+        candidates = set()
+
+        with self._lock:
+            for number, field in enumerate(SEARCH_FIELDS):
+                if number and deadline is not None and deadline.exceeded():
+                    break
+
+                postings = self.postings[field]
+                field_candidates = None
+
+                for position, run in enumerate(runs):
+                    if len(runs) == 1:
+                        terms = self._terms_containing(field, run)
+                    elif position == 0:
+                        terms = [term for term in self._terms_containing(field, run) if term.endswith(run)]
+                    elif position == len(runs) - 1:
+                        terms = [term for term in self._terms_containing(field, run) if term.startswith(run)]
+                    else:
+                        terms = [run] if run in postings else []
+
+                    run_ids = set().union(*(postings[term] for term in terms)) if terms else set()
+                    field_candidates = run_ids if field_candidates is None else field_candidates & run_ids
+
+                    if not field_candidates:
+                        break
+
+                candidates |= field_candidates or set()
+
+        return candidates
+
+
+def _corpus_signature(db: Session) -> tuple:
+    count, max_id, last_update = db.query(
+        func.count(Article.article_id),
+        func.coalesce(func.max(Article.article_id), 0),
+        func.max(Article.updated_at)
+    ).one()
+
+    return int(count), int(max_id), str(last_update)
+
+
+# Articles with their pre-tokenized search data. The content is only read for articles that have no search data yet
+def _document_rows(db: Session):
+    return (
+        db.query(
+            Article.article_id,
+            Article.author_id,
+            Article.title,
+            Article.created_at,
+            Article.is_published,
+            User.user_name,
+            ArticleSearchDocument.title_normalized,
+            ArticleSearchDocument.author_normalized,
+            ArticleSearchDocument.title_terms,
+            ArticleSearchDocument.content_terms,
+            ArticleStat.like_count,
+            ArticleStat.save_count,
+            case(
+                (ArticleSearchDocument.article_id.is_(None), Article.content),
+                else_=None
+            ).label("content")
+        )
+        .join(User, Article.author_id == User.user_id)
+        .outerjoin(ArticleSearchDocument, ArticleSearchDocument.article_id == Article.article_id)
+        .outerjoin(ArticleStat, ArticleStat.article_id == Article.article_id)
+    )
+
+
+# Adds one row of _document_rows to the index, returns False when the article text had to be tokenized because it has no search data
+def _add_row(index: SearchIndex, row) -> bool:
+    pretokenized = row.title_terms is not None
+
+    if pretokenized:
+        title = row.title_normalized
+        author_name = row.author_normalized
+        terms = {
+            "title": decode_terms(row.title_terms),
+            "content": decode_terms(row.content_terms),
+        }
+    else:
+        title = normalize_text(row.title or "")
+        author_name = normalize_text(row.user_name or "")
+        terms = {
+            "title": term_counts(row.title or ""),
+            "content": term_counts(row.content or ""),
+        }
+
+    terms["author"] = term_counts(author_name)
+
+    index.add(
+        SearchDocument(
+            article_id=row.article_id,
+            author_id=row.author_id,
+            title=title,
+            author_name=author_name,
+            created_at=row.created_at,
+            is_published=bool(row.is_published)
+        ),
+        terms,
+        popularity_of(row.like_count, row.save_count)
+    )
+
+    return pretokenized
+
+
+def _build_index(db: Session, signature: tuple) -> SearchIndex:
+    started = time.perf_counter()
+    index = SearchIndex(signature)
+
+    tokenized = 0
+
+    for row in _document_rows(db).order_by(Article.article_id).yield_per(BUILD_BATCH_SIZE):
+        if not _add_row(index, row):
+            tokenized += 1
+
+    # Articles written before the search data existed, app.jobs.backfill_search_documents fills it in
+    if tokenized:
+        logger.warning(f"search_index_missing_search_documents articles={tokenized}")
+
+    logger.info(
+        f"search_index_built articles={len(index)} "
+        f"terms={sum(len(postings) for postings in index.postings.values())} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+    return index
+
+
+_index: SearchIndex | None = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+# Returns the process-wide search index, building it on first use and rebuilding it when the articles were changed by another process since the last check
+def get_search_index(db: Session) -> SearchIndex:
+    global _index, _index_checked_at
+
+    if _index is not None and time.monotonic() - _index_checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+        return _index
+
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return _index
+
+        signature = _corpus_signature(db)
+
+        if _index is None or _index.signature != signature:
+            if _index is not None:
+                bump_search_generation()
+
+            _index = _build_index(db, signature)
+
+        elif time.monotonic() - _index.stats_loaded_at >= SEARCH_INDEX_STATS_REFRESH_SECONDS:
+            _reload_popularity(db, _index)
+
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+# Likes and saves do not change the corpus signature, the popularity column is reloaded from article_stats on its own interval to pick up the ones made by other processes
+def _reload_popularity(db: Session, index: SearchIndex):
+    started = time.perf_counter()
+    rows = db.query(ArticleStat.article_id, ArticleStat.like_count, ArticleStat.save_count).all()
+
+    index.reload_popularity(
+        (article_id, popularity_of(like_count, save_count))
+        for article_id, like_count, save_count in rows
+    )
+
+    logger.info(
+        f"search_index_popularity_reloaded articles={len(rows)} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+
+# Applies a change made by this process to the index in place. The stored signature is refreshed as well, so the change is not mistaken for one made by another process on the next check. Cached search results are retired whichever search backend is in use
+def _apply_local_change(db: Session, change):
+    bump_search_generation()
+
+    with _index_lock:
+        if _index is None:
+            return
+
+        change(_index)
+        _index.signature = _corpus_signature(db)
+
+
+# Called after an article was created or updated
+def refresh_search_document(db: Session, article_id: int):
+    row = _document_rows(db).filter(Article.article_id == article_id).first()
+
+    if row is None:
+        _apply_local_change(db, lambda index: index.remove(article_id))
+    else:
+        _apply_local_change(db, lambda index: _add_row(index, row))
+
+
+# Called after articles were deleted
+def remove_search_documents(db: Session, article_ids: list[int]):
+    def change(index: SearchIndex):
+        for article_id in article_ids:
+            index.remove(article_id)
+
+    _apply_local_change(db, change)
+
+
+# Called after the like or save count of an article changed. Cached results are not retired, they expire with the stats interval of the search cache
+def update_search_popularity(article_id: int, like_count: int, save_count: int):
+    with _index_lock:
+        if _index is not None:
+            _index.set_popularity(article_id, popularity_of(like_count, save_count))
+
+
+# Called after a user changed their user name
+def rename_search_author(db: Session, author_id: int, author_name: str):
+    _apply_local_change(db, lambda index: index.rename_author(author_id, author_name))
+
+
+def reset_search_index():
+    global _index, _index_checked_at
+    with _index_lock:
+        _index = None
+        _index_checked_at = 0.0
@@ -1,43 +1,27 @@
+import base64
+import json
+from collections import defaultdict
+import numpy as np
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from math import log
+from fastapi import HTTPException, status
+from math import log, exp, ceil
 import time
-import re
 from app.models.article_model import Article, ArticleStat
-from app.models.vector_model import ArticleVector
 from app.models.user_model import User
 from app.schemas.search_schema import SearchArticleResponse, SearchUserResponse
+from app.services.search_index_service import get_search_index
+from app.services.article_index_service import get_article_index
+from app.services.article_vector_service import build_query_vector
+from app.services.user_search_service import search_users
+from app.services.search_cache_service import search_cache_key, get_cached_search, cache_search
+from app.utils.text_utils import normalize_text, tokenize, word_runs, like_escape
+from app.core.config import SEARCH_BACKEND, SEARCH_SEMANTIC_CANDIDATES, SEARCH_HYBRID_SEMANTIC_WEIGHT, SEARCH_MAX_RESULTS, SEARCH_TIME_BUDGET_MS
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
 
-# Text normalization & tokenization
-STOPWORDS = {
-    "a", "an", "the", "with", "and", "or", "to", "of", "in", "on", "for"
-}
-
-TOKEN_PATTERN = re.compile(r"[a-zA-Z]+")
-
-# Normalizes text by lowercasing and removing special characters. This is used to improve the matching of search queries with article content and titles.
-def normalize_text(text: str) -> str:
-    return text.lower().replace("-", " ")
-
-# Tokenizes text into a set of unique tokens, excluding stopwords
-def tokenize(text: str) -> set[str]:
-    tokens = TOKEN_PATTERN.findall(normalize_text(text))
-    return {t for t in tokens if t not in STOPWORDS}
-
-# Computes the token overlap score between the query and a given text. This is used as part of the relevance scoring in the search algorithm to determine how closely an article matches the search query based on shared tokens.
-def token_overlap_score(query: str, text: str) -> float:
-    q_tokens = tokenize(query)
-    t_tokens = tokenize(text)
-
-    if not q_tokens or not t_tokens:
-        return 0.0
-
-    overlap = q_tokens & t_tokens
-    return len(overlap) / len(q_tokens)
-
-
 # Scoring helpers
 def normalize(value: float, max_value: float) -> float:
     if max_value <= 0:
@@ -50,169 +34,749 @@ def popularity_score(stats: ArticleStat) -> float:
     return log(raw + 1)
 
 
-def recency_score(article: Article) -> float:
-    age = time.time() - article.created_at.timestamp()
+def recency_score(created_at) -> float:
+    age = time.time() - created_at.timestamp()
     if age < 0:
         age = 0
     return 1 / (1 + age)
 
 
+# Number of ids sent to the database per IN (...) query
+ID_CHUNK_SIZE = 500
+
+# Number of in-memory candidates scored between two checks of the time budget
+SCORE_CHUNK_SIZE = 4096
+
+# Weights of the blended search score and the score an article needs to be listed at all
+PHRASE_WEIGHT = 0.45
+TOKEN_WEIGHT = 0.35
+POPULARITY_WEIGHT = 0.12
+RECENCY_WEIGHT = 0.08
+MIN_SCORE = 0.10
+
+
+def blend_score(phrase: float, token: float, popularity: float, recency: float) -> float:
+    return (
+        PHRASE_WEIGHT * phrase +
+        TOKEN_WEIGHT * token +
+        POPULARITY_WEIGHT * popularity +
+        RECENCY_WEIGHT * recency
+    )
+
+
 """
-This service implements a hybrid search algorithm that combines phrase matching, token overlap, article popularity, and recency to rank articles based on their relevance to the search query. The search function retrieves candidate articles from the database, computes various relevance scores for each article, and returns a ranked list of search results. The algorithm also includes a fallback mechanism to ensure that some results are returned even if the initial scoring does not yield enough relevant articles. The service uses SQLAlchemy to interact with the database and includes logging for monitoring search performance and debugging.
+Time budget of one search request (SEARCH_TIME_BUDGET_MS, or the budget given to hybrid_search). The candidates of a query are processed in priority order and in chunks, once the budget is used up no further chunk is started, so a query that matches a large part of the corpus still returns within about the budget, with the best results that were found until then. expired records that this happened, the response is then flagged as partial.
 """
-def hybrid_search(
-    db: Session,
-    query: str,
-    user_id: int,
-    limit: int = 5
-) -> list[SearchArticleResponse]:
+class SearchDeadline:
+    def __init__(self, budget_ms: float):
+        # None when the budget is disabled (0)
+        self.budget_ms = budget_ms if budget_ms > 0 else None
+        self.expires_at = time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None
+        self.expired = False
 
-    logger.info(f"search_start query='{query}' user_id={user_id}")
+    def exceeded(self) -> bool:
+        if not self.expired and self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.expired = True
+        return self.expired
 
-    try:
-        query_norm = normalize_text(query)
+    # None without a budget
+    def remaining_ms(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return max((self.expires_at - time.monotonic()) * 1000, 0.0)
 
-        candidates = (
-            db.query(Article, ArticleVector, ArticleStat, User)
-            .join(ArticleVector, Article.article_id == ArticleVector.article_id)
-            .join(ArticleStat, Article.article_id == ArticleStat.article_id)
-            .join(User, Article.author_id == User.user_id)
+
+# The first chunk is always yielded, the following ones only while the deadline has not passed
+def _chunks(ids: list[int], deadline: SearchDeadline | None = None, size: int = ID_CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        if start and deadline is not None and deadline.exceeded():
+            return
+        yield ids[start:start + size]
+
+
+# Like and save counts of the given articles
+def _load_stats(db: Session, article_ids: list[int], deadline: SearchDeadline) -> dict[int, ArticleStat]:
+    stats = {}
+
+    for chunk in _chunks(article_ids, deadline):
+        for row in db.query(ArticleStat).filter(ArticleStat.article_id.in_(chunk)).all():
+            stats[row.article_id] = row
+
+    return stats
+
+
+# Articles whose normalized content contains the query, only the given articles are read
+def _content_phrase_matches(db: Session, query_norm: str, article_ids: list[int], deadline: SearchDeadline) -> set[int]:
+    matches = set()
+
+    for chunk in _chunks(article_ids, deadline):
+        for article_id, content in (
+            db.query(Article.article_id, Article.content)
+            .filter(Article.article_id.in_(chunk))
+            .all()
+        ):
+            if query_norm in normalize_text(content or ""):
+                matches.add(article_id)
+
+    return matches
+
+
+# The popularity all other popularities are normalized by (the highest one among the articles the user can find) and the smallest raw popularity (2 * likes + 3 * saves) that can pass MIN_SCORE without any text match, None when no article can
+def _popularity_bounds(db: Session, user_id: int) -> tuple[float, int | None]:
+    max_raw_popularity = (
+        db.query(func.max(ArticleStat.like_count * 2 + ArticleStat.save_count * 3))
+        .join(Article, Article.article_id == ArticleStat.article_id)
+        .filter(
+            Article.is_published.is_(True),
+            Article.author_id != user_id
+        )
+        .scalar()
+    ) or 0
+
+    max_popularity = log(max_raw_popularity + 1)
+
+    if max_popularity <= 0:
+        return max_popularity, None
+
+    # Without a text match the score is at most POPULARITY_WEIGHT * popularity + RECENCY_WEIGHT
+    min_normalized = (MIN_SCORE - RECENCY_WEIGHT) / POPULARITY_WEIGHT
+    return max_popularity, ceil(exp(max_popularity * min_normalized) - 1 - 1e-9)
+
+
+# Most popular first
+def _popular_articles(db: Session, min_raw: int | None) -> list[int]:
+    if min_raw is None:
+        return []
+
+    raw_popularity = ArticleStat.like_count * 2 + ArticleStat.save_count * 3
+
+    return [
+        article_id for (article_id,) in
+        db.query(ArticleStat.article_id)
+        .filter(raw_popularity >= min_raw)
+        .order_by(raw_popularity.desc(), ArticleStat.article_id)
+        .all()
+    ]
+
+
+# The creation dates of the given articles the user can find: published and written by someone else. Keeps the order of article_ids
+def _visible_articles(db: Session, article_ids, user_id: int, deadline: SearchDeadline) -> dict:
+    visible = {}
+
+    for chunk in _chunks(list(article_ids), deadline):
+        for article_id, created_at in (
+            db.query(Article.article_id, Article.created_at)
             .filter(
+                Article.article_id.in_(chunk),
                 Article.is_published.is_(True),
                 Article.author_id != user_id
             )
-            .limit(5000)
             .all()
+        ):
+            visible[article_id] = created_at
+
+    return visible
+
+
+# Loads the articles of a ranked page of (score, article_id) pairs, articles deleted in the meantime are skipped
+def _page_responses(db: Session, page: list[tuple[float, int]]) -> list[SearchArticleResponse]:
+    if not page:
+        return []
+
+    rows = {
+        article.article_id: (article, stats)
+        for article, stats in (
+            db.query(Article, ArticleStat)
+            .join(ArticleStat, Article.article_id == ArticleStat.article_id)
+            .filter(Article.article_id.in_([article_id for _, article_id in page]))
+            .all()
+        )
+    }
+
+    results = []
+    for score, article_id in page:
+        row = rows.get(article_id)
+        if row is None:
+            continue
+
+        article, stats = row
+        results.append(
+            SearchArticleResponse(
+                article_id=article.article_id,
+                title=article.title,
+                content=article.content,
+                author_id=article.author_id,
+                created_at=article.created_at,
+                likes=stats.like_count,
+                score=score
+            )
         )
 
-        if not candidates:
-            logger.warning("search_no_candidates")
-            return []
+    return results
 
-        logger.info(f"search_candidates_loaded count={len(candidates)}")
 
-        max_popularity = max(
-            popularity_score(stats) for _, _, stats, _ in candidates
+# Blends the text signals of the candidates with their popularity and recency, returns the best (score, article_id) pairs. The candidates are given in priority order, the ones whose stats could not be loaded within the time budget are left out
+def _rank_candidates(
+    db: Session,
+    candidates: list[int],
+    created_at_of,
+    phrase_score_of,
+    token_score_of,
+    max_popularity: float,
+    limit: int,
+    deadline: SearchDeadline
+) -> list[tuple[float, int]]:
+    stats_of = _load_stats(db, candidates, deadline)
+    scored = []
+
+    for article_id in candidates:
+        stats = stats_of.get(article_id)
+        if stats is None:
+            continue
+
+        final_score = blend_score(
+            phrase_score_of(article_id),
+            token_score_of(article_id),
+            normalize(popularity_score(stats), max_popularity),
+            recency_score(created_at_of(article_id))
         )
 
-        results: list[SearchArticleResponse] = []
+        if final_score < MIN_SCORE:
+            continue
 
-        for article, _, stats, user in candidates:
-            title = normalize_text(article.title)
-            content = normalize_text(article.content)
-            author_name = normalize_text(user.user_name)
+        scored.append((round(final_score, 4), article_id))
 
-            phrase_score = 1.0 if (
-                query_norm in title
-                or query_norm in content
-                or query_norm in author_name
-            ) else 0.0
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return scored[:limit]
 
-            token_score = max(
-                token_overlap_score(query, author_name),
-                0.7 * token_overlap_score(query, title)
-                + 0.3 * token_overlap_score(query, content)
-            )
 
-            popularity = normalize(
-                popularity_score(stats),
-                max_popularity
-            )
+# Ranks the articles with the in-memory inverted index (app.services.search_index_service): the candidates are the articles that contain a query token, the articles that can contain the whole query as a phrase and the articles popular enough to pass the minimum score without any text match
+def _index_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    query_norm = normalize_text(query)
+    query_tokens = tokenize(query)
+    index = get_search_index(db)
 
-            recency = recency_score(article)
+    def visible(article_id: int) -> bool:
+        document = index.documents.get(article_id)
+        return (
+            document is not None
+            and document.is_published
+            and document.author_id != user_id
+        )
 
-            final_score = (
-                0.45 * phrase_score +
-                0.35 * token_score +
-                0.12 * popularity +
-                0.08 * recency
-            )
+    # ---- TOKEN MATCHES ----
+    # BM25 over the title and the content, plain overlap for the (short) author name
+    title_scores = index.bm25("title", query_tokens)
+    content_scores = index.bm25("content", query_tokens)
+
+    author_hits = defaultdict(int)
+    for token in query_tokens:
+        for article_id in index.matching("author", token):
+            author_hits[article_id] += 1
+
+    # Number of query tokens in the title or content of each article, the articles in the intersection of the postings of every token are looked at first
+    coverage = defaultdict(int)
+    for token in query_tokens:
+        for article_id in index.matching("title", token) | index.matching("content", token):
+            coverage[article_id] += 1
+
+    def token_score(article_id: int) -> float:
+        if not query_tokens:
+            return 0.0
+
+        return max(
+            author_hits.get(article_id, 0) / len(query_tokens),
+            0.7 * title_scores.get(article_id, 0.0)
+            + 0.3 * content_scores.get(article_id, 0.0)
+        )
 
-            if final_score < 0.10:
-                continue
-
-            results.append(
-                SearchArticleResponse(
-                    article_id=article.article_id,
-                    title=article.title,
-                    content=article.content,
-                    author_id=article.author_id,
-                    created_at=article.created_at,
-                    likes=stats.like_count,
-                    score=round(final_score, 4)
-                )
-            )
+    # ---- PHRASE MATCHES ----
+    phrase_candidates = index.phrase_candidates(query, deadline)
+    if phrase_candidates is None:
+        phrase_candidates = set(index.documents)
+
+    phrase_matches = set()
+    content_checks = []
+
+    for article_id in phrase_candidates:
+        if not visible(article_id):
+            continue
+
+        document = index.documents[article_id]
+        if query_norm in document.title or query_norm in document.author_name:
+            phrase_matches.add(article_id)
+        else:
+            content_checks.append(article_id)
+
+    # The content has to be read from the database, the most promising articles are checked first in case the time budget runs out
+    content_checks, check_popularity = index.popularity_of_articles(content_checks)
+
+    content_checks = [
+        content_checks[i] for i in
+        np.lexsort((-check_popularity, [-coverage.get(article_id, 0) for article_id in content_checks]))
+    ] if content_checks else []
+
+    phrase_matches |= _content_phrase_matches(db, query_norm, content_checks, deadline)
+
+    # ---- RANKING ----
+    # Popularity, recency and visibility come from the columnar arrays of the index, so the blend and the threshold are array expressions over the candidate rows. Without a text match the score is at most POPULARITY_WEIGHT * popularity + RECENCY_WEIGHT, only articles popular enough to pass the threshold that way join the text candidates
+    text_candidates = set(title_scores) | set(content_scores) | set(author_hits) | phrase_matches
+    article_ids, row_popularity, created_at, max_popularity = index.ranking_columns(
+        user_id,
+        text_candidates,
+        popularity_floor=(MIN_SCORE - RECENCY_WEIGHT) / POPULARITY_WEIGHT
+    )
+
+    logger.info(f"search_candidates_loaded count={len(article_ids)}")
+
+    if len(article_ids) == 0:
+        return []
+
+    normalized_popularity = (
+        np.minimum(row_popularity / max_popularity, 1.0)
+        if max_popularity > 0 else np.zeros(len(article_ids))
+    )
+    recency = 1.0 / (1.0 + np.maximum(time.time() - created_at, 0.0))
+
+    # The text signals are computed per article, so the candidates are scored in chunks in priority order (most query tokens, then most popular) until the time budget runs out
+    covered = np.fromiter((coverage.get(article_id, 0) for article_id in article_ids.tolist()), dtype=np.int64, count=len(article_ids))
+    priority = np.lexsort((-row_popularity, -covered))
+
+    passing_rows = []
+    passing_scores = []
+
+    for chunk in _chunks(priority, deadline, SCORE_CHUNK_SIZE):
+        id_list = article_ids[chunk].tolist()
+        phrase = np.fromiter((article_id in phrase_matches for article_id in id_list), dtype=np.float64, count=len(id_list))
+        token = np.fromiter((token_score(article_id) for article_id in id_list), dtype=np.float64, count=len(id_list))
+
+        chunk_scores = blend_score(phrase, token, normalized_popularity[chunk], recency[chunk])
+        passing = chunk_scores >= MIN_SCORE
+        passing_rows.append(chunk[passing])
+        passing_scores.append(chunk_scores[passing])
+
+    scores = np.round(np.concatenate(passing_scores), 4)
+    article_ids = article_ids[np.concatenate(passing_rows)]
+
+    # Only the rows that can make the page are sorted, ties with the last one included so the order stays (-score, article_id)
+    if len(scores) > limit:
+        cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        keep = scores >= cutoff
+        scores, article_ids = scores[keep], article_ids[keep]
+
+    order = np.lexsort((article_ids, -scores))[:limit]
+    return [(float(scores[i]), int(article_ids[i])) for i in order]
+
+
+# PostgreSQL: the filter and the whole blend run in one statement. The phrase and token signals come from the generated, GIN indexed articles.search_vector column (phraseto_tsquery and ts_rank_cd over an OR of the query tokens, normalized to [0, 1) with flag 32), the author name match stays a substring match on users
+POSTGRES_SCORE_SQL = """
+            :phrase_weight * (CASE WHEN (:has_phrase AND a.search_vector @@ q.phrase_query) OR replace(lower(u.user_name), '-', ' ') LIKE :author_pattern THEN 1 ELSE 0 END)
+            + :token_weight * (CASE WHEN :has_tokens THEN ts_rank_cd(a.search_vector, q.token_query, 32) ELSE 0 END)
+            + :popularity_weight * (CASE WHEN :max_popularity > 0 THEN LEAST(LN(s.like_count * 2 + s.save_count * 3 + 1) / :max_popularity, 1) ELSE 0 END)
+            + :recency_weight * (1.0 / (1 + GREATEST(EXTRACT(EPOCH FROM (LOCALTIMESTAMP - a.created_at)), 0)))
+"""
 
-        # Fallback logging
-        if len(results) < limit:
-            logger.info("search_fallback_triggered")
-
-            fallback = (
-                db.query(Article, ArticleStat)
-                .join(ArticleStat, Article.article_id == ArticleStat.article_id)
-                .filter(
-                    Article.is_published.is_(True),
-                    Article.author_id != user_id,
-                    Article.article_id.notin_(
-                        [r.article_id for r in results]
-                    )
-                )
-                .order_by(
-                    ArticleStat.like_count.desc(),
-                    Article.created_at.desc()
-                )
-                .limit(limit - len(results))
-                .all()
+POSTGRES_QUERY_SQL = """
+        CROSS JOIN (
+            SELECT
+                to_tsquery('english', :token_terms) AS token_query,
+                phraseto_tsquery('english', :query) AS phrase_query
+        ) q
+"""
+
+POSTGRES_SEARCH_SQL = text(f"""
+    SELECT article_id, score FROM (
+        SELECT
+            a.article_id,
+            {POSTGRES_SCORE_SQL} AS score
+        FROM articles a
+        JOIN article_stats s ON s.article_id = a.article_id
+        JOIN users u ON u.user_id = a.author_id
+        {POSTGRES_QUERY_SQL}
+        WHERE a.is_published
+          AND a.author_id != :user_id
+          AND (
+              (:has_tokens AND a.search_vector @@ q.token_query)
+              OR (:has_phrase AND a.search_vector @@ q.phrase_query)
+              OR replace(lower(u.user_name), '-', ' ') LIKE :author_pattern
+              OR s.like_count * 2 + s.save_count * 3 >= :min_raw
+          )
+    ) ranked
+    WHERE score >= :min_score
+    ORDER BY score DESC, article_id
+    LIMIT :limit
+""")
+
+# Cheap fallback once the ranking statement ran out of time: the first :limit token matches the GIN index returns, in no particular order, and only those are scored
+POSTGRES_FALLBACK_SQL = text(f"""
+    SELECT article_id, score FROM (
+        SELECT
+            a.article_id,
+            {POSTGRES_SCORE_SQL} AS score
+        FROM (
+            SELECT m.article_id
+            FROM articles m
+            WHERE m.is_published
+              AND m.author_id != :user_id
+              AND m.search_vector @@ to_tsquery('english', :token_terms)
+            LIMIT :limit
+        ) matched
+        JOIN articles a ON a.article_id = matched.article_id
+        JOIN article_stats s ON s.article_id = a.article_id
+        JOIN users u ON u.user_id = a.author_id
+        {POSTGRES_QUERY_SQL}
+    ) ranked
+    WHERE score >= :min_score
+    ORDER BY score DESC, article_id
+""")
+
+
+# The time budget becomes the statement_timeout of the ranking statement. When the statement is cancelled by it the bounded fallback statement returns what it finds within the same budget of the request instead, without a statement_timeout when the budget is disabled. Both run in a savepoint, so a cancelled statement only rolls back itself and not the transaction of the caller
+def _postgres_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    query_tokens = sorted(tokenize(query))
+    max_popularity, min_raw = _popularity_bounds(db, user_id)
+
+    params = _postgres_search_params(query, query_tokens, user_id, limit, max_popularity, min_raw)
+
+    try:
+        rows = _run_postgres_statement(db, POSTGRES_SEARCH_SQL, params, deadline.remaining_ms())
+    except OperationalError as error:
+        if not _is_query_canceled(error):
+            raise
+
+        deadline.expired = True
+        logger.warning(f"search_postgres_timeout query='{query}' falling_back=unranked_match")
+
+        if not query_tokens:
+            return []
+
+        try:
+            rows = _run_postgres_statement(db, POSTGRES_FALLBACK_SQL, params, deadline.budget_ms)
+        except OperationalError as fallback_error:
+            if not _is_query_canceled(fallback_error):
+                raise
+            return []
+
+    return [(round(float(score), 4), article_id) for article_id, score in rows]
+
+
+# 57014: query_canceled
+def _is_query_canceled(error: OperationalError) -> bool:
+    return getattr(error.orig, "pgcode", None) == "57014"
+
+
+# Runs one statement in a savepoint under the given statement_timeout (the setting is local to the savepoint's transaction and restored afterwards)
+def _run_postgres_statement(db: Session, statement, params: dict, timeout_ms: float | None):
+    with db.begin_nested():
+        previous_timeout = None
+
+        if timeout_ms is not None:
+            previous_timeout = db.execute(
+                text("SELECT current_setting('statement_timeout'), set_config('statement_timeout', :timeout, true)"),
+                {"timeout": str(max(int(timeout_ms), 1))}
+            ).first()[0]
+
+        rows = db.execute(statement, params).all()
+
+        if previous_timeout is not None:
+            db.execute(text("SELECT set_config('statement_timeout', :timeout, true)"), {"timeout": previous_timeout})
+
+    return rows
+
+
+def _postgres_search_params(query: str, query_tokens: list[str], user_id: int, limit: int, max_popularity: float, min_raw: int | None) -> dict:
+    return {
+        "query": " ".join(word_runs(query)),
+        "token_terms": " | ".join(query_tokens),
+        "has_tokens": bool(query_tokens),
+        "has_phrase": bool(word_runs(query)),
+        "author_pattern": f"%{like_escape(normalize_text(query))}%",
+        "max_popularity": max_popularity,
+        "min_raw": min_raw if min_raw is not None else 2 ** 62,
+        "user_id": user_id,
+        "phrase_weight": PHRASE_WEIGHT,
+        "token_weight": TOKEN_WEIGHT,
+        "popularity_weight": POPULARITY_WEIGHT,
+        "recency_weight": RECENCY_WEIGHT,
+        "min_score": MIN_SCORE,
+        "limit": limit,
+    }
+
+
+# SQLite (tests, local development): the FTS5 table article_search finds the token and phrase matches and ranks them with its built-in bm25(), the blend with popularity and recency is done on that candidate set only
+def _sqlite_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    query_tokens = sorted(tokenize(query))
+    runs = word_runs(query)
+
+    token_scores = {}
+    if query_tokens:
+        for article_id, rank in db.execute(
+            text("SELECT rowid, bm25(article_search, 0.7, 0.3) FROM article_search WHERE article_search MATCH :match"),
+            {"match": " OR ".join(f'"{token}"' for token in query_tokens)}
+        ):
+            # bm25() is negative, the more negative the better the match
+            relevance = -rank
+            token_scores[article_id] = relevance / (relevance + 1)
+
+    phrase_matches = set()
+    if runs:
+        phrase_matches = {
+            article_id for (article_id,) in db.execute(
+                text("SELECT rowid FROM article_search WHERE article_search MATCH :match"),
+                {"match": '"' + " ".join(runs) + '"'}
             )
+        }
 
-            for article, stats in fallback:
-                results.append(
-                    SearchArticleResponse(
-                        article_id=article.article_id,
-                        title=article.title,
-                        content=article.content,
-                        author_id=article.author_id,
-                        created_at=article.created_at,
-                        likes=stats.like_count,
-                        score=0.20
-                    )
-                )
+    phrase_matches |= {
+        article_id for (article_id,) in
+        db.query(Article.article_id)
+        .join(User, Article.author_id == User.user_id)
+        .filter(func.replace(func.lower(User.user_name), "-", " ").like(f"%{like_escape(normalize_text(query))}%", escape="\\"))
+        .all()
+    }
+
+    max_popularity, min_raw = _popularity_bounds(db, user_id)
+
+    # Candidates in priority order: the phrase matches and the best token matches first, then the articles that are only popular
+    text_matches = sorted(
+        set(token_scores) | phrase_matches,
+        key=lambda article_id: (article_id not in phrase_matches, -token_scores.get(article_id, 0.0), article_id)
+    )
+    candidate_ids = text_matches + [
+        article_id for article_id in _popular_articles(db, min_raw)
+        if article_id not in token_scores and article_id not in phrase_matches
+    ]
+    visible = _visible_articles(db, candidate_ids, user_id, deadline)
+
+    logger.info(f"search_candidates_loaded count={len(visible)}")
+
+    return _rank_candidates(
+        db,
+        list(visible),
+        visible.get,
+        lambda article_id: 1.0 if article_id in phrase_matches else 0.0,
+        lambda article_id: token_scores.get(article_id, 0.0),
+        max_popularity,
+        limit,
+        deadline
+    )
+
+
+# Lexical search on the configured backend, returns the best (score, article_id) pairs
+def _lexical_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    if SEARCH_BACKEND == "database" and db.bind.dialect.name == "postgresql":
+        return _postgres_search(db, query, user_id, limit, deadline)
+
+    if SEARCH_BACKEND == "database" and db.bind.dialect.name == "sqlite":
+        return _sqlite_search(db, query, user_id, limit, deadline)
+
+    return _index_search(db, query, user_id, limit, deadline)
+
+
+# Semantic search: the query is turned into a TF-IDF vector with the fitted text vectorizer and compared to the text vectors of all articles at once (app.services.article_index_service), so articles are found by their vocabulary as a whole instead of by exact tokens. The similarity stands in for both text signals of the blend, popularity and recency are added as usual
+def _semantic_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    try:
+        index = get_article_index(db)
+        query_vector = build_query_vector(db, query, index.model_version)
+    except FileNotFoundError:
+        logger.warning("search_semantic_vectorizer_missing")
+        return []
+
+    text_vec = dict(zip(query_vector["indices"], query_vector["values"]))
+    article_ids, similarities = index.search_text(text_vec, SEARCH_SEMANTIC_CANDIDATES)
+
+    similarity_of = dict(zip(article_ids.tolist(), similarities.tolist()))
+    visible = _visible_articles(db, similarity_of, user_id, deadline)
+    max_popularity, _ = _popularity_bounds(db, user_id)
+
+    logger.info(f"search_semantic_candidates_loaded count={len(visible)}")
+
+    return _rank_candidates(
+        db,
+        list(visible),
+        visible.get,
+        similarity_of.get,
+        similarity_of.get,
+        max_popularity,
+        limit,
+        deadline
+    )
+
+
+# Hybrid search: a linear blend of the lexical and the semantic score of every article either of them ranked, an article found by only one of them keeps that share of its score
+def _blended_search(db: Session, query: str, user_id: int, limit: int, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    pool = max(limit, SEARCH_SEMANTIC_CANDIDATES)
+    lexical = {article_id: score for score, article_id in _lexical_search(db, query, user_id, pool, deadline)}
+    semantic = {article_id: score for score, article_id in _semantic_search(db, query, user_id, pool, deadline)}
+
+    blended = [
+        (
+            round(
+                (1 - SEARCH_HYBRID_SEMANTIC_WEIGHT) * lexical.get(article_id, 0.0)
+                + SEARCH_HYBRID_SEMANTIC_WEIGHT * semantic.get(article_id, 0.0),
+                4
+            ),
+            article_id
+        )
+        for article_id in lexical.keys() | semantic.keys()
+    ]
+
+    blended = [item for item in blended if item[0] >= MIN_SCORE]
+    blended.sort(key=lambda item: (-item[0], item[1]))
+    return blended[:limit]
+
+
+# Opaque cursor of the next page: the cache generation the ranked list was stored under, the offset of the page and the page size
+def _encode_cursor(generation: tuple, offset: int, page_size: int) -> str:
+    payload = json.dumps({"g": list(generation), "o": offset, "s": page_size}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[tuple, int, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        generation = tuple(int(part) for part in payload["g"])
+        offset = int(payload["o"])
+        page_size = int(payload["s"])
+    except (ValueError, TypeError, KeyError):
+        generation, offset, page_size = (), -1, 0
+
+    if len(generation) != 2 or offset < 0 or page_size < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid search cursor"
+        )
 
-        # User exact ILIKE search
-# Substring user search (case-insensitive)
-        matching_users = (
-            db.query(User)
+    return generation, offset, page_size
+
+
+# Ranks up to SEARCH_MAX_RESULTS articles for the query, topped up with the most liked articles when there are fewer than a page of them
+def _rank_query(db: Session, query: str, user_id: int, page_size: int, mode: str, deadline: SearchDeadline) -> list[tuple[float, int]]:
+    if mode == "semantic":
+        ranked = _semantic_search(db, query, user_id, SEARCH_MAX_RESULTS, deadline)
+    elif mode == "hybrid":
+        ranked = _blended_search(db, query, user_id, SEARCH_MAX_RESULTS, deadline)
+    else:
+        ranked = _lexical_search(db, query, user_id, SEARCH_MAX_RESULTS, deadline)
+
+    # Fallback logging
+    if len(ranked) < page_size:
+        logger.info("search_fallback_triggered")
+
+        fallback = (
+            db.query(Article.article_id)
+            .join(ArticleStat, Article.article_id == ArticleStat.article_id)
             .filter(
-                User.user_name.ilike(f"%{query}%")
+                Article.is_published.is_(True),
+                Article.author_id != user_id,
+                Article.article_id.notin_(
+                    [article_id for _, article_id in ranked]
+                )
             )
-            .limit(10)
+            .order_by(
+                ArticleStat.like_count.desc(),
+                Article.created_at.desc()
+            )
+            .limit(page_size - len(ranked))
             .all()
         )
 
-        user_results = [
-            SearchUserResponse(
-                user_id=u.user_id,
-                user_name=u.user_name,
-                bio=u.bio
-            )
-            for u in matching_users
-        ]
+        ranked = ranked + [(0.20, article_id) for (article_id,) in fallback]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+    return ranked
+
+
+"""
+This service implements a hybrid search algorithm that combines phrase matching, BM25 token relevance, article popularity, and recency to rank articles based on their relevance to the search query. With SEARCH_BACKEND=memory (the default) the candidates come from the in-memory inverted index, with SEARCH_BACKEND=database the text matching and ranking is pushed into the database: PostgreSQL full-text search over a GIN indexed tsvector column, or an FTS5 table on SQLite. Either way only the candidates are scored and only the returned page is loaded from the database. The algorithm also includes a fallback mechanism to ensure that some results are returned even if the initial scoring does not yield enough relevant articles; it only runs when a query is ranked, i.e. for its first page.
+
+Results are paged with an opaque cursor. The first page ranks up to SEARCH_MAX_RESULTS articles once and caches that ranked list, the cursor of every following page names the cache generation of the list and the offset into it, so later pages are sliced out of the same ranking instead of ranking the query again, and stay consistent with the first page even if articles were written in between (articles deleted since are left out of their page). When the list has been dropped from the cache the query is ranked again and the page is taken from the same offset of the new ranking.
 
+Ranking a query is limited by a time budget (see SearchDeadline). When it runs out the best results found until then are returned with partial=True, the fallback still tops up the first page. Such a ranking is only cached briefly for the cursors of its later pages, it is never served to a new search.
+"""
+def hybrid_search(
+    db: Session,
+    query: str,
+    user_id: int,
+    limit: int = 5,
+    mode: str = "lexical",
+    cursor: str | None = None,
+    budget_ms: float | None = None
+) -> dict:
+
+    offset = 0
+    generation = None
+
+    if cursor is not None:
+        generation, offset, limit = _decode_cursor(cursor)
 
-        
-        results.sort(key=lambda x: x.score, reverse=True)
+    logger.info(f"search_start query='{query}' user_id={user_id} mode={mode} offset={offset}")
+
+    try:
+        cache_key = search_cache_key(query, user_id, limit, SEARCH_BACKEND, mode, generation=generation)
+        cached = get_cached_search(cache_key)
+
+        if cached is None and generation is not None:
+            logger.info(f"search_cursor_expired query='{query}' user_id={user_id} offset={offset}")
+            cache_key = search_cache_key(query, user_id, limit, SEARCH_BACKEND, mode)
+            cached = get_cached_search(cache_key)
+
+        # A partial ranking is only kept for the cursors of its own pages, a new search (which may also have a larger budget) ranks again
+        if cached is not None and cached["partial"] and (generation is None or cache_key[0] != generation):
+            cached = None
+
+        if cached is not None:
+            logger.info(f"search_cache_hit query='{query}' user_id={user_id} offset={offset}")
+        else:
+            deadline = SearchDeadline(SEARCH_TIME_BUDGET_MS if budget_ms is None else budget_ms)
+            ranked = _rank_query(db, query, user_id, limit, mode, deadline)
+
+            if deadline.expired:
+                logger.warning(f"search_time_budget_exceeded query='{query}' user_id={user_id} mode={mode} ranked={len(ranked)}")
+
+            # Substring user search (case-insensitive) through a trigram index, most similar names first
+            matching_users = search_users(db, query, limit=10)
+
+            cached = {
+                "ranked": ranked,
+                "partial": deadline.expired,
+                "first_page": _page_responses(db, ranked[:limit]),
+                "users": [
+                    SearchUserResponse(
+                        user_id=u.user_id,
+                        user_name=u.user_name,
+                        bio=u.bio
+                    )
+                    for u in matching_users
+                ]
+            }
+            cache_search(cache_key, cached, paged=len(ranked) > limit, partial=deadline.expired)
+
+        ranked = cached["ranked"]
+
+        if offset == 0:
+            results = cached["first_page"]
+            user_results = cached["users"]
+        else:
+            results = _page_responses(db, ranked[offset:offset + limit])
+            user_results = []
+
+        next_cursor = None
+        if offset + limit < len(ranked):
+            next_cursor = _encode_cursor(cache_key[0], offset + limit, limit)
 
         logger.info(
-            f"search_completed query='{query}' results={len(results[:limit])}"
+            f"search_completed query='{query}' results={len(results)} offset={offset} ranked={len(ranked)}"
         )
 
         return {
-            "articles": results[:limit],
-            "users": user_results
+            "articles": results,
+            "users": user_results,
+            "next_cursor": next_cursor,
+            "partial": cached["partial"]
         }
 
 
     except Exception:
         logger.exception(f"search_failed query='{query}'")
         raise
-
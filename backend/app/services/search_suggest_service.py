@@ -0,0 +1,389 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from math import log1p
+from sqlalchemy.orm import Session
+from app.database.db import SessionLocal
+from app.models.article_model import Article, ArticleStat, ArticleTag, Tag
+from app.models.user_model import User
+from app.core.config import SEARCH_SUGGEST_REFRESH_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+SUGGEST_KINDS = ("article", "tag", "user")
+
+# Prefix ranges with more entries than this are not scanned on every keystroke, their best CACHE_DEPTH ids are kept and updated in place by writes. Ranges of prefixes up to WARM_PREFIX_LENGTH characters are cached while the index is built
+SCAN_LIMIT = 2000
+CACHE_DEPTH = 20
+WARM_PREFIX_LENGTH = 2
+
+KEY_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Sorts after every character a key can contain, (prefix + KEY_END,) is the end of the range of the prefix
+KEY_END = "\uffff"
+
+
+def normalize_prefix(text: str) -> str:
+    return " ".join(KEY_WORD_PATTERN.findall(text.lower()))
+
+
+# Every key a text can be found under: the normalized text from the start of each of its words, so "Intro to pandas" is suggested for "intro", "to p" and "pand"
+def suggestion_keys(text: str) -> list[str]:
+    words = KEY_WORD_PATTERN.findall(text.lower())
+    return [" ".join(words[start:]) for start in range(len(words))]
+
+
+# Weight of an article, popular articles first. Tags and authors weigh the sum of the weights of their articles
+def article_weight(like_count: int, save_count: int) -> float:
+    return 1.0 + log1p((like_count or 0) * 2 + (save_count or 0) * 3)
+
+
+"""
+This service backs the search box autocomplete (/search/suggest). Article titles, tag names and user names are kept in one sorted array of (key, id) pairs per kind, a prefix is looked up with two binary searches and the entries in between are ranked by weight, so a keystroke never touches the database. Writes made by this process update the arrays in place (bisect.insort), the whole structure is rebuilt in a background thread every SEARCH_SUGGEST_REFRESH_SECONDS to pick up like/save counts and changes made by other processes.
+"""
+class SuggestIndex:
+    def __init__(self):
+        self.built_at = time.monotonic()
+        self.entries = {kind: [] for kind in SUGGEST_KINDS}
+        self.texts = {kind: {} for kind in SUGGEST_KINDS}
+        self.weights = {kind: defaultdict(float) for kind in SUGGEST_KINDS}
+
+        # author id, tag ids and weight of every article, needed to take its share out of the tag and author weights again
+        self.article_links: dict[int, tuple[int, tuple[int, ...], float]] = {}
+
+        # Best ids of the broad prefixes, (kind, prefix) -> ids heaviest first
+        self._top: dict[tuple[str, str], list[int]] = {}
+        self._lock = threading.RLock()
+
+    def _rank_key(self, kind: str):
+        weights = self.weights[kind]
+        return lambda item_id: (-weights.get(item_id, 0.0), item_id)
+
+    # Keeps the cached best ids of every prefix of the text in line with the current weight of the item. An item that drops out of a list is not replaced, a list that got shorter than the requested limit is scanned again
+    def _touch(self, kind: str, item_id: int, text: str):
+        if not self._top:
+            return
+
+        present = item_id in self.texts[kind]
+        weights = self.weights[kind]
+        weight = weights.get(item_id, 0.0)
+        rank_key = self._rank_key(kind)
+
+        for key in suggestion_keys(text):
+            for end in range(1, len(key) + 1):
+                ids = self._top.get((kind, key[:end]))
+                if ids is None:
+                    continue
+
+                if item_id in ids:
+                    ids.remove(item_id)
+
+                if not ids:
+                    del self._top[(kind, key[:end])]
+                elif present and weight >= weights.get(ids[-1], 0.0):
+                    ids.append(item_id)
+                    ids.sort(key=rank_key)
+                    del ids[CACHE_DEPTH:]
+
+    def _put(self, kind: str, item_id: int, text: str):
+        self._drop(kind, item_id)
+        self.texts[kind][item_id] = text
+
+        for key in suggestion_keys(text):
+            insort(self.entries[kind], (key, item_id))
+
+        self._touch(kind, item_id, text)
+
+    def _drop(self, kind: str, item_id: int):
+        text = self.texts[kind].pop(item_id, None)
+
+        if text is None:
+            return
+
+        entries = self.entries[kind]
+        for key in suggestion_keys(text):
+            position = bisect_left(entries, (key, item_id))
+            if position < len(entries) and entries[position] == (key, item_id):
+                del entries[position]
+
+        self._touch(kind, item_id, text)
+
+    def _reweigh(self, kind: str, item_id: int, delta: float):
+        self.weights[kind][item_id] += delta
+
+        text = self.texts[kind].get(item_id)
+        if text is not None:
+            self._touch(kind, item_id, text)
+
+    # Bulk insert for the initial build, the entries are sorted once instead of one insort per key
+    def load(self, kind: str, rows):
+        entries = self.entries[kind]
+        texts = self.texts[kind]
+
+        for item_id, text in rows:
+            texts[item_id] = text
+            entries.extend((key, item_id) for key in suggestion_keys(text))
+
+        entries.sort()
+
+    def link_article(self, article_id: int, author_id: int, tag_ids: tuple[int, ...], weight: float):
+        for tag_id in tag_ids:
+            self._reweigh("tag", tag_id, weight)
+
+        self._reweigh("user", author_id, weight)
+        self.weights["article"][article_id] = weight
+        self.article_links[article_id] = (author_id, tag_ids, weight)
+
+    # Caches the best ids of every broad prefix of up to max_length characters, so the first keystrokes after a build do not scan
+    def warm(self, max_length: int = WARM_PREFIX_LENGTH):
+        for kind in SUGGEST_KINDS:
+            entries = self.entries[kind]
+
+            for length in range(1, max_length + 1):
+                position = 0
+
+                # Jumps from the range of one prefix to the next
+                while position < len(entries):
+                    prefix = entries[position][0][:length]
+
+                    if len(prefix) < length:
+                        position += 1
+                        continue
+
+                    end = bisect_left(entries, (prefix + KEY_END,), position)
+                    if end - position > SCAN_LIMIT:
+                        self._best(kind, prefix, CACHE_DEPTH)
+
+                    position = end
+
+    def set_article(self, article_id: int, title: str, author_id: int, tags: dict[int, str], weight: float):
+        with self._lock:
+            self.remove_article(article_id)
+
+            for tag_id, tag_name in tags.items():
+                if tag_id not in self.texts["tag"]:
+                    self._put("tag", tag_id, tag_name)
+
+            self.weights["article"][article_id] = weight
+            self._put("article", article_id, title)
+            self.link_article(article_id, author_id, tuple(tags), weight)
+
+    def remove_article(self, article_id: int):
+        with self._lock:
+            links = self.article_links.pop(article_id, None)
+
+            if links is None:
+                return
+
+            author_id, tag_ids, weight = links
+            for tag_id in tag_ids:
+                self._reweigh("tag", tag_id, -weight)
+            self._reweigh("user", author_id, -weight)
+
+            self._drop("article", article_id)
+            self.weights["article"].pop(article_id, None)
+
+    def set_user(self, user_id: int, user_name: str):
+        with self._lock:
+            self._put("user", user_id, user_name)
+
+    def remove_user(self, user_id: int):
+        with self._lock:
+            self._drop("user", user_id)
+            self.weights["user"].pop(user_id, None)
+
+    def remove_tag(self, tag_id: int):
+        with self._lock:
+            self._drop("tag", tag_id)
+            self.weights["tag"].pop(tag_id, None)
+
+    # Ids of the limit heaviest entries of the kind that have a key starting with the prefix
+    def _best(self, kind: str, prefix: str, limit: int) -> list[int]:
+        cached = self._top.get((kind, prefix))
+        if cached is not None and len(cached) >= limit:
+            return cached[:limit]
+
+        entries = self.entries[kind]
+        start = bisect_left(entries, (prefix,))
+        end = bisect_left(entries, (prefix + KEY_END,))
+        ids = {item_id for _, item_id in entries[start:end]}
+
+        if end - start <= SCAN_LIMIT:
+            return sorted(ids, key=self._rank_key(kind))[:limit]
+
+        weights = self.weights[kind]
+        best = heapq.nlargest(CACHE_DEPTH, ids, key=lambda item_id: (weights.get(item_id, 0.0), -item_id))
+        self._top[(kind, prefix)] = best
+
+        return best[:limit]
+
+    def suggest(self, query: str, limit: int) -> list[tuple[str, int, str]]:
+        prefix = normalize_prefix(query)
+
+        if not prefix:
+            return []
+
+        with self._lock:
+            return [
+                (kind, item_id, self.texts[kind][item_id])
+                for kind in SUGGEST_KINDS
+                for item_id in self._best(kind, prefix, limit)
+            ]
+
+
+def _article_rows(db: Session):
+    return (
+        db.query(Article.article_id, Article.title, Article.author_id, ArticleStat.like_count, ArticleStat.save_count)
+        .outerjoin(ArticleStat, ArticleStat.article_id == Article.article_id)
+        .filter(Article.is_published.is_(True))
+    )
+
+
+def _build_index(db: Session) -> SuggestIndex:
+    started = time.perf_counter()
+    index = SuggestIndex()
+
+    index.load("tag", db.query(Tag.tag_id, Tag.tag_name))
+    index.load("user", db.query(User.user_id, User.user_name))
+
+    tags_of = defaultdict(list)
+    for article_id, tag_id in db.query(ArticleTag.article_id, ArticleTag.tag_id):
+        tags_of[article_id].append(tag_id)
+
+    rows = _article_rows(db).all()
+    index.load("article", ((row.article_id, row.title) for row in rows))
+
+    for article_id, _, author_id, like_count, save_count in rows:
+        index.link_article(article_id, author_id, tuple(tags_of.get(article_id, ())), article_weight(like_count, save_count))
+
+    index.warm()
+
+    logger.info(
+        f"search_suggest_index_built articles={len(index.texts['article'])} "
+        f"tags={len(index.texts['tag'])} users={len(index.texts['user'])} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+    return index
+
+
+_index: SuggestIndex | None = None
+_index_lock = threading.Lock()
+
+# Changes made while a rebuild runs, they are applied to the new index before it replaces the old one
+_rebuilding = False
+_pending_changes = []
+
+
+def _rebuild_in_background():
+    global _index, _rebuilding
+
+    db = SessionLocal()
+    try:
+        index = _build_index(db)
+    except Exception:
+        logger.exception("search_suggest_rebuild_failed")
+        index = None
+    finally:
+        db.close()
+
+    with _index_lock:
+        if index is not None:
+            for change in _pending_changes:
+                change(index)
+            _index = index
+        elif _index is not None:
+            # Try again after another full interval
+            _index.built_at = time.monotonic()
+
+        _pending_changes.clear()
+        _rebuilding = False
+
+
+# Returns the process-wide suggestion index. The first call builds it, later calls keep serving the current index while a stale one is rebuilt in the background
+def get_suggest_index(db: Session) -> SuggestIndex:
+    global _index, _rebuilding
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _build_index(db)
+            return _index
+
+    if time.monotonic() - _index.built_at >= SEARCH_SUGGEST_REFRESH_SECONDS and not _rebuilding:
+        with _index_lock:
+            if not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, daemon=True).start()
+
+    return _index
+
+
+def suggest(db: Session, query: str, limit: int = 5) -> list[tuple[str, int, str]]:
+    return get_suggest_index(db).suggest(query, limit)
+
+
+def _apply_local_change(change):
+    with _index_lock:
+        if _index is None:
+            return
+
+        change(_index)
+
+        if _rebuilding:
+            _pending_changes.append(change)
+
+
+# Called after an article was created or updated
+def refresh_article_suggestions(db: Session, article_id: int):
+    if _index is None:
+        return
+
+    row = _article_rows(db).filter(Article.article_id == article_id).first()
+
+    if row is None:
+        _apply_local_change(lambda index: index.remove_article(article_id))
+        return
+
+    tags = dict(
+        db.query(Tag.tag_id, Tag.tag_name)
+        .join(ArticleTag, ArticleTag.tag_id == Tag.tag_id)
+        .filter(ArticleTag.article_id == article_id)
+        .all()
+    )
+    weight = article_weight(row.like_count, row.save_count)
+
+    _apply_local_change(lambda index: index.set_article(article_id, row.title, row.author_id, tags, weight))
+
+
+# Called after articles were deleted
+def remove_article_suggestions(article_ids: list[int]):
+    def change(index: SuggestIndex):
+        for article_id in article_ids:
+            index.remove_article(article_id)
+
+    _apply_local_change(change)
+
+
+# Called after a user registered or changed their user name
+def set_user_suggestion(user_id: int, user_name: str):
+    _apply_local_change(lambda index: index.set_user(user_id, user_name))
+
+
+def remove_user_suggestion(user_id: int):
+    _apply_local_change(lambda index: index.remove_user(user_id))
+
+
+def remove_tag_suggestion(tag_id: int):
+    _apply_local_change(lambda index: index.remove_tag(tag_id))
+
+
+def reset_suggest_index():
+    global _index, _rebuilding
+    with _index_lock:
+        _index = None
+        _rebuilding = False
+        _pending_changes.clear()
@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from app.models.user_model import User
+from app.utils.text_utils import like_escape, substring_trigrams, trigram_similarity
+from app.core.config import SEARCH_INDEX_REFRESH_SECONDS
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+# Number of rows streamed from the database at once while building the index
+BUILD_BATCH_SIZE = 5000
+
+
+"""
+Substring search over the user names, ranked by trigram similarity to the query. On PostgreSQL the match runs on the lower(user_name) GIN trigram index from app.database.search_schema, everywhere else on a process-wide trigram -> user ids postings map: a name can only contain the query if it contains every trigram of the query, so only the names in the intersection of those postings are compared, however many users there are. The map is built lazily, kept up to date in place by registrations, renames and deletions in this process and rebuilt when another process registered, deleted or renamed a user (the number of users, the highest user id or the sum of the name versions changed).
+"""
+class UserNameIndex:
+    def __init__(self, signature: tuple):
+        self.signature = signature
+        self.names: dict[int, str] = {}
+        self.postings: dict[str, set[int]] = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, user_id: int, user_name: str):
+        with self._lock:
+            self.remove(user_id)
+            name = user_name.lower()
+            self.names[user_id] = name
+
+            for gram in substring_trigrams(name):
+                self.postings[gram].add(user_id)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            name = self.names.pop(user_id, None)
+
+            if name is None:
+                return
+
+            for gram in substring_trigrams(name):
+                ids = self.postings.get(gram)
+                if ids is None:
+                    continue
+
+                ids.discard(user_id)
+                if not ids:
+                    del self.postings[gram]
+
+    # Ids of the users whose name contains the query, most similar names first
+    def search(self, query: str, limit: int) -> list[int]:
+        query = query.lower()
+        grams = substring_trigrams(query)
+
+        with self._lock:
+            if grams:
+                postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                # Queries shorter than a trigram: every trigram that contains the query
+                candidates = set().union(*(
+                    ids for gram, ids in self.postings.items() if query in gram
+                ))
+
+            matches = [
+                (user_id, self.names[user_id])
+                for user_id in candidates
+                if query in self.names[user_id]
+            ]
+
+        matches.sort(key=lambda match: (-trigram_similarity(query, match[1]), match[0]))
+        return [user_id for user_id, _ in matches[:limit]]
+
+
+POSTGRES_USER_SEARCH_SQL = text("""
+    SELECT user_id FROM users
+    WHERE lower(user_name) LIKE :pattern ESCAPE '\\'
+    ORDER BY similarity(lower(user_name), :query) DESC, user_id
+    LIMIT :limit
+""")
+
+
+_has_trigram_index: bool | None = None
+
+
+def _postgres_trigram_index(db: Session) -> bool:
+    global _has_trigram_index
+
+    if _has_trigram_index is None:
+        _has_trigram_index = db.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_users_user_name_trgm'"
+        )).first() is not None
+
+        if not _has_trigram_index:
+            logger.warning("user_search_trigram_index_missing")
+
+    return _has_trigram_index
+
+
+# Registrations and deletions change the count or the highest id, renames the sum of the name versions
+def _user_signature(db: Session) -> tuple:
+    count, max_id, name_versions = db.query(
+        func.count(User.user_id),
+        func.coalesce(func.max(User.user_id), 0),
+        func.coalesce(func.sum(User.name_version), 0)
+    ).one()
+
+    return int(count), int(max_id), int(name_versions)
+
+
+def _build_index(db: Session, signature: tuple) -> UserNameIndex:
+    started = time.perf_counter()
+    index = UserNameIndex(signature)
+
+    for user_id, user_name in db.query(User.user_id, User.user_name).yield_per(BUILD_BATCH_SIZE):
+        index.add(user_id, user_name)
+
+    logger.info(
+        f"user_name_index_built users={len(index)} trigrams={len(index.postings)} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+    return index
+
+
+_index: UserNameIndex | None = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_user_name_index(db: Session) -> UserNameIndex:
+    global _index, _index_checked_at
+
+    if _index is not None and time.monotonic() - _index_checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+        return _index
+
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return _index
+
+        signature = _user_signature(db)
+
+        if _index is None or _index.signature != signature:
+            _index = _build_index(db, signature)
+
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+# Users whose name contains the query (case-insensitive), most similar names first
+def search_users(db: Session, query: str, limit: int = 10) -> list[User]:
+    if db.bind.dialect.name == "postgresql" and _postgres_trigram_index(db):
+        user_ids = [
+            user_id for (user_id,) in db.execute(POSTGRES_USER_SEARCH_SQL, {
+                "pattern": f"%{like_escape(query.lower())}%",
+                "query": query.lower(),
+                "limit": limit,
+            })
+        ]
+    else:
+        user_ids = get_user_name_index(db).search(query, limit)
+
+    if not user_ids:
+        return []
+
+    users = {
+        user.user_id: user
+        for user in db.query(User).filter(User.user_id.in_(user_ids)).all()
+    }
+
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+# Applies a change made by this process to the index in place and refreshes its signature
+def _apply_local_change(db: Session, change):
+    with _index_lock:
+        if _index is None:
+            return
+
+        change(_index)
+        _index.signature = _user_signature(db)
+
+
+# Called after a user registered or changed their user name
+def index_user_name(db: Session, user_id: int, user_name: str):
+    _apply_local_change(db, lambda index: index.add(user_id, user_name))
+
+
+# Called after a user was deleted
+def remove_user_name(db: Session, user_id: int):
+    _apply_local_change(db, lambda index: index.remove(user_id))
+
+
+def reset_user_name_index():
+    global _index, _index_checked_at, _has_trigram_index
+    with _index_lock:
+        _index = None
+        _index_checked_at = 0.0
+        _has_trigram_index = None
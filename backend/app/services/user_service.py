@@ -1,7 +1,12 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.models.user_model import User
 from app.schemas.user_schema import UserProfileUpdateRequest, PasswordChangeRequest
 from app.core.security import hash_password, verify_password
+from app.services.search_index_service import rename_search_author
+from app.services.user_search_service import index_user_name
+from app.services.search_suggest_service import set_user_suggestion
+from app.services.search_document_service import rename_author_search_documents
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
@@ -32,7 +37,11 @@ def update_user_profile(db: Session, user_id: int, data: UserProfileUpdateReques
             return None
 
         if data.user_name is not None:
+            if data.user_name != user.user_name:
+                user.name_version = func.coalesce(User.name_version, 0) + 1
+
             user.user_name = data.user_name
+            rename_author_search_documents(db, user_id, data.user_name)
 
         if data.birth_date is not None:
             user.birth_date = data.birth_date
@@ -49,6 +58,11 @@ def update_user_profile(db: Session, user_id: int, data: UserProfileUpdateReques
         db.commit()
         db.refresh(user)
 
+        if data.user_name is not None:
+            rename_search_author(db, user_id, user.user_name)
+            index_user_name(db, user_id, user.user_name)
+            set_user_suggestion(user_id, user.user_name)
+
         logger.info(f"user_profile_updated user_id={user_id}")
 
         return user
@@ -1,11 +1,13 @@
-import json
 from collections import defaultdict
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models.vector_model import UserVector
 from app.models.article_model import ArticleStat
 from app.models.vector_model import ArticleVector
 from app.models.interaction_model import UserInteraction
 from datetime import datetime
+from app.services.recommendation_cache_service import invalidate_user_recommendations
+from app.utils.vector_utils import read_sparse_dict, read_sparse_vector, pack_sparse_dict, pack_sparse_vector, add_sparse_vectors
 from app.core.logger import get_logger
 logger = get_logger(__name__)
 
@@ -15,17 +17,6 @@ INTERACTION_WEIGHTS = {
     "save": 3.0
 }
 
-def dict_from_sparse(vec_json: str) -> dict:
-    data = json.loads(vec_json)
-    return dict(zip(data["indices"], data["values"]))
-
-
-def sparse_to_json(vec: dict) -> str:
-    return json.dumps({
-        "indices": list(vec.keys()),
-        "values": list(vec.values())
-    })
-
 # Used when the user account is first created to generate some default vectors for the user to recommend him/her articles when they first enter the home page. The top N articles are fetched based on the popularity and the vectors of those articles are averaged to create the user vector.
 def create_default_user_vector(db: Session, user_id: int, top_n: int = 20):
     logger.info(f"default_user_vector_build_start user_id={user_id}")
@@ -61,8 +52,8 @@ def create_default_user_vector(db: Session, user_id: int, top_n: int = 20):
             if weight <= 0:
                 continue
 
-            text_vec = dict_from_sparse(av.text_vector)
-            tag_vec = dict_from_sparse(av.tag_vector)
+            text_vec = read_sparse_dict(av.text_vector_packed, av.text_vector)
+            tag_vec = read_sparse_dict(av.tag_vector_packed, av.tag_vector)
 
             for k, v in text_vec.items():
                 text_accumulator[k] += weight * v
@@ -89,17 +80,20 @@ def create_default_user_vector(db: Session, user_id: int, top_n: int = 20):
         )
 
         if existing:
-            existing.text_vector = sparse_to_json(text_accumulator)
-            existing.tag_vector = sparse_to_json(tag_accumulator)
+            existing.text_vector_packed = pack_sparse_dict(text_accumulator)
+            existing.tag_vector_packed = pack_sparse_dict(tag_accumulator)
+            existing.text_vector = None
+            existing.tag_vector = None
             logger.info(f"default_user_vector_updated user_id={user_id}")
         else:
             db.add(UserVector(
                 user_id=user_id,
-                text_vector=sparse_to_json(text_accumulator),
-                tag_vector=sparse_to_json(tag_accumulator)
+                text_vector_packed=pack_sparse_dict(text_accumulator),
+                tag_vector_packed=pack_sparse_dict(tag_accumulator)
             ))
             logger.info(f"default_user_vector_created user_id={user_id}")
 
+        invalidate_user_recommendations(db, user_id)
         db.commit()
 
     except Exception:
@@ -114,7 +108,7 @@ def recompute_user_vector_from_interactions(db: Session, user_id: int):
 
     try:
         interactions = (
-            db.query(UserInteraction.article_id, UserInteraction.interaction_type)
+            db.query(UserInteraction)
             .filter(UserInteraction.user_id == user_id)
             .filter(UserInteraction.interaction_type.in_(["like", "save"]))
             .all()
@@ -138,16 +132,21 @@ def recompute_user_vector_from_interactions(db: Session, user_id: int):
         tag_accumulator = defaultdict(float)
         total_weight = 0.0
 
-        for article_id, interaction_type in interactions:
+        for interaction in interactions:
+            article_id, interaction_type = interaction.article_id, interaction.interaction_type
             av = vector_map.get(article_id)
+
+            # Later removals subtract exactly the vector that is summed here
+            interaction.vector_version = av.vector_version if av else None
+
             if not av:
                 logger.warning(f"user_vector_missing_article_vector article_id={article_id}")
                 continue
 
             weight = INTERACTION_WEIGHTS[interaction_type]
 
-            text_vec = dict_from_sparse(av.text_vector)
-            tag_vec = dict_from_sparse(av.tag_vector)
+            text_vec = read_sparse_dict(av.text_vector_packed, av.text_vector)
+            tag_vec = read_sparse_dict(av.tag_vector_packed, av.tag_vector)
 
             for k, v in text_vec.items():
                 text_accumulator[k] += weight * v
@@ -161,14 +160,17 @@ def recompute_user_vector_from_interactions(db: Session, user_id: int):
             logger.warning(f"user_vector_recompute_zero_weight user_id={user_id}")
             return
 
+        text_sum_packed = pack_sparse_dict(text_accumulator)
+        tag_sum_packed = pack_sparse_dict(tag_accumulator)
+
         for k in text_accumulator:
             text_accumulator[k] /= total_weight
 
         for k in tag_accumulator:
             tag_accumulator[k] /= total_weight
 
-        text_json = sparse_to_json(text_accumulator)
-        tag_json = sparse_to_json(tag_accumulator)
+        text_packed = pack_sparse_dict(text_accumulator)
+        tag_packed = pack_sparse_dict(tag_accumulator)
 
         user_vec = (
             db.query(UserVector)
@@ -177,19 +179,28 @@ def recompute_user_vector_from_interactions(db: Session, user_id: int):
         )
 
         if user_vec:
-            user_vec.text_vector = text_json
-            user_vec.tag_vector = tag_json
+            user_vec.text_vector_packed = text_packed
+            user_vec.tag_vector_packed = tag_packed
+            user_vec.text_vector = None
+            user_vec.tag_vector = None
+            user_vec.text_sum_packed = text_sum_packed
+            user_vec.tag_sum_packed = tag_sum_packed
+            user_vec.total_weight = total_weight
             user_vec.last_updated = datetime.utcnow()
             logger.info(f"user_vector_updated user_id={user_id}")
         else:
             db.add(UserVector(
                 user_id=user_id,
-                text_vector=text_json,
-                tag_vector=tag_json,
+                text_vector_packed=text_packed,
+                tag_vector_packed=tag_packed,
+                text_sum_packed=text_sum_packed,
+                tag_sum_packed=tag_sum_packed,
+                total_weight=total_weight,
                 last_updated=datetime.utcnow()
             ))
             logger.info(f"user_vector_created user_id={user_id}")
 
+        invalidate_user_recommendations(db, user_id)
         db.commit()
 
     except Exception:
@@ -216,3 +227,112 @@ def mark_user_vector_dirty(db: Session, user_id: int):
         db.rollback()
         logger.exception(f"user_vector_dirty_failed user_id={user_id}")
         raise
+
+
+# Drops the running sums of a user vector, the next recommendation request recomputes the vector and its sums from every interaction
+def _mark_sums_stale(user_vec: UserVector):
+    user_vec.last_updated = None
+    user_vec.total_weight = None
+
+
+# Marks the vectors of every user who liked or saved one of the articles dirty, e.g. before the articles are deleted. The caller is responsible for committing
+def mark_interacting_users_dirty(db: Session, article_ids: list[int]) -> int:
+    user_ids = (
+        select(UserInteraction.user_id)
+        .where(UserInteraction.article_id.in_(article_ids))
+        .where(UserInteraction.interaction_type.in_(["like", "save"]))
+    )
+
+    return (
+        db.query(UserVector)
+        .filter(UserVector.user_id.in_(user_ids))
+        .update({"last_updated": None, "total_weight": None}, synchronize_session=False)
+    )
+
+
+# Applies a single like/save being added (sign=1) or removed (sign=-1) to the running weighted sums of the user vector, so a toggle only costs the size of one article vector instead of re-reading and re-averaging every interaction of the user. Users whose vector has no running sums yet (new users, default vectors, rows written before the sums existed) are marked dirty instead and get a full recompute on their next recommendation request, which also initializes the sums. The interaction row records the vector_version it added, a removal whose article vector has changed (or was never added) since then also marks the user dirty, as subtracting the current vector would leave the sums permanently off. The caller is responsible for committing.
+def apply_interaction_to_user_vector(
+    db: Session,
+    user_id: int,
+    article_id: int,
+    interaction_type: str,
+    sign: int,
+    interaction: UserInteraction | None = None
+):
+    weight = INTERACTION_WEIGHTS.get(interaction_type)
+    if weight is None:
+        return
+
+    # The sums are read, changed and written back, the row lock keeps two concurrent toggles of the same user from losing one of them
+    user_vec = (
+        db.query(UserVector)
+        .filter(UserVector.user_id == user_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+
+    if user_vec is None:
+        db.add(UserVector(user_id=user_id, last_updated=None))
+        logger.info(f"user_vector_placeholder_created user_id={user_id}")
+        return
+
+    if user_vec.total_weight is None:
+        user_vec.last_updated = None
+        logger.info(f"user_vector_marked_dirty user_id={user_id}")
+        return
+
+    av = (
+        db.query(ArticleVector)
+        .filter(ArticleVector.article_id == article_id)
+        .first()
+    )
+
+    if sign > 0 and not av:
+        logger.warning(f"user_vector_missing_article_vector article_id={article_id}")
+        return
+
+    if sign < 0 and interaction is not None and (av is None or interaction.vector_version != av.vector_version):
+        _mark_sums_stale(user_vec)
+        logger.info(f"user_vector_marked_dirty user_id={user_id} reason=article_vector_changed article_id={article_id}")
+        return
+
+    if sign > 0 and interaction is not None:
+        interaction.vector_version = av.vector_version
+
+    delta = sign * weight
+    total_weight = user_vec.total_weight + delta
+
+    # Once every like and save has been removed the sums only hold rounding noise, the full recompute builds the vector the user gets without them
+    if total_weight <= 1e-6:
+        _mark_sums_stale(user_vec)
+        invalidate_user_recommendations(db, user_id)
+        logger.info(f"user_vector_marked_dirty user_id={user_id} reason=no_weighted_interactions")
+        return
+
+    for sum_column, vector_column, article_packed, article_json in (
+        ("text_sum_packed", "text_vector_packed", av.text_vector_packed, av.text_vector),
+        ("tag_sum_packed", "tag_vector_packed", av.tag_vector_packed, av.tag_vector),
+    ):
+        sum_indices, sum_values, _ = read_sparse_vector(getattr(user_vec, sum_column))
+        article_indices, article_values, _ = read_sparse_vector(article_packed, article_json)
+
+        indices, values = add_sparse_vectors(
+            sum_indices, sum_values, article_indices, article_values, scale=delta
+        )
+
+        setattr(user_vec, sum_column, pack_sparse_vector(indices, values))
+        setattr(user_vec, vector_column, pack_sparse_vector(indices, values / total_weight))
+
+    user_vec.total_weight = total_weight
+
+    user_vec.text_vector = None
+    user_vec.tag_vector = None
+    user_vec.last_updated = datetime.utcnow()
+
+    invalidate_user_recommendations(db, user_id)
+
+    logger.info(
+        f"user_vector_incremental_update user_id={user_id} "
+        f"article_id={article_id} delta={delta} total_weight={user_vec.total_weight}"
+    )
@@ -0,0 +1,298 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.article_model import Article
+from app.models.vector_model import ArticleVector, VectorJob
+from app.services.article_vector_service import MAX_TEXT_CHARS
+from app.services.article_vector_batch_service import vectorize_article_block
+from app.services.article_index_service import invalidate_article_index, refresh_article_index_rows
+from app.services.related_article_service import update_article_neighbours
+from app.core.config import (
+    ARTICLE_VECTOR_DEBOUNCE_SECONDS,
+    VECTOR_JOB_MAX_ATTEMPTS,
+    VECTOR_JOB_RETRY_BASE_SECONDS,
+    VECTOR_JOB_RETRY_MAX_SECONDS,
+    VECTOR_JOB_LOCK_TIMEOUT_SECONDS
+)
+from app.core.logger import get_logger
+logger = get_logger(__name__)
+
+ARTICLE_VECTOR_JOB = "article_vector"
+
+# Counters of the jobs this process finished, reported by the worker
+_worker_stats = {"completed": 0, "failed": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+
+"""
+Durable queue of the article vectorization jobs, kept in the vector_jobs table so jobs survive restarts and run in the worker processes of app.jobs.vector_worker instead of the API workers. The API only enqueues: one row per article (the job key), enqueuing an article that is already waiting pushes its start back by ARTICLE_VECTOR_DEBOUNCE_SECONDS, so a burst of edits is vectorized once. Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL (a conditional UPDATE makes the claim atomic on SQLite as well) and vectorize a claimed batch with one transform per vectorizer. A job that fails is retried with an exponential backoff and marked failed after VECTOR_JOB_MAX_ATTEMPTS. A job that was requested again while it ran is put back instead of deleted, so the last edit is always vectorized.
+"""
+def enqueue_article_vector(db: Session, article_id: int, delay: float = ARTICLE_VECTOR_DEBOUNCE_SECONDS):
+    job_key = f"{ARTICLE_VECTOR_JOB}:{article_id}"
+    now = datetime.utcnow()
+    run_after = now + timedelta(seconds=delay)
+
+    for _ in range(2):
+        job = db.get(VectorJob, job_key)
+
+        if job is None:
+            db.add(VectorJob(
+                job_key=job_key,
+                kind=ARTICLE_VECTOR_JOB,
+                target_id=article_id,
+                status="pending",
+                attempts=0,
+                enqueued_at=now,
+                requested_at=now,
+                run_after=run_after
+            ))
+        else:
+            # A running job only notes the request, it is put back when it finishes
+            job.requested_at = now
+
+            if job.status != "running":
+                if job.status == "failed":
+                    job.enqueued_at = now
+                job.status = "pending"
+                job.attempts = 0
+                job.run_after = run_after
+
+        try:
+            db.commit()
+            logger.info(f"vector_job_enqueued job_key={job_key} new={job is None}")
+            return
+
+        except IntegrityError:
+            # Another request inserted the same job first, update that row instead
+            db.rollback()
+
+    logger.warning(f"vector_job_enqueue_conflict job_key={job_key}")
+
+
+def retry_delay(attempts: int) -> float:
+    return min(VECTOR_JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), VECTOR_JOB_RETRY_MAX_SECONDS)
+
+
+# Jobs that may run now: pending and due, or claimed by a worker that has not finished them within the lock timeout
+def _claimable(now: datetime):
+    return or_(
+        and_(VectorJob.status == "pending", VectorJob.run_after <= now),
+        and_(
+            VectorJob.status == "running",
+            VectorJob.locked_at < now - timedelta(seconds=VECTOR_JOB_LOCK_TIMEOUT_SECONDS)
+        )
+    )
+
+
+# Claims up to limit due jobs for this worker, returns them as plain rows (job_key, target_id, attempts, enqueued_at, requested_at)
+def claim_vector_jobs(db: Session, limit: int) -> list:
+    now = datetime.utcnow()
+
+    candidates = [
+        job_key for (job_key,) in
+        db.query(VectorJob.job_key)
+        .filter(_claimable(now))
+        .order_by(VectorJob.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    ]
+
+    claimed = []
+    for job_key in candidates:
+        updated = (
+            db.query(VectorJob)
+            .filter(VectorJob.job_key == job_key, _claimable(now))
+            .update(
+                {"status": "running", "locked_at": now, "attempts": VectorJob.attempts + 1},
+                synchronize_session=False
+            )
+        )
+
+        if updated:
+            claimed.append(job_key)
+
+    db.commit()
+
+    if not claimed:
+        return []
+
+    return (
+        db.query(VectorJob.job_key, VectorJob.target_id, VectorJob.attempts, VectorJob.enqueued_at, VectorJob.requested_at)
+        .filter(VectorJob.job_key.in_(claimed))
+        .all()
+    )
+
+
+# Deletes the finished jobs, a job that was requested again while it ran goes back to pending
+def complete_vector_jobs(db: Session, jobs: list):
+    now = datetime.utcnow()
+
+    for job in jobs:
+        deleted = (
+            db.query(VectorJob)
+            .filter(VectorJob.job_key == job.job_key, VectorJob.requested_at == job.requested_at)
+            .delete(synchronize_session=False)
+        )
+
+        if not deleted:
+            db.query(VectorJob).filter(VectorJob.job_key == job.job_key).update(
+                {"status": "pending", "attempts": 0, "locked_at": None, "enqueued_at": VectorJob.requested_at},
+                synchronize_session=False
+            )
+
+        latency = (now - job.enqueued_at).total_seconds()
+        _worker_stats["completed"] += 1
+        _worker_stats["latency_total"] += latency
+        _worker_stats["latency_max"] = max(_worker_stats["latency_max"], latency)
+
+    db.commit()
+
+
+def fail_vector_jobs(db: Session, jobs: list, error: Exception):
+    now = datetime.utcnow()
+
+    for job in jobs:
+        values = {"locked_at": None, "last_error": repr(error)[:1000]}
+
+        if job.attempts >= VECTOR_JOB_MAX_ATTEMPTS:
+            values["status"] = "failed"
+            logger.error(f"vector_job_gave_up job_key={job.job_key} attempts={job.attempts}")
+        else:
+            values["status"] = "pending"
+            values["run_after"] = now + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning(f"vector_job_retry_scheduled job_key={job.job_key} attempts={job.attempts}")
+
+        db.query(VectorJob).filter(VectorJob.job_key == job.job_key).update(values, synchronize_session=False)
+        _worker_stats["failed"] += 1
+
+    db.commit()
+
+
+# Vectorizes the articles of the claimed jobs in one block, articles deleted in the meantime are skipped. The vector versions are read in the same statement as the content, the block only replaces vectors that are still the ones read
+def _vectorize_jobs(db: Session, jobs: list):
+    result = (
+        db.query(Article.article_id, func.substr(Article.content, 1, MAX_TEXT_CHARS), ArticleVector.article_id, ArticleVector.vector_version)
+        .outerjoin(ArticleVector, ArticleVector.article_id == Article.article_id)
+        .filter(Article.article_id.in_([job.target_id for job in jobs]))
+        .order_by(Article.article_id)
+        .all()
+    )
+
+    rows = [(article_id, content or "") for article_id, content, _, _ in result]
+
+    if not rows:
+        return
+
+    versions = {
+        article_id: version or 0
+        for article_id, _, vector_article_id, version in result
+        if vector_article_id is not None
+    }
+
+    vectorize_article_block(db, rows, versions=versions)
+    invalidate_article_index()
+
+    # The vectors are stored at this point, a failure here only leaves the related lists stale until the next full run. The index is patched with the rows of the batch instead of being rebuilt, so the neighbour updates below cost the batch and not the corpus
+    try:
+        refresh_article_index_rows(db, [article_id for article_id, _ in rows])
+
+    except Exception:
+        db.rollback()
+        logger.exception(f"article_index_patch_failed articles={len(rows)}")
+
+    for article_id, _ in rows:
+        try:
+            update_article_neighbours(db, article_id)
+
+        except Exception:
+            db.rollback()
+            logger.exception(f"related_articles_update_failed article_id={article_id}")
+
+
+# Claims and runs one batch of jobs, returns the number of jobs claimed. When the batch fails as a whole its jobs are retried one by one, so a single bad article does not hold back the others
+def run_vector_jobs_once(db: Session, batch_size: int = 50) -> int:
+    jobs = claim_vector_jobs(db, batch_size)
+
+    if not jobs:
+        return 0
+
+    started = time.perf_counter()
+
+    try:
+        _vectorize_jobs(db, jobs)
+        complete_vector_jobs(db, jobs)
+
+    except Exception as error:
+        db.rollback()
+
+        if len(jobs) == 1:
+            logger.exception(f"vector_job_failed job_key={jobs[0].job_key}")
+            fail_vector_jobs(db, jobs, error)
+        else:
+            logger.warning(f"vector_job_batch_failed jobs={len(jobs)} retrying=individually")
+
+            for job in jobs:
+                try:
+                    _vectorize_jobs(db, [job])
+                    complete_vector_jobs(db, [job])
+
+                except Exception as job_error:
+                    db.rollback()
+                    logger.exception(f"vector_job_failed job_key={job.job_key}")
+                    fail_vector_jobs(db, [job], job_error)
+
+    logger.info(
+        f"vector_job_batch_done jobs={len(jobs)} "
+        f"time={round((time.perf_counter() - started) * 1000, 2)}ms"
+    )
+
+    return len(jobs)
+
+
+# Queue depth per status and the age of the oldest job that is waiting or running
+def get_vector_job_stats(db: Session) -> dict:
+    counts = dict(
+        db.query(VectorJob.status, func.count(VectorJob.job_key))
+        .group_by(VectorJob.status)
+        .all()
+    )
+
+    oldest = (
+        db.query(func.min(VectorJob.enqueued_at))
+        .filter(VectorJob.status.in_(["pending", "running"]))
+        .scalar()
+    )
+
+    return {
+        "pending": counts.get("pending", 0),
+        "running": counts.get("running", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_waiting_seconds": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+# Logged when the API starts. Vectors are only written by the app.jobs.vector_worker processes, jobs waiting at startup usually mean no worker ran and the new and edited articles are missing from recommendations and related articles until one does
+def log_vector_job_backlog(db: Session) -> dict:
+    stats = get_vector_job_stats(db)
+    message = "vector_job_backlog " + " ".join(f"{key}={value}" for key, value in stats.items())
+
+    if stats["pending"] or stats["failed"]:
+        logger.warning(f"{message} worker=\"python -m app.jobs.vector_worker\"")
+    else:
+        logger.info(message)
+
+    return stats
+
+
+# Jobs finished by this worker process and their latency from the first request to done
+def get_worker_stats() -> dict:
+    completed = _worker_stats["completed"]
+
+    return {
+        "completed": completed,
+        "failed_attempts": _worker_stats["failed"],
+        "latency_avg_seconds": round(_worker_stats["latency_total"] / completed, 3) if completed else 0.0,
+        "latency_max_seconds": round(_worker_stats["latency_max"], 3),
+    }
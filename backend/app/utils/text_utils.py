@@ -0,0 +1,49 @@
+import re
+from collections import Counter
+
+# Text normalization & tokenization shared by the search service and the search index
+STOPWORDS = {
+    "a", "an", "the", "with", "and", "or", "to", "of", "in", "on", "for"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-zA-Z]+")
+
+# Normalizes text by lowercasing and removing special characters. This is used to improve the matching of search queries with article content and titles.
+def normalize_text(text: str) -> str:
+    return text.lower().replace("-", " ")
+
+# Every alphabetical run of the normalized text in order, stopwords included
+def word_runs(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(normalize_text(text))
+
+# Tokenizes text into a set of unique tokens, excluding stopwords
+def tokenize(text: str) -> set[str]:
+    return {t for t in word_runs(text) if t not in STOPWORDS}
+
+# Number of occurrences of every alphabetical run of the text, stopwords included
+def term_counts(text: str) -> dict[str, int]:
+    return dict(Counter(word_runs(text)))
+
+# Escapes the LIKE wildcards of a user supplied string, for use with escape="\\"
+def like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Every run of three characters of the lowercased text, a substring of the text contains all of the trigrams of the substring
+def substring_trigrams(text: str) -> set[str]:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Trigrams of every word padded like pg_trgm does (two spaces in front, one behind), so word starts and ends count as well
+def word_trigrams(text: str) -> set[str]:
+    grams = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# Share of the word trigrams two strings have in common, the same measure as pg_trgm's similarity()
+def trigram_similarity(a: str, b: str) -> float:
+    grams_a, grams_b = word_trigrams(a), word_trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
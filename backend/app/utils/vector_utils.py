@@ -1,11 +1,156 @@
+import json
 import math
+import struct
+import numpy as np
 
+"""
+Sparse vectors are stored in a compact binary format instead of JSON text. A packed vector is a length-prefixed blob laid out as
 
-def cosine_similarity(vec_a: dict, vec_b: dict) -> float:
+    uint32 nnz | float32 l2 norm | int32 indices[nnz] | float32 values[nnz]
+
+all little-endian. Decoding does not copy the data, the returned numpy arrays are views over the blob created with numpy.frombuffer. Rows written before the binary format still hold the old {"indices": [...], "values": [...]} JSON text, so every reader goes through read_sparse_vector which accepts both formats.
+"""
+
+PACKED_HEADER = struct.Struct("<If")
+INDEX_DTYPE = np.dtype("<i4")
+VALUE_DTYPE = np.dtype("<f4")
+
+
+def pack_sparse_vector(indices, values) -> bytes:
+    indices = np.asarray(indices, dtype=INDEX_DTYPE)
+    values = np.asarray(values, dtype=VALUE_DTYPE)
+
+    if indices.shape != values.shape:
+        raise ValueError("indices and values must have the same length")
+
+    indices, values = dedupe_sparse_vector(indices, values)
+    norm = float(np.sqrt(np.dot(values, values)))
+
+    return (
+        PACKED_HEADER.pack(len(indices), norm)
+        + indices.tobytes()
+        + values.tobytes()
+    )
+
+
+def unpack_sparse_vector(blob: bytes | memoryview) -> tuple[np.ndarray, np.ndarray, float]:
+    nnz, norm = PACKED_HEADER.unpack_from(blob, 0)
+
+    offset = PACKED_HEADER.size
+    indices = np.frombuffer(blob, dtype=INDEX_DTYPE, count=nnz, offset=offset)
+
+    offset += nnz * INDEX_DTYPE.itemsize
+    values = np.frombuffer(blob, dtype=VALUE_DTYPE, count=nnz, offset=offset)
+
+    # Blobs packed from legacy JSON before the indices were deduplicated can still repeat one, they are read by the same rule and the norm of what is kept
+    if not _strictly_increasing(indices):
+        deduped_indices, deduped_values = dedupe_sparse_vector(indices, values)
+
+        if len(deduped_indices) != len(indices):
+            return deduped_indices, deduped_values, float(np.sqrt(np.dot(deduped_values, deduped_values)))
+
+    return indices, values, norm
+
+
+def _strictly_increasing(indices: np.ndarray) -> bool:
+    return len(indices) < 2 or bool(np.all(indices[1:] > indices[:-1]))
+
+
+# The one rule for an index that occurs more than once in a vector (legacy JSON vectors can hold such repeats): the last value wins, like in the {index: value} dictionaries the vectors used to be read into. Every vector is deduplicated when it is packed, parsed or unpacked, so the norms, the similarities and the index matrices all see the same entries
+def dedupe_sparse_vector(indices: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if _strictly_increasing(indices):
+        return indices, values
+
+    unique, last = np.unique(indices[::-1], return_index=True)
+
+    if len(unique) == len(indices):
+        return indices, values
+
+    return unique, values[::-1][last]
+
+
+# Parses the legacy JSON text format into the same (indices, values, norm) triple as unpack_sparse_vector
+def parse_sparse_json(vec_json: str) -> tuple[np.ndarray, np.ndarray, float]:
+    data = json.loads(vec_json)
+    indices, values = dedupe_sparse_vector(
+        np.asarray(data["indices"], dtype=INDEX_DTYPE),
+        np.asarray(data["values"], dtype=VALUE_DTYPE)
+    )
+    norm = float(np.sqrt(np.dot(values, values)))
+    return indices, values, norm
+
+
+# Reads a vector from its packed column, falling back to the legacy JSON column for rows that have not been migrated yet. Missing vectors are returned as empty arrays
+def read_sparse_vector(packed: bytes | memoryview | None, vec_json: str | None = None) -> tuple[np.ndarray, np.ndarray, float]:
+    if packed is not None:
+        return unpack_sparse_vector(packed)
+
+    if vec_json:
+        return parse_sparse_json(vec_json)
+
+    return np.zeros(0, dtype=INDEX_DTYPE), np.zeros(0, dtype=VALUE_DTYPE), 0.0
+
+
+# Same as read_sparse_vector but returns a {index: value} dictionary for code that accumulates vectors in python
+def read_sparse_dict(packed: bytes | memoryview | None, vec_json: str | None = None) -> dict:
+    indices, values, _ = read_sparse_vector(packed, vec_json)
+    return dict(zip(indices.tolist(), values.tolist()))
+
+
+def pack_sparse_dict(vec: dict) -> bytes:
+    return pack_sparse_vector(list(vec.keys()), list(vec.values()))
+
+
+# Ranked article id lists are stored as a plain little-endian int32 array, decoding is zero-copy as well
+def pack_id_list(ids) -> bytes:
+    return np.asarray(ids, dtype=INDEX_DTYPE).tobytes()
+
+
+def unpack_id_list(blob: bytes | memoryview) -> np.ndarray:
+    return np.frombuffer(blob, dtype=INDEX_DTYPE)
+
+
+# Scores that go along with a ranked id list, little-endian float32
+def pack_score_list(scores) -> bytes:
+    return np.asarray(scores, dtype=VALUE_DTYPE).tobytes()
+
+
+def unpack_score_list(blob: bytes | memoryview) -> np.ndarray:
+    return np.frombuffer(blob, dtype=VALUE_DTYPE)
+
+
+# Dense embeddings are stored as a plain little-endian float32 array
+def pack_embedding(embedding) -> bytes:
+    return np.asarray(embedding, dtype=VALUE_DTYPE).tobytes()
+
+
+def unpack_embedding(blob: bytes | memoryview | None) -> np.ndarray | None:
+    if not blob:
+        return None
+
+    return np.frombuffer(blob, dtype=VALUE_DTYPE)
+
+
+# Returns a + scale * b for two sparse vectors given as (indices, values) arrays, entries that cancel out to (almost) zero are dropped
+def add_sparse_vectors(indices_a, values_a, indices_b, values_b, scale: float = 1.0, epsilon: float = 1e-7) -> tuple[np.ndarray, np.ndarray]:
+    all_indices = np.concatenate([np.asarray(indices_a, dtype=INDEX_DTYPE), np.asarray(indices_b, dtype=INDEX_DTYPE)])
+    all_values = np.concatenate([
+        np.asarray(values_a, dtype=np.float64),
+        scale * np.asarray(values_b, dtype=np.float64)
+    ])
+
+    indices, inverse = np.unique(all_indices, return_inverse=True)
+    values = np.bincount(inverse, weights=all_values, minlength=len(indices))
+
+    keep = np.abs(values) > epsilon
+    return indices[keep], values[keep]
+
+
+def cosine_similarity(vec_a, vec_b) -> float:
     """
     Computes cosine similarity between two sparse vectors.
 
-    Expected format:
+    Accepts either packed binary vectors or the legacy format:
     {
         "indices": [int, int, ...],
         "values": [float, float, ...]
@@ -15,27 +160,28 @@ def cosine_similarity(vec_a: dict, vec_b: dict) -> float:
     if not vec_a or not vec_b:
         return 0.0
 
-    indices_a = vec_a["indices"]
-    values_a = vec_a["values"]
-    indices_b = vec_b["indices"]
-    values_b = vec_b["values"]
+    indices_a, values_a, norm_a = _as_arrays(vec_a)
+    indices_b, values_b, norm_b = _as_arrays(vec_b)
+
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
 
-    dict_a = dict(zip(indices_a, values_a))
-    dict_b = dict(zip(indices_b, values_b))
+    # Both vectors are deduplicated by the readers above
+    _, pos_a, pos_b = np.intersect1d(
+        indices_a, indices_b, assume_unique=True, return_indices=True
+    )
 
-    dot_product = 0.0
-    norm_a = 0.0
-    norm_b = 0.0
+    dot_product = float(np.dot(values_a[pos_a], values_b[pos_b]))
 
-    for idx, val in dict_a.items():
-        norm_a += val * val
-        if idx in dict_b:
-            dot_product += val * dict_b[idx]
+    return dot_product / (norm_a * norm_b)
 
-    for val in dict_b.values():
-        norm_b += val * val
 
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
+def _as_arrays(vec) -> tuple[np.ndarray, np.ndarray, float]:
+    if isinstance(vec, (bytes, bytearray, memoryview)):
+        return unpack_sparse_vector(vec)
 
-    return dot_product / (math.sqrt(norm_a) * math.sqrt(norm_b))
+    indices, values = dedupe_sparse_vector(
+        np.asarray(vec["indices"], dtype=INDEX_DTYPE),
+        np.asarray(vec["values"], dtype=VALUE_DTYPE)
+    )
+    return indices, values, math.sqrt(float(np.dot(values, values)))
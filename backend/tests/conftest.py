@@ -10,6 +10,13 @@ from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.core.dependencies import get_db
 from app.database.db import Base
+from app.services.article_index_service import reset_article_index
+from app.services.recommendation_cache_service import reset_recommendation_cache
+from app.services.search_index_service import reset_search_index
+from app.services.search_cache_service import reset_search_cache
+from app.services.user_search_service import reset_user_name_index
+from app.services.search_suggest_service import reset_suggest_index
+from app.ml.model_store import reset_model_store
 
 
 
@@ -50,3 +57,10 @@ def client():
 def reset_database():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    reset_article_index()
+    reset_recommendation_cache()
+    reset_search_index()
+    reset_search_cache()
+    reset_user_name_index()
+    reset_suggest_index()
+    reset_model_store()
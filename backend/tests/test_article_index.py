@@ -0,0 +1,194 @@
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from conftest import TestingSessionLocal
+from app.models.vector_model import ArticleVector
+from app.services.article_index_service import ArticleVectorIndex, get_article_index, top_k_rows
+
+
+def sparse_json(vec):
+    return json.dumps({"indices": list(vec.keys()), "values": list(vec.values())})
+
+
+def cosine(v1, v2):
+    dot = sum(val * v2.get(idx, 0.0) for idx, val in v1.items())
+    norm1 = math.sqrt(sum(val * val for val in v1.values()))
+    norm2 = math.sqrt(sum(val * val for val in v2.values()))
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+    return dot / (norm1 * norm2)
+
+
+def test_index_scores_match_pairwise_cosine(client):
+    articles = {
+        1: ({0: 0.6, 5: 0.8}, {1: 1.0}),
+        2: ({5: 1.0}, {2: 1.0}),
+        3: ({7: 0.3, 9: 0.4}, {}),
+    }
+
+    db = TestingSessionLocal()
+    try:
+        for article_id, (text_vec, tag_vec) in articles.items():
+            db.add(ArticleVector(
+                article_id=article_id,
+                text_vector=sparse_json(text_vec),
+                tag_vector=sparse_json(tag_vec),
+                vector_version=1
+            ))
+        db.commit()
+
+        index = get_article_index(db)
+    finally:
+        db.close()
+
+    user_text = {0: 0.2, 5: 0.5, 9: 0.1}
+    user_tag = {1: 0.5, 2: 0.5}
+
+    scores = index.score(user_text, user_tag)
+
+    assert len(index) == 3
+    for article_id, (text_vec, tag_vec) in articles.items():
+        expected = 0.7 * cosine(user_text, text_vec) + 0.3 * cosine(user_tag, tag_vec)
+        assert math.isclose(scores[index.row_of[article_id]], expected, rel_tol=1e-5)
+
+
+def test_top_k_rows_returns_best_scores_in_order():
+    scores = np.array([0.1, 0.9, -np.inf, 0.5, 0.9, 0.3], dtype=np.float32)
+
+    assert top_k_rows(scores, 3).tolist() == [1, 4, 3]
+    assert top_k_rows(scores, 10).tolist() == [1, 4, 3, 5, 0]
+    assert top_k_rows(scores, 0).tolist() == []
+
+
+def test_candidate_stage_matches_exhaustive_ranking(client):
+    rng = np.random.default_rng(7)
+
+    db = TestingSessionLocal()
+    try:
+        for article_id in range(1, 201):
+            terms = rng.choice(50, size=5, replace=False)
+            text_vec = {int(t): float(v) for t, v in zip(terms, rng.random(5))}
+            db.add(ArticleVector(
+                article_id=article_id,
+                text_vector=sparse_json(text_vec),
+                tag_vector=sparse_json({int(rng.integers(10)): 1.0}),
+                vector_version=1
+            ))
+        db.commit()
+
+        index = get_article_index(db)
+    finally:
+        db.close()
+
+    user_text = {1: 0.5, 4: 0.3, 17: 0.2}
+    user_tag = {3: 1.0}
+
+    exact = index.rank(user_text, user_tag, 10, exclude_article_ids={5}, use_ann=False)
+    approximate = index.rank(user_text, user_tag, 10, exclude_article_ids={5}, use_ann=True)
+
+    assert 5 not in exact.tolist()
+    assert approximate.tolist() == exact.tolist()
+
+    # The first candidate lookups of a fresh index run concurrently, the postings are built once and every thread sees both
+    fresh = ArticleVectorIndex(index.article_ids, index.text_matrix, index.tag_matrix, index.signature)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: fresh.candidate_rows(user_text, user_tag).tolist(), range(32)))
+
+    assert all(result == results[0] for result in results)
+    assert sorted(results[0]) == sorted(index.candidate_rows(user_text, user_tag).tolist())
+
+
+def test_dense_embedding_scores_match_sparse_scores():
+    from scipy import sparse
+    from sklearn.decomposition import TruncatedSVD
+    from app.services.article_index_service import (
+        ArticleVectorIndex,
+        normalize_rows,
+        weighted_feature_matrix,
+        embed_rows
+    )
+
+    rng = np.random.default_rng(3)
+
+    # Only 15 text and 5 tag dimensions are used, so 24 components capture the whole space
+    text_dense = np.zeros((40, 20), dtype=np.float32)
+    text_dense[:, :15] = rng.random((40, 15)) * (rng.random((40, 15)) < 0.3)
+    tag_dense = np.zeros((40, 10), dtype=np.float32)
+    tag_dense[:, :5] = rng.random((40, 5)) * (rng.random((40, 5)) < 0.5)
+
+    text_matrix = normalize_rows(sparse.csr_matrix(text_dense))
+    tag_matrix = normalize_rows(sparse.csr_matrix(tag_dense))
+    model = TruncatedSVD(n_components=24, random_state=0).fit(
+        weighted_feature_matrix(text_matrix, tag_matrix)
+    )
+
+    article_ids = np.arange(1, 41, dtype=np.int64)
+    exact = ArticleVectorIndex(article_ids, text_matrix, tag_matrix, signature=())
+    dense = ArticleVectorIndex(
+        article_ids, text_matrix, tag_matrix, signature=(),
+        embeddings=embed_rows(text_matrix, tag_matrix, model),
+        embedding_model=model
+    )
+
+    user_text = {0: 0.4, 3: 0.2, 11: 0.9}
+    user_tag = {2: 1.0}
+
+    assert dense.embeddings.shape == (40, 24)
+    assert np.allclose(dense.score(user_text, user_tag), exact.score(user_text, user_tag), atol=1e-4)
+    assert np.allclose(
+        dense.score_block(text_matrix[:3], tag_matrix[:3]),
+        exact.score_block(text_matrix[:3], tag_matrix[:3]),
+        atol=1e-4
+    )
+
+
+def test_rows_written_by_this_process_are_patched_into_the_index(client, monkeypatch):
+    from app.services import article_index_service
+    from app.services.article_index_service import refresh_article_index_rows, reset_article_index
+    from app.utils.vector_utils import pack_sparse_vector
+
+    def add(db, article_id, text_vec, version=1):
+        db.merge(ArticleVector(
+            article_id=article_id,
+            text_vector_packed=pack_sparse_vector(list(text_vec), list(text_vec.values())),
+            tag_vector_packed=pack_sparse_vector([], []),
+            vector_version=version
+        ))
+        db.commit()
+
+    db = TestingSessionLocal()
+    try:
+        for article_id in (1, 3):
+            add(db, article_id, {article_id: 1.0})
+        get_article_index(db)
+
+        # A new article and an edited one, patched in without reading the other vectors again
+        add(db, 2, {2: 1.0})
+        add(db, 3, {4: 1.0}, version=2)
+
+        def no_rebuild(*args):
+            raise AssertionError("the index was rebuilt")
+
+        monkeypatch.setattr(article_index_service, "_build_index", no_rebuild)
+        refresh_article_index_rows(db, [2, 3])
+        patched = get_article_index(db)
+        monkeypatch.undo()
+
+        assert patched.article_ids.tolist() == [1, 2, 3]
+        assert patched.signature == article_index_service._corpus_signature(db)
+
+        reset_article_index()
+        rebuilt = get_article_index(db)
+        assert (patched.text_matrix != rebuilt.text_matrix).nnz == 0
+        assert patched.vector_versions.tolist() == rebuilt.vector_versions.tolist()
+
+        # A vector written by another process is not explained by the patch, the next request rebuilds
+        add(db, 4, {5: 1.0})
+        add(db, 1, {6: 1.0}, version=2)
+        refresh_article_index_rows(db, [1])
+        assert get_article_index(db).article_ids.tolist() == [1, 2, 3, 4]
+    finally:
+        db.close()
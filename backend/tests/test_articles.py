@@ -46,3 +46,57 @@ def test_article_lifecycle(client):
 
     delete = client.delete(f"/articles/{article_id}", headers=headers)
     assert delete.status_code == 200
+
+
+def test_edits_are_queued_once_and_vectorized_by_the_worker(client, monkeypatch):
+    from conftest import TestingSessionLocal
+    from app.models.vector_model import ArticleVector, VectorJob
+    from app.services import vector_job_service
+    from app.services.article_vector_service import create_article_vector
+    from app.services.vector_job_service import enqueue_article_vector, run_vector_jobs_once, get_vector_job_stats, log_vector_job_backlog
+
+    headers = create_user_and_login(client)
+    client.post("/articles/", json={
+        "title": "Vectorized Article",
+        "content": "Content that is vectorized once and then edited a few times in a row.",
+        "tag_names": ["python"],
+    }, headers=headers)
+
+    db = TestingSessionLocal()
+    try:
+        create_article_vector(db, 1)
+
+        for number in range(3):
+            client.put("/articles/1", json={
+                "title": f"Edited Article {number}",
+                "content": "Edited content that is long enough to pass the article validation.",
+                "tag_names": ["python"],
+            }, headers=headers)
+
+        # One job for all the writes, the old vector keeps serving until the worker replaces it
+        assert db.query(VectorJob).count() == 1
+        assert db.get(ArticleVector, 1).vector_version == 1
+        assert get_vector_job_stats(db)["pending"] == 1
+        assert log_vector_job_backlog(db)["pending"] == 1
+
+        enqueue_article_vector(db, 1, delay=0)
+        assert run_vector_jobs_once(db) == 1
+        assert db.query(VectorJob).count() == 0
+
+        db.expire_all()
+        assert db.get(ArticleVector, 1).vector_version == 2
+
+        # A failed job is retried later with a backoff
+        def broken_block(db, rows, **kwargs):
+            raise RuntimeError("vectorizer unavailable")
+
+        monkeypatch.setattr(vector_job_service, "vectorize_article_block", broken_block)
+        enqueue_article_vector(db, 1, delay=0)
+        assert run_vector_jobs_once(db) == 1
+        assert run_vector_jobs_once(db) == 0
+
+        job = db.query(VectorJob).one()
+        assert job.status == "pending" and job.attempts == 1
+        assert "vectorizer unavailable" in job.last_error
+    finally:
+        db.close()
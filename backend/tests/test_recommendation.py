@@ -1,3 +1,20 @@
+from datetime import datetime
+
+from conftest import TestingSessionLocal
+from app.models.article_model import Article
+from app.models.vector_model import ArticleVector, UserVector
+from app.models.user_model import UserRecommendationList, PRECOMPUTED_SESSION_ID
+from app.services.recommendation_precompute_service import (
+    precompute_user_block,
+    claim_precomputed_recommendations
+)
+from app.services.article_index_service import invalidate_article_index
+from app.services.related_article_service import precompute_neighbour_block, update_article_neighbours
+from app.services import recommendation_service
+from app.services.recommendation_service import build_ranked_list
+from app.utils.vector_utils import pack_sparse_vector, pack_id_list, unpack_id_list
+
+
 def test_recommendations_return_results(client):
     user = {
         "user_email": "rec@test.com",
@@ -32,3 +49,170 @@ def test_recommendations_return_results(client):
 
     assert response.status_code == 200
     assert "articles" in response.json()
+
+
+def test_precomputed_recommendations_are_claimed_by_new_session(client):
+    db = TestingSessionLocal()
+    try:
+        for article_id, text_index in ((1, 0), (2, 1), (3, 0)):
+            db.add(ArticleVector(
+                article_id=article_id,
+                text_vector_packed=pack_sparse_vector([text_index], [1.0]),
+                tag_vector_packed=pack_sparse_vector([], []),
+                vector_version=1
+            ))
+
+        db.add(UserVector(
+            user_id=7,
+            text_vector_packed=pack_sparse_vector([0, 1], [0.9, 0.1]),
+            tag_vector_packed=pack_sparse_vector([], []),
+            last_updated=datetime(2020, 1, 1)
+        ))
+        db.commit()
+
+        assert precompute_user_block(db, [7], top_n=2) == 1
+
+        precomputed = db.get(UserRecommendationList, (7, PRECOMPUTED_SESSION_ID))
+        assert unpack_id_list(precomputed.article_ids).tolist() == [1, 3]
+
+        claimed = claim_precomputed_recommendations(db, 7, "session-a", datetime(2020, 1, 1))
+        assert claimed is not None
+        assert db.get(UserRecommendationList, (7, "session-a")) is not None
+        assert db.get(UserRecommendationList, (7, PRECOMPUTED_SESSION_ID)) is None
+    finally:
+        db.close()
+
+
+def test_concurrent_first_requests_of_a_session_share_one_ranked_list(client, monkeypatch):
+    db = TestingSessionLocal()
+    try:
+        client.post("/auth/register", json={
+            "user_email": "race@test.com",
+            "user_name": "race",
+            "password": "password123",
+            "confirm_password": "password123",
+            "birth_date": "2000-01-01",
+        })
+        user_id = 1
+
+        for article_id in (1, 2):
+            db.add(ArticleVector(
+                article_id=article_id,
+                text_vector_packed=pack_sparse_vector([0], [1.0]),
+                tag_vector_packed=pack_sparse_vector([], []),
+                vector_version=1
+            ))
+
+        db.add(UserVector(
+            user_id=user_id,
+            text_vector_packed=pack_sparse_vector([0], [1.0]),
+            tag_vector_packed=pack_sparse_vector([], []),
+            last_updated=datetime(2020, 1, 1)
+        ))
+        db.commit()
+
+        real_get_article_index = recommendation_service.get_article_index
+
+        # The other request stores its list while this one is still ranking
+        def racing_get_article_index(index_db):
+            other = TestingSessionLocal()
+            try:
+                other.add(UserRecommendationList(
+                    user_id=user_id,
+                    session_id="session-a",
+                    article_ids=pack_id_list([2]),
+                    created_at=datetime.utcnow()
+                ))
+                other.commit()
+            finally:
+                other.close()
+
+            return real_get_article_index(index_db)
+
+        monkeypatch.setattr(recommendation_service, "get_article_index", racing_get_article_index)
+
+        ranked = build_ranked_list(db, user_id, "session-a")
+        assert unpack_id_list(ranked.article_ids).tolist() == [2]
+
+        # A precomputed ranking claimed after the session already has a list leaves that list in place
+        db.add(UserRecommendationList(
+            user_id=user_id,
+            session_id=PRECOMPUTED_SESSION_ID,
+            article_ids=pack_id_list([1]),
+            created_at=datetime.utcnow()
+        ))
+        db.commit()
+
+        claimed = claim_precomputed_recommendations(db, user_id, "session-a", None)
+        assert unpack_id_list(claimed.article_ids).tolist() == [2]
+    finally:
+        db.close()
+
+
+def test_related_articles_are_precomputed_and_updated_incrementally(client):
+    client.post("/auth/register", json={
+        "user_email": "related@test.com",
+        "user_name": "related",
+        "password": "password123",
+        "confirm_password": "password123",
+        "birth_date": "2000-01-01",
+    })
+    login = client.post(
+        "/auth/login",
+        json={"user_email": "related@test.com", "password": "password123"},
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    for i in range(4):
+        client.post(
+            "/articles/",
+            json={
+                "title": f"Related {i}",
+                "content": "Related articles testing content that is long enough to pass validation.",
+                "tag_names": ["ml"],
+            },
+            headers=headers,
+        )
+
+    def add_vector(db, article_id, values):
+        db.add(ArticleVector(
+            article_id=article_id,
+            text_vector_packed=pack_sparse_vector([0, 1], values),
+            tag_vector_packed=pack_sparse_vector([], []),
+            vector_version=1
+        ))
+        db.commit()
+
+    db = TestingSessionLocal()
+    try:
+        add_vector(db, 1, [1.0, 0.0])
+        add_vector(db, 2, [0.6, 0.8])
+        add_vector(db, 3, [0.0, 1.0])
+        assert precompute_neighbour_block(db, [1, 2, 3], top_k=1) == 3
+
+        response = client.get("/articles/1/related")
+        assert [a["article_id"] for a in response.json()["articles"]] == [2]
+
+        # Article 4 is closer to article 1 than article 2 is, it replaces 2 in the list of 1
+        add_vector(db, 4, [0.99, 0.14])
+        invalidate_article_index()
+        update_article_neighbours(db, 4, top_k=1)
+    finally:
+        db.close()
+
+    response = client.get("/articles/1/related")
+    assert response.status_code == 200
+    assert [a["article_id"] for a in response.json()["articles"]] == [4]
+
+    assert client.get("/articles/999/related").status_code == 404
+
+    # Drafts have no public related list and are never listed as related
+    db = TestingSessionLocal()
+    try:
+        db.get(Article, 4).is_published = False
+        db.commit()
+    finally:
+        db.close()
+
+    assert client.get("/articles/4/related").status_code == 404
+    assert client.get("/articles/1/related").json()["articles"] == []
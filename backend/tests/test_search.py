@@ -0,0 +1,455 @@
+def register_and_login(client, name):
+    client.post("/auth/register", json={
+        "user_email": f"{name}@test.com",
+        "user_name": name,
+        "password": "password123",
+        "confirm_password": "password123",
+        "birth_date": "2000-01-01",
+    })
+    login = client.post(
+        "/auth/login",
+        json={"user_email": f"{name}@test.com", "password": "password123"},
+    )
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def titles(response):
+    return [article["title"] for article in response.json()["articles"]]
+
+
+def test_search_index_follows_article_writes(client):
+    author = register_and_login(client, "writer")
+    reader = register_and_login(client, "reader")
+
+    for title in ("Machine learning at scale", "Gardening tips for spring"):
+        client.post(
+            "/articles/",
+            json={
+                "title": title,
+                "content": f"{title} with some filler content that is long enough to pass validation.",
+                "tag_names": ["search"],
+            },
+            headers=author,
+        )
+
+    # Whole words, parts of words and author names are all found through the index
+    assert titles(client.get("/search?q=machine learn", headers=reader))[0] == "Machine learning at scale"
+    assert titles(client.get("/search?q=arden", headers=reader))[0] == "Gardening tips for spring"
+    assert client.get("/search?q=writer", headers=reader).json()["articles"][0]["score"] > 0.5
+
+    client.put(
+        "/articles/2",
+        json={
+            "title": "Gardening tips for autumn",
+            "content": "Rewritten content about quantum physics that is long enough to pass validation.",
+            "tag_names": ["search"],
+        },
+        headers=author,
+    )
+    assert titles(client.get("/search?q=quantum", headers=reader))[0] == "Gardening tips for autumn"
+
+    client.delete("/articles/2", headers=author)
+    assert "Gardening tips for autumn" not in titles(client.get("/search?q=quantum", headers=reader))
+
+    # Authors do not find their own articles
+    assert titles(client.get("/search?q=machine", headers=author)) == []
+
+
+def test_bm25_prefers_rare_terms_and_short_documents():
+    from datetime import datetime
+    from app.services.search_index_service import SearchIndex, SearchDocument
+    from app.utils.text_utils import term_counts
+
+    index = SearchIndex(signature=())
+    contents = {
+        1: "python tutorial",
+        2: "python tutorial " + "filler words " * 20,
+        3: "python basics",
+        4: "python advanced",
+    }
+    for article_id, content in contents.items():
+        index.add(
+            SearchDocument(article_id, 1, "title", "author", datetime.utcnow(), True),
+            {"content": term_counts(content)}
+        )
+
+    rare = index.bm25("content", {"tutorial"})
+    both = index.bm25("content", {"python", "tutorial"})
+
+    assert rare[1] > rare[2]
+    assert both[1] == 1.0
+    # Matching only the common token is worth far less than half of a full match
+    assert both[3] < 0.25
+    assert set(both) == {1, 2, 3, 4}
+
+    index.remove(1)
+    assert set(index.bm25("content", {"tutorial"})) == {2}
+    assert index.total_length["content"] == sum(index.lengths["content"].values())
+
+
+def test_phrase_candidates_match_a_scan_of_the_vocabulary():
+    from datetime import datetime
+    from app.services.search_index_service import SearchIndex, SearchDocument
+    from app.utils.text_utils import term_counts, word_runs
+
+    index = SearchIndex(signature=())
+    contents = {
+        1: "machine learning pipelines",
+        2: "deep learning at scale",
+        3: "a go program in ml",
+        4: "relearning old habits",
+    }
+    for article_id, content in contents.items():
+        index.add(
+            SearchDocument(article_id, 1, "title", "author", datetime.utcnow(), True),
+            {"content": term_counts(content)}
+        )
+    index.remove(4)
+
+    # The lookup the trigram index replaces
+    def scanned(query):
+        postings = index.postings["content"]
+        runs = word_runs(query)
+        matches = None
+        for position, run in enumerate(runs):
+            if len(runs) == 1:
+                terms = [term for term in postings if run in term]
+            elif position == 0:
+                terms = [term for term in postings if term.endswith(run)]
+            elif position == len(runs) - 1:
+                terms = [term for term in postings if term.startswith(run)]
+            else:
+                terms = [run] if run in postings else []
+            ids = set().union(*(postings[term] for term in terms)) if terms else set()
+            matches = ids if matches is None else matches & ids
+        return matches
+
+    for query in ("learn", "ing", "g", "ml", "ine learn", "machine learning pipe", "go pro", "habits"):
+        assert index.phrase_candidates(query) == scanned(query), query
+
+    assert index.phrase_candidates("ine learn") == {1}
+    assert not any("relearning" in terms for terms in index.term_grams["content"].values())
+
+
+def test_search_documents_are_written_with_articles_and_backfilled(client):
+    from conftest import TestingSessionLocal
+    from app.models.article_model import ArticleSearchDocument
+    from app.jobs.backfill_search_documents import backfill_search_documents
+    from app.services.search_index_service import reset_search_index
+
+    headers = register_and_login(client, "tokens")
+    reader = register_and_login(client, "tokens_reader")
+    client.post("/articles/", json={
+        "title": "Tokenized Title",
+        "content": "Pre-tokenized search content that is comfortably long enough for validation.",
+        "tag_names": ["search"],
+    }, headers=headers)
+    client.put("/users/me", json={"user_name": "renamed"}, headers=headers)
+
+    db = TestingSessionLocal()
+    try:
+        document = db.get(ArticleSearchDocument, 1)
+        assert document.title_normalized == "tokenized title"
+        assert document.author_normalized == "renamed"
+        assert '"validation":1' in document.content_terms
+
+        db.delete(document)
+        db.commit()
+        assert backfill_search_documents(db) == 1
+        assert backfill_search_documents(db) == 0
+    finally:
+        db.close()
+
+    reset_search_index()
+    assert titles(client.get("/search?q=validation", headers=reader)) == ["Tokenized Title"]
+
+
+def test_semantic_and_hybrid_modes_rank_by_query_vector(client):
+    from conftest import TestingSessionLocal
+    from app.services.article_vector_service import create_article_vector
+    from app.services.article_index_service import invalidate_article_index
+
+    author = register_and_login(client, "semantic")
+    reader = register_and_login(client, "semantic_reader")
+
+    for title, content in (
+        ("Training neural networks", "Neural networks learn weights with gradient descent and backpropagation on training data."),
+        ("Baking sourdough bread", "Sourdough bread needs a starter, flour, water and a long fermentation before baking."),
+    ):
+        client.post("/articles/", json={"title": title, "content": content, "tag_names": ["misc"]}, headers=author)
+
+    db = TestingSessionLocal()
+    try:
+        create_article_vector(db, 1)
+        create_article_vector(db, 2)
+    finally:
+        db.close()
+    invalidate_article_index()
+
+    semantic = client.get("/search?q=gradient descent training&mode=semantic", headers=reader).json()
+    assert semantic["articles"][0]["title"] == "Training neural networks"
+    assert semantic["articles"][0]["score"] > 0.3
+
+    hybrid = client.get("/search?q=gradient descent training&mode=hybrid", headers=reader).json()
+    assert hybrid["articles"][0]["title"] == "Training neural networks"
+
+    assert client.get("/search?q=bread&mode=fuzzy", headers=reader).status_code == 422
+
+
+def test_database_backend_uses_sqlite_fts(client, monkeypatch):
+    from conftest import engine
+    from app.database.search_schema import ensure_search_schema
+    from app.services import search_service
+
+    author = register_and_login(client, "ftswriter")
+    reader = register_and_login(client, "ftsreader")
+
+    def post(title, content):
+        client.post(
+            "/articles/",
+            json={"title": title, "content": content, "tag_names": ["search"]},
+            headers=author,
+        )
+
+    post("Machine learning at scale", "Training large models on many machines takes careful engineering work.")
+
+    # Created after the articles exist, the existing rows are indexed by the rebuild and later ones by the triggers
+    ensure_search_schema(engine)
+    monkeypatch.setattr(search_service, "SEARCH_BACKEND", "database")
+
+    post("Gardening tips for spring", "Planting tomatoes and herbs early gives the garden a head start.")
+
+    assert titles(client.get("/search?q=machine learning", headers=reader))[0] == "Machine learning at scale"
+    found = client.get("/search?q=tomatoes", headers=reader).json()["articles"][0]
+    assert found["title"] == "Gardening tips for spring" and found["score"] > 0.45
+    assert client.get("/search?q=ftswriter", headers=reader).json()["articles"][0]["score"] > 0.45
+
+    client.delete("/articles/2", headers=author)
+    assert "Gardening tips for spring" not in titles(client.get("/search?q=tomatoes", headers=reader))
+
+
+def test_search_results_are_cached_until_articles_change(client):
+    from app.services.search_cache_service import get_search_cache_stats
+
+    author = register_and_login(client, "cachewriter")
+    reader = register_and_login(client, "cachereader")
+
+    client.post(
+        "/articles/",
+        json={
+            "title": "Caching strategies explained",
+            "content": "Caching strategies explained with enough words to pass the validation.",
+            "tag_names": ["cache"],
+        },
+        headers=author,
+    )
+
+    first = client.get("/search?q=Caching", headers=reader).json()
+    assert client.get("/search?q=caching", headers=reader).json() == first
+    assert get_search_cache_stats()["hits"] == 1
+
+    client.post(
+        "/articles/",
+        json={
+            "title": "More caching strategies",
+            "content": "A second article about caching that is long enough to pass the validation.",
+            "tag_names": ["cache"],
+        },
+        headers=author,
+    )
+
+    second = client.get("/search?q=caching", headers=reader).json()
+    assert "More caching strategies" in titles_of(second)
+    assert get_search_cache_stats()["hits"] == 1
+    assert get_search_cache_stats()["memory_bytes"] > 0
+
+
+def test_search_pages_follow_the_first_ranking(client):
+    author = register_and_login(client, "pagewriter")
+    reader = register_and_login(client, "pagereader")
+
+    for number in range(5):
+        client.post(
+            "/articles/",
+            json={
+                "title": f"Paging article number {number}",
+                "content": f"Paging article number {number} with enough words to pass the validation.",
+                "tag_names": ["paging"],
+            },
+            headers=author,
+        )
+
+    first = client.get("/search?q=paging&page_size=2", headers=reader).json()
+    assert len(first["articles"]) == 2 and first["next_cursor"]
+
+    # An article written after the first page does not shift the pages of that ranking
+    client.post(
+        "/articles/",
+        json={
+            "title": "Paging article written later",
+            "content": "Paging article written later with enough words to pass the validation.",
+            "tag_names": ["paging"],
+        },
+        headers=author,
+    )
+
+    seen = titles_of(first)
+    cursor = first["next_cursor"]
+    while cursor:
+        page = client.get(f"/search?q=paging&cursor={cursor}", headers=reader).json()
+        assert page["users"] == []
+        seen += titles_of(page)
+        cursor = page["next_cursor"]
+
+    assert sorted(seen) == sorted(f"Paging article number {number}" for number in range(5))
+    assert client.get("/search?q=paging&cursor=not-a-cursor", headers=reader).status_code == 400
+
+
+def test_search_returns_partial_results_when_the_time_budget_runs_out(client, monkeypatch):
+    from app.services import search_service
+
+    author = register_and_login(client, "budgetwriter")
+    reader = register_and_login(client, "budgetreader")
+
+    for number in range(3):
+        client.post(
+            "/articles/",
+            json={
+                "title": f"Budget planning part {number}",
+                "content": f"Budget planning part {number} with enough words to pass the validation.",
+                "tag_names": ["budget"],
+            },
+            headers=author,
+        )
+
+    complete = client.get("/search?q=budget planning", headers=reader).json()
+    assert complete["partial"] is False and len(complete["articles"]) == 3
+
+    # One candidate per chunk and a budget that is over before the second chunk starts
+    monkeypatch.setattr(search_service, "SCORE_CHUNK_SIZE", 1)
+    monkeypatch.setattr(search_service, "SEARCH_TIME_BUDGET_MS", 1e-6)
+
+    partial = client.get("/search?q=budget planning&page_size=2", headers=reader).json()
+    assert partial["partial"] is True
+    assert partial["articles"][0]["score"] > 0.45
+    assert [article["score"] for article in partial["articles"][1:]] == [0.2]
+
+    # The truncated ranking is not served to the next search with enough budget
+    monkeypatch.setattr(search_service, "SEARCH_TIME_BUDGET_MS", 10000)
+    again = client.get("/search?q=budget planning&page_size=2", headers=reader).json()
+    assert again["partial"] is False
+    assert all(article["score"] > 0.45 for article in again["articles"])
+
+
+def titles_of(payload):
+    return [article["title"] for article in payload["articles"]]
+
+
+
+def test_postgres_fallback_runs_with_the_budget_of_the_request(monkeypatch):
+    from types import SimpleNamespace
+    from sqlalchemy.exc import OperationalError
+    from app.services import search_service
+    from app.services.search_service import SearchDeadline
+
+    timeouts = []
+
+    # The ranking statement is cancelled by its statement_timeout, the fallback returns one match
+    def run_statement(db, statement, params, timeout_ms):
+        timeouts.append(timeout_ms)
+        if statement is search_service.POSTGRES_SEARCH_SQL:
+            raise OperationalError("SELECT", {}, SimpleNamespace(pgcode="57014"))
+        return [(7, 0.5)]
+
+    monkeypatch.setattr(search_service, "_run_postgres_statement", run_statement)
+    monkeypatch.setattr(search_service, "_popularity_bounds", lambda db, user_id: (1.0, None))
+
+    for budget_ms, fallback_timeout in ((50, 50), (0, None)):
+        timeouts.clear()
+        deadline = SearchDeadline(budget_ms)
+
+        assert search_service._postgres_search(None, "machine learning", 1, 10, deadline) == [(0.5, 7)]
+        assert deadline.expired
+        assert timeouts[-1] == fallback_timeout
+
+def test_user_search_ranks_trigram_matches_by_similarity(client):
+    from app.services.user_search_service import UserNameIndex
+
+    index = UserNameIndex(signature=())
+    for user_id, name in ((1, "Alexander"), (2, "alex"), (3, "Bob"), (4, "Malexa")):
+        index.add(user_id, name)
+
+    assert index.search("ALEX", 10) == [2, 1, 4]
+    assert index.search("ex", 10) == [2, 1, 4]
+    assert index.search("bob", 10) == [3]
+
+    index.add(3, "alexis")
+    assert 3 in index.search("lex", 10)
+    assert index.search("bob", 10) == []
+
+    reader = register_and_login(client, "finder")
+    register_and_login(client, "ann_smith")
+    register_and_login(client, "annabel")
+
+    users = client.get("/search?q=ann", headers=reader).json()["users"]
+    assert [user["user_name"] for user in users] == ["ann_smith", "annabel"]
+    assert client.get("/search?q=n_s", headers=reader).json()["users"][0]["user_name"] == "ann_smith"
+
+    # A rename made by another process only changes the database, the name version makes this process rebuild its index
+    from sqlalchemy import func
+    from conftest import TestingSessionLocal
+    from app.models.user_model import User
+    from app.services import user_search_service
+
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.user_name == "annabel").one()
+        user.user_name = "zelda"
+        user.name_version = func.coalesce(User.name_version, 0) + 1
+        db.commit()
+    finally:
+        db.close()
+
+    user_search_service._index_checked_at = 0.0
+    assert [user["user_name"] for user in client.get("/search?q=zel", headers=reader).json()["users"]] == ["zelda"]
+    assert [user["user_name"] for user in client.get("/search?q=abel", headers=reader).json()["users"]] == []
+
+
+def test_suggest_completes_prefixes_from_memory(client):
+    from app.services.search_suggest_service import SuggestIndex
+
+    index = SuggestIndex()
+    index.set_article(1, "Intro to pandas", 7, {1: "python"}, 1.0)
+    index.set_article(2, "Pandas performance tips", 7, {1: "python", 2: "pandas"}, 3.0)
+    index.set_user(7, "panda_fan")
+
+    assert index.suggest("PAND", 5) == [
+        ("article", 2, "Pandas performance tips"),
+        ("article", 1, "Intro to pandas"),
+        ("tag", 2, "pandas"),
+        ("user", 7, "panda_fan"),
+    ]
+    assert index.weights["tag"][1] == 4.0
+
+    index.remove_article(2)
+    assert index.suggest("perf", 5) == []
+    assert index.weights["tag"][1] == 1.0
+
+    headers = register_and_login(client, "suggester")
+    client.post("/articles/", json={
+        "title": "Autocomplete with bisect",
+        "content": "Sorted arrays and binary search make prefix lookups cheap enough for every keystroke.",
+        "tag_names": ["algorithms"],
+    }, headers=headers)
+    assert client.get("/search/suggest?q=auto", headers=headers).json()["suggestions"] == [
+        {"kind": "article", "id": 1, "text": "Autocomplete with bisect"}
+    ]
+
+    # Articles written after the index was built are added in place
+    client.post("/articles/", json={
+        "title": "Algorithms for autocomplete",
+        "content": "Tries and sorted arrays both answer prefix queries, the sorted array is more compact.",
+        "tag_names": ["algorithms"],
+    }, headers=headers)
+    kinds = [(s["kind"], s["text"]) for s in client.get("/search/suggest?q=algo", headers=headers).json()["suggestions"]]
+    assert kinds == [("article", "Algorithms for autocomplete"), ("tag", "algorithms")]
@@ -0,0 +1,41 @@
+import time
+
+from app.utils.ttl_cache import TTLCache
+
+
+def test_lru_eviction_and_counters():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_ttl_expiry_and_tag_invalidation():
+    cache = TTLCache(max_entries=10, ttl_seconds=0.01)
+
+    cache.set((1, "s1"), [1, 2], tag=1)
+    time.sleep(0.02)
+    assert cache.get((1, "s1")) is None
+
+    cache.ttl_seconds = 60
+    cache.set((1, "s1"), [1, 2], tag=1)
+    cache.set((1, "s2"), [3], tag=1)
+    cache.set((2, "s1"), [4], tag=2)
+
+    cache.invalidate_tag(1)
+
+    assert cache.get((1, "s1")) is None
+    assert cache.get((1, "s2")) is None
+    assert cache.get((2, "s1")) == [4]
@@ -0,0 +1,118 @@
+import math
+
+from conftest import TestingSessionLocal
+from app.models.vector_model import ArticleVector, UserVector
+from app.models.interaction_model import UserInteraction
+from app.services.user_vector_service import (
+    apply_interaction_to_user_vector,
+    recompute_user_vector_from_interactions
+)
+from app.utils.vector_utils import pack_sparse_vector, read_sparse_dict
+
+
+def add_article_vector(db, article_id, text, tag):
+    db.add(ArticleVector(
+        article_id=article_id,
+        text_vector_packed=pack_sparse_vector(list(text.keys()), list(text.values())),
+        tag_vector_packed=pack_sparse_vector(list(tag.keys()), list(tag.values())),
+        vector_version=1
+    ))
+
+
+def assert_vectors_close(actual, expected):
+    assert set(actual) == set(expected)
+    for key, value in expected.items():
+        assert math.isclose(actual[key], value, rel_tol=1e-5)
+
+
+def test_incremental_updates_match_full_recompute(client):
+    db = TestingSessionLocal()
+    try:
+        add_article_vector(db, 1, {0: 1.0}, {0: 1.0})
+        add_article_vector(db, 2, {0: 0.6, 3: 0.8}, {1: 1.0})
+        add_article_vector(db, 3, {5: 1.0}, {1: 1.0})
+        db.add(UserInteraction(user_id=1, article_id=1, interaction_type="like"))
+        db.commit()
+
+        recompute_user_vector_from_interactions(db, 1)
+
+        for article_id, interaction_type, sign in (
+            (2, "save", 1),
+            (3, "like", 1),
+            (3, "like", -1),
+        ):
+            apply_interaction_to_user_vector(db, 1, article_id, interaction_type, sign)
+            db.commit()
+
+        incremental = db.query(UserVector).filter(UserVector.user_id == 1).one()
+        incremental_text = read_sparse_dict(incremental.text_vector_packed)
+        incremental_tag = read_sparse_dict(incremental.tag_vector_packed)
+
+        db.add(UserInteraction(user_id=1, article_id=2, interaction_type="save"))
+        db.commit()
+        recompute_user_vector_from_interactions(db, 1)
+
+        full = db.query(UserVector).filter(UserVector.user_id == 1).one()
+
+        assert math.isclose(full.total_weight, 5.0)
+        assert_vectors_close(incremental_text, read_sparse_dict(full.text_vector_packed))
+        assert_vectors_close(incremental_tag, read_sparse_dict(full.tag_vector_packed))
+    finally:
+        db.close()
+
+
+def test_unlike_after_the_article_was_revectorized_recomputes_instead_of_drifting(client):
+    db = TestingSessionLocal()
+    try:
+        add_article_vector(db, 1, {0: 1.0}, {0: 1.0})
+        add_article_vector(db, 2, {2: 1.0}, {1: 1.0})
+        db.add(UserInteraction(user_id=1, article_id=1, interaction_type="like"))
+        db.commit()
+        recompute_user_vector_from_interactions(db, 1)
+
+        like = UserInteraction(user_id=1, article_id=2, interaction_type="like")
+        db.add(like)
+        apply_interaction_to_user_vector(db, 1, 2, "like", 1, interaction=like)
+        db.commit()
+        assert like.vector_version == 1
+
+        # Re-vectorized after the like, subtracting the new vector would leave the old one in the sums
+        article_vector = db.get(ArticleVector, 2)
+        article_vector.text_vector_packed = pack_sparse_vector([4], [1.0])
+        article_vector.vector_version = 2
+        db.commit()
+
+        apply_interaction_to_user_vector(db, 1, 2, "like", -1, interaction=like)
+        db.delete(like)
+        db.commit()
+
+        user_vector = db.query(UserVector).filter(UserVector.user_id == 1).one()
+        assert user_vector.last_updated is None and user_vector.total_weight is None
+
+        recompute_user_vector_from_interactions(db, 1)
+        db.refresh(user_vector)
+        assert math.isclose(user_vector.total_weight, 2.0)
+        assert_vectors_close(read_sparse_dict(user_vector.text_vector_packed), {0: 1.0})
+    finally:
+        db.close()
+
+
+def test_unliking_the_last_article_keeps_a_usable_vector(client):
+    db = TestingSessionLocal()
+    try:
+        add_article_vector(db, 1, {0: 1.0}, {0: 1.0})
+        like = UserInteraction(user_id=1, article_id=1, interaction_type="like")
+        db.add(like)
+        db.commit()
+        recompute_user_vector_from_interactions(db, 1)
+
+        apply_interaction_to_user_vector(db, 1, 1, "like", -1, interaction=like)
+        db.delete(like)
+        db.commit()
+
+        # Marked dirty instead of emptied, the recommendations keep working from the last vector
+        user_vector = db.query(UserVector).filter(UserVector.user_id == 1).one()
+        assert user_vector.last_updated is None and user_vector.total_weight is None
+        assert read_sparse_dict(user_vector.text_vector_packed) == {0: 1.0}
+    finally:
+        db.close()
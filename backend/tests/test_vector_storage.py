@@ -0,0 +1,256 @@
+import json
+import math
+
+import numpy as np
+
+from conftest import TestingSessionLocal
+from app.jobs.migrate_vector_storage import backfill_packed_vectors
+from app.models.vector_model import ArticleVector
+from app.services.article_index_service import SparseMatrixBuilder
+from app.utils.vector_utils import (
+    PACKED_HEADER,
+    INDEX_DTYPE,
+    VALUE_DTYPE,
+    pack_sparse_vector,
+    unpack_sparse_vector,
+    read_sparse_dict,
+    cosine_similarity
+)
+
+
+def test_packed_vector_round_trip():
+    blob = pack_sparse_vector([3, 10, 42], [0.5, 0.25, 1.0])
+
+    indices, values, norm = unpack_sparse_vector(blob)
+
+    assert len(blob) == 8 + 3 * 4 + 3 * 4
+    assert indices.tolist() == [3, 10, 42]
+    assert values.tolist() == [0.5, 0.25, 1.0]
+    assert math.isclose(norm, math.sqrt(0.25 + 0.0625 + 1.0), rel_tol=1e-6)
+
+
+def test_cosine_similarity_accepts_both_formats():
+    legacy = {"indices": [1, 2], "values": [1.0, 1.0]}
+    packed = pack_sparse_vector([2, 5], [1.0, 1.0])
+
+    assert math.isclose(cosine_similarity(legacy, packed), 0.5, rel_tol=1e-6)
+    assert cosine_similarity(legacy, {}) == 0.0
+
+    # A legacy vector that repeats an index is read like the dictionary it used to be parsed into, the last value wins
+    duplicated = {"indices": [2, 5, 2], "values": [9.0, 1.0, 1.0]}
+    assert math.isclose(cosine_similarity(duplicated, packed), 1.0, rel_tol=1e-6)
+    assert read_sparse_dict(None, json.dumps(duplicated)) == {2: 1.0, 5: 1.0}
+    assert unpack_sparse_vector(pack_sparse_vector([2, 5, 2], [9.0, 1.0, 1.0]))[0].tolist() == [2, 5]
+
+    # So is a blob packed with the repeat before packing deduplicated: same entries, norm and index row
+    legacy_blob = (
+        PACKED_HEADER.pack(3, math.sqrt(83.0))
+        + np.asarray([2, 5, 2], dtype=INDEX_DTYPE).tobytes()
+        + np.asarray([9.0, 1.0, 1.0], dtype=VALUE_DTYPE).tobytes()
+    )
+    indices, values, norm = unpack_sparse_vector(legacy_blob)
+    assert dict(zip(indices.tolist(), values.tolist())) == {2: 1.0, 5: 1.0}
+    assert math.isclose(norm, math.sqrt(2.0), rel_tol=1e-6)
+    assert math.isclose(cosine_similarity(legacy_blob, packed), 1.0, rel_tol=1e-6)
+
+    builder = SparseMatrixBuilder(8)
+    builder.append(legacy_blob, None)
+    row = builder.build().toarray()[0]
+    assert np.allclose(row[[2, 5]], [1 / math.sqrt(2.0)] * 2) and math.isclose(row.sum(), math.sqrt(2.0), rel_tol=1e-6)
+
+
+def test_backfill_converts_json_rows(client):
+    db = TestingSessionLocal()
+    try:
+        db.add(ArticleVector(
+            article_id=1,
+            text_vector=json.dumps({"indices": [4, 7], "values": [0.6, 0.8]}),
+            tag_vector=json.dumps({"indices": [], "values": []}),
+            vector_version=1
+        ))
+        db.commit()
+
+        converted = backfill_packed_vectors(db, ArticleVector, ArticleVector.article_id, batch_size=1)
+        row = db.query(ArticleVector).filter(ArticleVector.article_id == 1).one()
+
+        assert converted == 1
+        assert row.text_vector is None
+        assert read_sparse_dict(row.text_vector_packed, row.text_vector) == {4: 0.6000000238418579, 7: 0.800000011920929}
+        assert read_sparse_dict(row.tag_vector_packed, row.tag_vector) == {}
+    finally:
+        db.close()
+
+
+def test_batch_vectorization_matches_single_articles_and_resumes(client, monkeypatch, tmp_path):
+    from app.services import article_vector_batch_service
+    from app.services.article_vector_batch_service import vectorize_all_articles, write_checkpoint
+    from app.services.article_vector_service import create_article_vector
+
+    client.post("/auth/register", json={
+        "user_email": "batch@test.com",
+        "user_name": "batch",
+        "password": "password123",
+        "confirm_password": "password123",
+        "birth_date": "2000-01-01",
+    })
+    token = client.post("/auth/login", json={"user_email": "batch@test.com", "password": "password123"}).json()["access_token"]
+
+    for title in ("Neural networks", "Sourdough bread", "Mountain hiking"):
+        client.post(
+            "/articles/",
+            json={"title": title, "content": f"{title} explained in an article long enough to pass validation.", "tag_names": ["batch"]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+    monkeypatch.setattr(article_vector_batch_service, "SessionLocal", TestingSessionLocal)
+    checkpoint = tmp_path / "vectorize.checkpoint"
+
+    db = TestingSessionLocal()
+    try:
+        create_article_vector(db, 1)
+        single = db.get(ArticleVector, 1).text_vector_packed
+
+        assert vectorize_all_articles(block_size=2, checkpoint_path=checkpoint) == 3
+        assert not checkpoint.exists()
+
+        db.expire_all()
+        rows = {row.article_id: row for row in db.query(ArticleVector).all()}
+        assert set(rows) == {1, 2, 3}
+        assert rows[1].text_vector_packed == single
+        assert rows[1].vector_version == 2 and rows[2].vector_version == 1
+
+        # A stopped run continues after its checkpoint
+        write_checkpoint(checkpoint, 2)
+        assert vectorize_all_articles(block_size=2, checkpoint_path=checkpoint) == 1
+    finally:
+        db.close()
+
+
+def test_block_keeps_vectors_written_concurrently(client, monkeypatch):
+    from app.services import article_vector_batch_service
+    from app.services.article_vector_batch_service import vectorize_article_block
+
+    worker_vector = pack_sparse_vector([0], [1.0])
+    real_article_vector_columns = article_vector_batch_service.article_vector_columns
+
+    # The vector worker stores the vectors of articles 1 (new) and 2 (edited) from newer content while the block is being transformed
+    def racing_article_vector_columns(texts, tag_texts, staged_only=False):
+        other = TestingSessionLocal()
+        try:
+            for article_id, version in ((1, 1), (2, 2)):
+                other.merge(ArticleVector(
+                    article_id=article_id,
+                    text_vector_packed=worker_vector,
+                    tag_vector_packed=pack_sparse_vector([], []),
+                    vector_version=version
+                ))
+            other.commit()
+        finally:
+            other.close()
+
+        return real_article_vector_columns(texts, tag_texts, staged_only)
+
+    def reset_vectors(db):
+        db.query(ArticleVector).delete()
+        for article_id in (2, 3):
+            db.add(ArticleVector(
+                article_id=article_id,
+                text_vector_packed=pack_sparse_vector([1], [1.0]),
+                tag_vector_packed=pack_sparse_vector([], []),
+                vector_version=1
+            ))
+        db.commit()
+
+    monkeypatch.setattr(article_vector_batch_service, "article_vector_columns", racing_article_vector_columns)
+
+    db = TestingSessionLocal()
+    try:
+        rows = [(1, "Neural networks explained"), (2, "Sourdough bread explained"), (3, "Mountain hiking explained")]
+
+        for upsert in (True, False):
+            # Dialects without an upsert go through the guarded update and insert
+            if not upsert:
+                monkeypatch.setattr(article_vector_batch_service, "_upsert_statement", lambda db, keys: None)
+
+            reset_vectors(db)
+            assert vectorize_article_block(db, rows, versions={2: 1, 3: 1}) == 3
+
+            db.expire_all()
+            stored = {row.article_id: row for row in db.query(ArticleVector).all()}
+            assert {article_id: row.vector_version for article_id, row in stored.items()} == {1: 1, 2: 2, 3: 2}
+            assert stored[1].text_vector_packed == worker_vector
+            assert stored[2].text_vector_packed == worker_vector
+            assert stored[3].text_vector_packed != pack_sparse_vector([1], [1.0])
+    finally:
+        db.close()
+
+
+def test_new_model_version_is_staged_then_promoted_while_the_old_index_serves(client, monkeypatch, tmp_path):
+    import shutil
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from app.ml import model_store
+    from app.services import article_vector_batch_service
+    from app.services.article_index_service import get_article_index, invalidate_article_index
+    from app.services.article_vector_batch_service import vectorize_all_articles
+    from app.services.model_rollout_service import stage_model_version, promote_model_version
+
+    for file_name in (model_store.TEXT_MODEL_FILE, model_store.TAG_MODEL_FILE):
+        shutil.copy(model_store.MODEL_DIR / file_name, tmp_path / file_name)
+    monkeypatch.setattr(model_store, "MODEL_DIR", tmp_path)
+    monkeypatch.setattr(article_vector_batch_service, "SessionLocal", TestingSessionLocal)
+    model_store.reset_model_store()
+
+    client.post("/auth/register", json={
+        "user_email": "rollout@test.com",
+        "user_name": "rollout",
+        "password": "password123",
+        "confirm_password": "password123",
+        "birth_date": "2000-01-01",
+    })
+    token = client.post("/auth/login", json={"user_email": "rollout@test.com", "password": "password123"}).json()["access_token"]
+
+    for title in ("Neural networks", "Sourdough bread"):
+        client.post(
+            "/articles/",
+            json={"title": title, "content": f"{title} explained in an article long enough to pass validation.", "tag_names": ["rollout"]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+    db = TestingSessionLocal()
+    try:
+        vectorize_all_articles()
+        assert get_article_index(db).model_version == model_store.LEGACY_VERSION
+
+        text_vectorizer = TfidfVectorizer().fit(["neural networks explained", "sourdough bread explained"])
+        model_store.publish_model_version("v2", text_vectorizer, TfidfVectorizer().fit(["rollout"]))
+        assert stage_model_version("v2") == 2
+
+        # The served vectors and the index stay on the old version until the promotion
+        invalidate_article_index()
+        db.expire_all()
+        assert get_article_index(db).model_version == model_store.LEGACY_VERSION
+        assert {row.staged_model_version for row in db.query(ArticleVector).all()} == {"v2"}
+
+        assert promote_model_version(db, "v2") == 2
+        assert model_store.read_manifest()["active"] == "v2"
+
+        db.expire_all()
+        index = get_article_index(db)
+        assert index.model_version == "v2"
+        assert index.text_matrix.shape[1] == len(text_vectorizer.vocabulary_)
+        assert {row.staged_model_version for row in db.query(ArticleVector).all()} == {None}
+
+        # Query vectors come from the version the index serves
+        client.post("/auth/register", json={
+            "user_email": "reader@test.com",
+            "user_name": "reader",
+            "password": "password123",
+            "confirm_password": "password123",
+            "birth_date": "2000-01-01",
+        })
+        reader = client.post("/auth/login", json={"user_email": "reader@test.com", "password": "password123"}).json()["access_token"]
+
+        response = client.get("/search", params={"q": "sourdough", "mode": "semantic"}, headers={"Authorization": f"Bearer {reader}"})
+        assert response.json()["articles"][0]["title"] == "Sourdough bread"
+    finally:
+        db.close()
@@ -1,4 +1,5 @@
 import { protectRoute } from "./auth_guard.js";
+import { attachSearchSuggestions } from "./search_suggest.js";
 // console.log("HOME SCRIPT EXECUTED", Date.now());
 
 
@@ -151,6 +152,7 @@ document.addEventListener("DOMContentLoaded", async () => {
     const nextButton = document.getElementById("next-page-btn");
     const logoutButton = document.getElementById("dropdown-logout-desktop");
     const searchForm = document.getElementById("nav-search-form-desktop");
+    const suggestionTarget = attachSearchSuggestions(document.getElementById("navbar-search-input-desktop"));
 
 
     // Both functions are responsible for changing the current page number in the session storage
@@ -186,6 +188,12 @@ document.addEventListener("DOMContentLoaded", async () => {
 
         if (!query) return;
 
+        const target = suggestionTarget();
+        if (target) {
+            window.location.href = target;
+            return;
+        }
+
         window.location.href = `../pages/Search_article.html?q=${encodeURIComponent(query)}`;
     });
 
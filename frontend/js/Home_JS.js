@@ -1,4 +1,5 @@
 import { protectRoute } from "./auth_guard.js";
+import { attachSearchSuggestions } from "./search_suggest.js";
 // console.log("HOME SCRIPT EXECUTED", Date.now());
 
 
@@ -197,6 +198,8 @@ document.addEventListener("DOMContentLoaded", async () => {
     const logoutButtonMobile = document.getElementById("logout-mobile");
     const searchForm = document.getElementById("nav-search-form-desktop");
     const searchFormMobile = document.getElementById("nav-search-form-mobile");
+    const suggestionTarget = attachSearchSuggestions(document.getElementById("navbar-search-input-desktop"));
+    const suggestionTargetMobile = attachSearchSuggestions(document.getElementById("navbar-search-input-mobile"));
 
 
     // Both functions are responsible for changing the current page number in the session storage
@@ -238,6 +241,12 @@ document.addEventListener("DOMContentLoaded", async () => {
 
         if (!query) return;
 
+        const target = suggestionTarget();
+        if (target) {
+            window.location.href = target;
+            return;
+        }
+
         window.location.href = `../pages/Search_article.html?q=${encodeURIComponent(query)}`;
     });
 
@@ -249,6 +258,12 @@ document.addEventListener("DOMContentLoaded", async () => {
 
         if (!query) return;
 
+        const target = suggestionTargetMobile();
+        if (target) {
+            window.location.href = target;
+            return;
+        }
+
         window.location.href = `../pages/Search_article.html?q=${encodeURIComponent(query)}`;
     });
 
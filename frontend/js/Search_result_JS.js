@@ -7,6 +7,8 @@ const AUTH_TOKEN = localStorage.getItem("auth_token");
 
 let allArticles = [];
 let currentSort = "newest";
+let currentQuery = null;
+let nextCursor = null;
 
 document.addEventListener("DOMContentLoaded", async () => {
     const isValid = await protectRoute();
@@ -30,22 +32,25 @@ document.addEventListener("DOMContentLoaded", async () => {
         titleElement.appendChild(span);
     }
 
+    currentQuery = query;
     fetchSearchResults(query);
 });
 
 
-// Main function that requests the data from the backend
-async function fetchSearchResults(query) {
+// Main function that requests the data from the backend, with a cursor it requests the next page of the same results and adds it to the ones already shown
+async function fetchSearchResults(query, cursor = null) {
     if (!AUTH_TOKEN) {
         console.error("Auth token missing");
         return;
     }
 
-    showLoading();
+    if (!cursor) showLoading();
+
+    const pageParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
 
     try {
         const response = await fetch(
-            `${API_BASE_URL}/search?q=${encodeURIComponent(query)}`,
+            `${API_BASE_URL}/search?q=${encodeURIComponent(query)}${pageParam}`,
             {
                 method: "GET",
                 headers: {
@@ -60,6 +65,15 @@ async function fetchSearchResults(query) {
         }
 
         const data = await response.json();
+        nextCursor = data.next_cursor || null;
+        document.getElementById("load-more").style.display = nextCursor ? "block" : "none";
+
+        if (cursor) {
+            allArticles = allArticles.concat(data.articles || []);
+            sortArticles(currentSort);
+            return;
+        }
+
         allArticles = data.articles || [];
         renderUsers(data.users || []);
 
@@ -73,6 +87,10 @@ async function fetchSearchResults(query) {
     }
 }
 
+function loadMoreResults() {
+    if (nextCursor) fetchSearchResults(currentQuery, nextCursor);
+}
+
 function renderUsers(users) {
     const container = document.getElementById("users-container");
 
@@ -216,6 +234,7 @@ window.sortArticles = sortArticles;
 window.escapeHtml = escapeHtml;
 window.renderArticles = renderArticles;
 window.fetchSearchResults = fetchSearchResults;
+window.loadMoreResults = loadMoreResults;
 window.showError = showError;
 window.showLoading = showLoading;
 window.hideLoading = hideLoading;
\ No newline at end of file
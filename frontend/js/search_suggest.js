@@ -0,0 +1,79 @@
+// Autocomplete for the navbar search inputs. Every keystroke asks /search/suggest for matching article titles, tags and writers and shows them in a datalist, picking a suggestion opens the article, tag or writer directly instead of running a full search
+const API_BASE_URL = "http://127.0.0.1:8000";
+const SUGGEST_DELAY_MS = 80;
+
+// Page that opens for each kind of suggestion
+const SUGGESTION_PAGES = {
+    article: id => `../pages/view_article.html?article_id=${id}`,
+    tag: id => `../pages/TrendingTag.html?tag_id=${id}`,
+    user: id => `../pages/trendingAuthor.html?author_id=${id}`
+};
+
+const SUGGESTION_LABELS = {
+    article: "Article",
+    tag: "Tag",
+    user: "Writer"
+};
+
+export function attachSearchSuggestions(input) {
+    if (!input) return () => null;
+
+    const list = document.createElement("datalist");
+    list.id = `${input.id}-suggestions`;
+    input.after(list);
+    input.setAttribute("list", list.id);
+    input.setAttribute("autocomplete", "off");
+
+    let suggestions = [];
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+
+        const query = input.value.trim();
+        if (!query) {
+            list.innerHTML = "";
+            suggestions = [];
+            return;
+        }
+
+        // Waits for a short pause in typing and drops the answer of any older request
+        timer = setTimeout(async () => {
+            if (controller) controller.abort();
+            controller = new AbortController();
+
+            try {
+                const response = await fetch(
+                    `${API_BASE_URL}/search/suggest?q=${encodeURIComponent(query)}`,
+                    {
+                        headers: { "Authorization": `Bearer ${localStorage.getItem("auth_token")}` },
+                        signal: controller.signal
+                    }
+                );
+
+                if (!response.ok) return;
+
+                suggestions = (await response.json()).suggestions || [];
+                list.innerHTML = "";
+
+                for (const suggestion of suggestions) {
+                    const option = document.createElement("option");
+                    option.value = suggestion.text;
+                    option.label = SUGGESTION_LABELS[suggestion.kind] || "";
+                    list.appendChild(option);
+                }
+            } catch (error) {
+                if (error.name !== "AbortError") {
+                    console.error("Search suggestions failed:", error);
+                }
+            }
+        }, SUGGEST_DELAY_MS);
+    });
+
+    // Returns the page of the suggestion the user picked, null for a typed query
+    return function suggestionTarget() {
+        const picked = suggestions.find(s => s.text === input.value.trim());
+        return picked ? SUGGESTION_PAGES[picked.kind](picked.id) : null;
+    };
+}